@@ -17,43 +17,49 @@
 import time
 
 from . import utils
+from .metrics import RingBuffer
 
 
 class ActivityMonitor:
     """ZODB load/store activity monitor
 
-    This simple implementation just keeps a small log in memory
-    and iterates over the log when getActivityAnalysis() is called.
-
-    It assumes that log entries are added in chronological sequence.
+    This simple implementation keeps the numbers of loads, stores and
+    connections in a ring buffer of time buckets, so that its memory
+    use and the cost of getActivityAnalysis() don't depend on how busy
+    the database is.  Activity is only known to the precision of a
+    bucket, which is the history length divided by the number of
+    buckets.
     """
 
-    def __init__(self, history_length=3600):
+    def __init__(self, history_length=3600, buckets=600):
         self.history_length = history_length  # Number of seconds
-        self.log = []                     # [(time, loads, stores)]
+        self.buckets = buckets
+        self.ring = RingBuffer(history_length, buckets, 3)
         self.trim_lock = utils.Lock()
 
+    @property
+    def log(self):
+        """The (time, loads, stores) of the buckets with activity"""
+        with self.trim_lock:
+            return [(t, loads, stores)
+                    for t, (loads, stores, _) in self.ring.buckets()]
+
     def closedConnection(self, conn):
-        log = self.log
-        now = time.time()
         loads, stores = conn.getTransferCounts(1)
-        log.append((now, loads, stores))
-        self.trim(now)
+        with self.trim_lock:
+            self.ring.add((loads, stores, 1))
 
     def trim(self, now):
-        with self.trim_lock:
-            log = self.log
-            cutoff = now - self.history_length
-            n = 0
-            loglen = len(log)
-            while n < loglen and log[n][0] < cutoff:
-                n = n + 1
-            if n:
-                del log[:n]
+        # Old buckets are reused as time passes.
+        pass
 
     def setHistoryLength(self, history_length):
-        self.history_length = history_length
-        self.trim(time.time())
+        with self.trim_lock:
+            ring = RingBuffer(history_length, self.buckets, 3)
+            for t, sums in self.ring.buckets():
+                ring.add(sums, t)
+            self.ring = ring
+            self.history_length = history_length
 
     def getHistoryLength(self):
         return self.history_length
@@ -74,36 +80,17 @@ class ActivityMonitor:
                 'connections': 0,
             })
 
-        div = res[0]
-        div_end = div['end']
-        div_index = 0
-        connections = 0
-        total_loads = 0
-        total_stores = 0
-        for t, loads, stores in self.log:
-            if t < start:
-                # We could use a binary search to find the start.
-                continue
-            elif t > end:
-                # We could use a binary search to find the end also.
-                break
-            while t > div_end:
-                div['loads'] = total_loads
-                div['stores'] = total_stores
-                div['connections'] = connections
-                total_loads = 0
-                total_stores = 0
-                connections = 0
-                div_index = div_index + 1
-                if div_index < divisions:
-                    div = res[div_index]
-                    div_end = div['end']
-            connections = connections + 1
-            total_loads = total_loads + loads
-            total_stores = total_stores + stores
-
-        div['stores'] = div['stores'] + total_stores
-        div['loads'] = div['loads'] + total_loads
-        div['connections'] = div['connections'] + connections
+        with self.trim_lock:
+            buckets = self.ring.buckets(start, end)
+        for t, (loads, stores, connections) in buckets:
+            if end > start:
+                n = int((t - start) * divisions / (end - start))
+                n = min(max(n, 0), divisions - 1)
+            else:
+                n = divisions - 1
+            div = res[n]
+            div['loads'] += loads
+            div['stores'] += stores
+            div['connections'] += connections
 
         return res
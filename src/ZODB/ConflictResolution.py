@@ -13,6 +13,9 @@
 ##############################################################################
 
 import logging
+import threading
+import time
+from collections import OrderedDict
 from io import BytesIO
 from pickle import PicklingError
 
@@ -241,8 +244,108 @@ def persistent_id(object):
 _unresolvable = {}
 
 
+class RecordCache:
+    """A bounded cache of (oid, serial) -> record data
+
+    Hot objects, like BTree buckets and ``Length`` counters, conflict
+    over and over, and every resolution needs the old and committed
+    revisions of the object.  The data of a given revision never
+    changes, so we keep the most recently used ones around rather than
+    asking the storage to find them again.
+    """
+
+    def __init__(self, size=1000):
+        self.size = size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, oid, serial):
+        key = oid, serial
+        with self._lock:
+            data = self._data.get(key)
+            if data is not None:
+                self._data.move_to_end(key)
+            return data
+
+    def put(self, oid, serial, data):
+        with self._lock:
+            self._data[oid, serial] = data
+            self._data.move_to_end((oid, serial))
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class ConflictResolutionStats:
+    """Counters describing the conflict resolution done by a storage
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.attempts = self.resolved = 0
+        self.seconds = 0.0
+
+    def record(self, resolved, seconds):
+        with self._lock:
+            self.attempts += 1
+            if resolved:
+                self.resolved += 1
+            self.seconds += seconds
+
+    def __repr__(self):
+        return "<%s attempts=%s resolved=%s seconds=%.6f>" % (
+            self.__class__.__name__,
+            self.attempts, self.resolved, self.seconds)
+
+
+def _crs_record_cache(storage):
+    try:
+        return storage._crs_record_cache
+    except AttributeError:
+        cache = storage._crs_record_cache = RecordCache()
+        return cache
+
+
+def conflict_resolution_stats(storage):
+    """Return the :class:`ConflictResolutionStats` for a storage
+    """
+    try:
+        return storage._crs_stats
+    except AttributeError:
+        stats = storage._crs_stats = ConflictResolutionStats()
+        return stats
+
+
+def _loadSerial(self, cache, oid, serial):
+    data = cache.get(oid, serial)
+    if data is None:
+        data = self.loadSerial(oid, serial)
+        cache.put(oid, serial, data)
+    return data
+
+
 def tryToResolveConflict(self, oid, committedSerial, oldSerial, newpickle,
                          committedData=b''):
+    stats = conflict_resolution_stats(self)
+    start = time.perf_counter()
+    try:
+        result = _tryToResolveConflict(
+            self, oid, committedSerial, oldSerial, newpickle, committedData)
+    except ConflictError:
+        stats.record(False, time.perf_counter() - start)
+        raise
+    stats.record(True, time.perf_counter() - start)
+    return result
+
+
+def _tryToResolveConflict(self, oid, committedSerial, oldSerial, newpickle,
+                          committedData):
     # class_tuple, old, committed, newstate = ('',''), 0, 0, 0
     klass = 'n/a'
     try:
@@ -272,9 +375,10 @@ def tryToResolveConflict(self, oid, committedSerial, oldSerial, newpickle,
             _unresolvable[klass] = 1
             raise ConflictError
 
-        oldData = self.loadSerial(oid, oldSerial)
+        cache = _crs_record_cache(self)
+        oldData = _loadSerial(self, cache, oid, oldSerial)
         if not committedData:
-            committedData = self.loadSerial(oid, committedSerial)
+            committedData = _loadSerial(self, cache, oid, committedSerial)
 
         newstate = unpickler.load()
         old = state(self, oid, oldSerial, prfactory, oldData)
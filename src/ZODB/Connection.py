@@ -34,6 +34,7 @@ from ZODB import POSException
 from ZODB import utils
 from ZODB.blob import SAVEPOINT_SUFFIX
 from ZODB.blob import Blob
+from ZODB.blob import is_blob_record
 from ZODB.blob import remove_committed_dir
 from ZODB.blob import rename_or_copy_blob
 from ZODB.ExportImport import ExportImport
@@ -227,21 +228,29 @@ class Connection(ExportImport):
         # registered with the transaction.
         self._added[oid] = obj
 
+    @property
+    def _metrics(self):
+        # The database's ZODB.metrics.Metrics, if any
+        return getattr(self._db, '_metrics', None)
+
     def get(self, oid):
         """Return the persistent object with oid 'oid'."""
         if self.opened is None:
             raise ConnectionStateError("The database connection is closed")
 
+        metrics = self._metrics
         obj = self._cache.get(oid, None)
+        if obj is None:
+            obj = self._added.get(oid, None)
+        if obj is None:
+            obj = self._pre_cache.get(oid, None)
         if obj is not None:
-            return obj
-        obj = self._added.get(oid, None)
-        if obj is not None:
-            return obj
-        obj = self._pre_cache.get(oid, None)
-        if obj is not None:
+            if metrics is not None:
+                metrics.increment('cache_hits')
             return obj
 
+        if metrics is not None:
+            metrics.increment('cache_misses')
         p, _ = self._storage.load(oid)
         obj = self._reader.getGhost(p)
 
@@ -306,6 +315,9 @@ class Connection(ExportImport):
         am = self._db._activity_monitor
         if am is not None:
             am.closedConnection(self)
+        metrics = self._metrics
+        if metrics is not None:
+            metrics.increment('connections_closed')
 
         # Drop transaction manager to release resources and help prevent errors
         self.transaction_manager = None
@@ -479,7 +491,20 @@ class Connection(ExportImport):
     def commit(self, transaction):
         """Commit changes to an object"""
         transaction = transaction.data(self)
+        metrics = self._metrics
+        if metrics is not None:
+            start = time.perf_counter()
+            try:
+                self._commit_phase(transaction)
+            except ConflictError:
+                metrics.increment('conflicts')
+                raise
+            finally:
+                metrics.observe('commit_seconds', time.perf_counter() - start)
+        else:
+            self._commit_phase(transaction)
 
+    def _commit_phase(self, transaction):
         if self._savepoint_storage is not None:
 
             # We first checkpoint the current changes to the savepoint
@@ -593,9 +618,20 @@ class Connection(ExportImport):
                 # to be reattached "cleanly"
                 obj._p_invalidate()
             else:
-                s = self._storage.store(oid, serial, p, '', transaction)
+                metrics = self._metrics
+                if metrics is not None:
+                    start = time.perf_counter()
+                    s = self._storage.store(oid, serial, p, '', transaction)
+                    metrics.observe('store_seconds',
+                                    time.perf_counter() - start)
+                else:
+                    s = self._storage.store(oid, serial, p, '', transaction)
 
             self._store_count += 1
+            metrics = self._metrics
+            if metrics is not None:
+                metrics.increment('stores')
+                metrics.increment('bytes_written', len(p))
             # Put the object in the cache before handling the
             # response, just in case the response contains the
             # serial number for a newly created object
@@ -681,12 +717,20 @@ class Connection(ExportImport):
 
         transaction = transaction.data(self)
 
+        metrics = self._metrics
+        if metrics is not None:
+            start = time.perf_counter()
         try:
             s = vote(transaction)
-        except ReadConflictError as v:
-            if v.oid:
+        except ConflictError as v:
+            if isinstance(v, ReadConflictError) and v.oid:
                 self._cache.invalidate(v.oid)
+            if metrics is not None:
+                metrics.increment('conflicts')
             raise
+        finally:
+            if metrics is not None:
+                metrics.observe('vote_seconds', time.perf_counter() - start)
         if s:
             # Resolved conflicts.
             for oid in s:
@@ -699,7 +743,13 @@ class Connection(ExportImport):
         """
         transaction = transaction.data(self)
 
-        serial = self._storage.tpc_finish(transaction)
+        metrics = self._metrics
+        if metrics is not None:
+            start = time.perf_counter()
+            serial = self._storage.tpc_finish(transaction)
+            metrics.observe('finish_seconds', time.perf_counter() - start)
+        else:
+            serial = self._storage.tpc_finish(transaction)
         assert type(serial) is bytes, repr(serial)
         for oid_iterator in self._modified, self._creating:
             for oid in oid_iterator:
@@ -750,7 +800,15 @@ class Connection(ExportImport):
             self.newTransaction(transaction, False)
 
         # Now is a good time to collect some garbage.
-        self._cache.incrgc()
+        metrics = self._metrics
+        if metrics is not None:
+            before = self._cache.cache_non_ghost_count
+            self._cache.incrgc()
+            evicted = before - self._cache.cache_non_ghost_count
+            if evicted > 0:
+                metrics.increment('cache_evictions', evicted)
+        else:
+            self._cache.incrgc()
 
     # Transaction-manager synchronization -- ISynchronizer
     ##########################################################################
@@ -781,7 +839,15 @@ class Connection(ExportImport):
                 raise
 
         try:
-            p, serial = self._storage.load(oid)
+            metrics = self._metrics
+            if metrics is not None:
+                start = time.perf_counter()
+                p, serial = self._storage.load(oid)
+                metrics.observe('load_seconds', time.perf_counter() - start)
+                metrics.increment('loads')
+                metrics.increment('bytes_read', len(p))
+            else:
+                p, serial = self._storage.load(oid)
 
             self._load_count += 1
 
@@ -934,6 +1000,7 @@ class Connection(ExportImport):
         self._cache = cache = PickleCache(self, cache_size, cache_size_bytes)
         if getattr(self, '_reader', None) is not None:
             self._reader._cache = cache
+            self._reader.clearClassCache()
 
     def _release_resources(self):
         for c in self.connections.values():
@@ -1028,7 +1095,7 @@ class Connection(ExportImport):
                     self._cache.update_object_size_estimation(
                         obj._p_oid, len(data))
                     obj._p_estimated_size = len(data)
-                if isinstance(self._reader.getGhost(data), Blob):
+                if is_blob_record(data):
                     blobfilename = src.loadBlob(oid, serial)
                     self._storage.storeBlob(
                         oid, serial, data, blobfilename,
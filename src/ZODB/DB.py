@@ -16,6 +16,7 @@
 
 import datetime
 import logging
+import os
 import sys
 import time
 import warnings
@@ -40,6 +41,9 @@ from ZODB.utils import z64
 
 logger = logging.getLogger('ZODB.DB')
 
+# Hot set files are this, followed by 8-byte object ids.
+HOT_SET_MAGIC = b'ZHS1'
+
 
 class AbstractConnectionPool:
     """Manage a pool of connections.
@@ -341,7 +345,7 @@ class DB:
     """
 
     klass = Connection  # Class to use for connections
-    _activity_monitor = next = previous = None
+    _activity_monitor = _metrics = next = previous = None
 
     #: Database storage, implementing :interface:`~ZODB.interfaces.IStorage`
     storage = valuedoc.ValueDoc('storage object')
@@ -361,6 +365,10 @@ class DB:
                  xrefs=True,
                  large_record_size=1 << 24,
                  class_factory=None,
+                 total_cache_size_bytes=0,
+                 hot_set_file=None,
+                 warm_up_time=None,
+                 historical_record_cache_size_bytes=0,
                  **storage_args):
         """Create an object database.
 
@@ -415,6 +423,24 @@ class DB:
             ``DB.classFactory`` method is used; it wraps
              :func:`ZODB.broken.find_global` to provide this
              three-argument interface.
+        :param int total_cache_size_bytes: target total memory usage of
+             non-ghost objects in the caches of all connections, open or
+             pooled, historical or not.  When it is exceeded, the caches
+             of pooled connections are minimized, least recently used
+             first, and the caches of open connections share what's
+             left.  0 means no limit.
+        :param str hot_set_file: path of a file in which the ids of the
+             objects most used by connections are saved when the
+             database is closed.  If the file exists when the database
+             is opened, these objects are loaded in the cache of the
+             connection returned by the next call to :meth:`open`.
+        :param seconds warm_up_time: Maximum time spent loading the
+             objects of the hot set file.  None means no limit.
+        :param int historical_record_cache_size_bytes: size of a cache of
+             object records shared by all historical connections.
+             A record loaded by a historical connection is reused by
+             the others that look at the database at a time when the
+             record was current.  0, the default, disables the cache.
         :param storage_args: Extra keywork arguments passed to a
              storage constructor if a path name or None is passed as
              the storage argument.
@@ -431,6 +457,8 @@ class DB:
         self._cache_size_bytes = cache_size_bytes
         self._historical_cache_size = historical_cache_size
         self._historical_cache_size_bytes = historical_cache_size_bytes
+        self._total_cache_size_bytes = total_cache_size_bytes
+        self._hot_set_file = hot_set_file
 
         # Setup storage
         if isinstance(storage, str):
@@ -447,8 +475,12 @@ class DB:
         if IMVCCStorage.providedBy(storage):
             self._mvcc_storage = storage
         else:
+            from .mvccadapter import HistoricalRecordCache
             from .mvccadapter import MVCCAdapter
             self._mvcc_storage = MVCCAdapter(storage)
+            if historical_record_cache_size_bytes:
+                self._mvcc_storage.historical_cache = HistoricalRecordCache(
+                    historical_record_cache_size_bytes)
 
         self.references = ZODB.serialize.referencesf
 
@@ -485,6 +517,9 @@ class DB:
                 root = PersistentMapping()
                 conn._add(root, z64)
 
+        if hot_set_file and os.path.exists(hot_set_file):
+            self.warmUp(hot_set_file, warm_up_time)
+
     @property
     def _storage(self):      # Backward compatibility
         return self.storage
@@ -505,6 +540,52 @@ class DB:
             else:
                 self.pool.repush(connection)
 
+            if self._total_cache_size_bytes:
+                self._applyCacheBudget()
+
+    def _applyCacheBudget(self):
+        """Keep the caches of all connections within the total budget.
+
+        The caches of pooled connections are minimized, least recently
+        used first, until the budget is met.  The byte targets of the
+        caches of open connections are then set to their share of what
+        the pooled connections don't use.  Open connections' caches
+        shrink to their targets at their next transaction boundary.
+
+        Must be called with the lock held.
+        """
+        budget = self._total_cache_size_bytes
+        opened = []
+        pooled = []
+        total = 0
+        for pool in [self.pool] + list(self.historical_pool.pools.values()):
+            for c in pool.all:
+                total += c._cache.total_estimated_size
+                if c.opened:
+                    opened.append(c)
+            pooled.extend(pool.available)
+
+        pooled.sort(key=lambda item: item[0])
+        for _, c in pooled:
+            if total <= budget:
+                break
+            size = c._cache.total_estimated_size
+            if size:
+                c._cache.minimize()
+                total -= size - c._cache.total_estimated_size
+
+        if opened:
+            idle = sum(c._cache.total_estimated_size for _, c in pooled)
+            share = max((budget - idle) // len(opened), 1)
+            for c in opened:
+                if c.before:
+                    target = self._historical_cache_size_bytes
+                else:
+                    target = self._cache_size_bytes
+                if not target or target > share:
+                    target = share
+                c._cache.cache_size_bytes = target
+
     def _connectionMap(self, f):
         """Call f(c) for all connections c in all pools, live and historical.
         """
@@ -647,6 +728,13 @@ class DB:
         """
         self.close = noop
 
+        if self._hot_set_file:
+            try:
+                self.saveHotSet()
+            except Exception:
+                logger.exception("Couldn't save the hot set to %r",
+                                 self._hot_set_file)
+
         @self._connectionMap
         def _(conn):
             if conn.transaction_manager is not None:
@@ -666,6 +754,90 @@ class DB:
         self.pool.clear()
         self.historical_pool.clear()
 
+    def hotSet(self, size=None):
+        """Return the ids of the objects most used by connections.
+
+        Objects loaded in the caches of more connections come first,
+        then the most recently used.  At most size ids are returned,
+        which defaults to the configured cache size.  Historical
+        connections are ignored.
+        """
+        if size is None:
+            size = self._cache_size
+        ranks = {}  # oid -> (-number of caches, best recency rank)
+        with self._lock:
+            for c in self.pool:
+                items = c._cache.lru_items()
+                for rank, (oid, _) in enumerate(reversed(items)):
+                    n, best = ranks.get(oid, (0, rank))
+                    ranks[oid] = (n - 1, min(best, rank))
+        return sorted(ranks, key=lambda oid: ranks[oid] + (oid,))[:size]
+
+    def saveHotSet(self, file_name=None):
+        """Save the result of :meth:`hotSet` to a file
+
+        The file defaults to the database's hot set file.  This is
+        called when the database is closed, and can also be called
+        periodically, so that a crashed process leaves a recent file
+        behind.
+        """
+        file_name = file_name or self._hot_set_file
+        oids = self.hotSet()
+        tmp = file_name + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(HOT_SET_MAGIC)
+            f.write(b''.join(oids))
+        os.replace(tmp, file_name)
+        return len(oids)
+
+    def warmUp(self, file_name=None, seconds=None):
+        """Load the objects listed in a hot set file
+
+        The objects are loaded in the cache of a connection, which is
+        then returned to the pool, so that the next call to :meth:`open`
+        gets it.  Loading stops when the connection's cache is full or
+        after the given number of seconds.  For a FileStorage, objects
+        are loaded in the order of their current revisions in the file.
+
+        Return the number of objects loaded.
+        """
+        file_name = file_name or self._hot_set_file
+        with open(file_name, 'rb') as f:
+            data = f.read()
+        if data[:4] != HOT_SET_MAGIC:
+            logger.warning("%r isn't a hot set file", file_name)
+            return 0
+        oids = [data[i:i + 8] for i in range(4, len(data) - 7, 8)]
+        from ZODB.FileStorage import FileStorage
+        if isinstance(self.storage, FileStorage):
+            index = self.storage._index
+            oids.sort(key=lambda oid: index.get(oid, 0))
+
+        deadline = None if seconds is None else time.time() + seconds
+        loaded = 0
+        tm = transaction.TransactionManager()
+        conn = self.open(tm)
+        try:
+            cache = conn._cache
+            conn.prefetch(oids)
+            for oid in oids:
+                if cache.cache_non_ghost_count >= cache.cache_size or (
+                        cache.cache_size_bytes and
+                        cache.total_estimated_size >= cache.cache_size_bytes):
+                    break
+                if deadline is not None and time.time() >= deadline:
+                    break
+                try:
+                    conn.get(oid)._p_activate()
+                except KeyError:
+                    continue  # The object is gone.
+                loaded += 1
+        finally:
+            tm.abort()
+            conn.close()
+        logger.info("Loaded %s objects from %r", loaded, file_name)
+        return loaded
+
     def getCacheSize(self):
         """Get the configured cache size (objects).
         """
@@ -706,6 +878,11 @@ class DB:
         """
         return self._historical_cache_size_bytes
 
+    def getTotalCacheSizeBytes(self):
+        """Get the configured total size in bytes of all caches.
+        """
+        return self._total_cache_size_bytes
+
     def getHistoricalPoolSize(self):
         """Get the configured historical pool size
         """
@@ -789,6 +966,9 @@ class DB:
             self.historical_pool.availableGC()
 
         result.open(transaction_manager)
+        if self._total_cache_size_bytes:
+            with self._lock:
+                self._applyCacheBudget()
         return result
 
     def connectionDebugInfo(self):
@@ -853,10 +1033,30 @@ class DB:
         except:  # noqa: E722 do not use bare 'except'
             logger.exception("packing")
             raise
+        historical_cache = getattr(self._mvcc_storage, 'historical_cache',
+                                   None)
+        if historical_cache is not None:
+            # Don't serve records that pack removed.
+            historical_cache.clear()
 
     def setActivityMonitor(self, am):
         self._activity_monitor = am
 
+    def getMetrics(self):
+        return self._metrics
+
+    def setMetrics(self, metrics):
+        """Record metrics in a :class:`ZODB.metrics.Metrics` object
+
+        Connections record loads, stores, commits and cache activity.
+        If the storage has a ``setMetrics`` method, it is passed the
+        metrics too.  Pass None to stop recording.
+        """
+        self._metrics = metrics
+        set_storage_metrics = getattr(self.storage, 'setMetrics', None)
+        if set_storage_metrics is not None:
+            set_storage_metrics(metrics)
+
     def classFactory(self, connection, modulename, globalname):
         return find_global(modulename, globalname)
 
@@ -875,6 +1075,8 @@ class DB:
             self._cache_size_bytes = size
             for c in self.pool:
                 c._cache.cache_size_bytes = size
+            if self._total_cache_size_bytes:
+                self._applyCacheBudget()
 
     def setHistoricalCacheSize(self, size):
         """Reconfigure the historical cache size (non-ghost object count)
@@ -891,6 +1093,22 @@ class DB:
             self._historical_cache_size_bytes = size
             for c in self.historical_pool:
                 c._cache.cache_size_bytes = size
+            if self._total_cache_size_bytes:
+                self._applyCacheBudget()
+
+    def setTotalCacheSizeBytes(self, size):
+        """Reconfigure the total size in bytes of all caches
+        """
+        with self._lock:
+            self._total_cache_size_bytes = size
+            if size:
+                self._applyCacheBudget()
+            else:
+                for c in self.pool:
+                    c._cache.cache_size_bytes = self._cache_size_bytes
+                for c in self.historical_pool:
+                    c._cache.cache_size_bytes = (
+                        self._historical_cache_size_bytes)
 
     def setPoolSize(self, size):
         """Reconfigure the connection pool size
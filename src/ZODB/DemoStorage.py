@@ -23,6 +23,7 @@ The base storage must not change.
 import os
 import random
 import tempfile
+import threading
 import weakref
 
 import zope.interface
@@ -120,6 +121,8 @@ class DemoStorage(ConflictResolvingStorage):
 
         self._issued_oids = set()
         self._stored_oids = set()
+        self._stored_data = {}
+        self._undone_oids = set()
         self._resolved = []
 
         self._commit_lock = ZODB.utils.Lock()
@@ -170,8 +173,9 @@ class DemoStorage(ConflictResolvingStorage):
 
         supportsUndo = getattr(changes, 'supportsUndo', None)
         if supportsUndo is not None and supportsUndo():
-            for meth in ('supportsUndo', 'undo', 'undoLog', 'undoInfo'):
+            for meth in ('supportsUndo', 'undoLog', 'undoInfo'):
                 setattr(self, meth, getattr(changes, meth))
+            self.undo = self._undo
             zope.interface.alsoProvides(self, ZODB.interfaces.IStorageUndoable)
 
         lastInvalidations = getattr(changes, 'lastInvalidations', None)
@@ -182,7 +186,47 @@ class DemoStorage(ConflictResolvingStorage):
         return self.__name__
     __repr__ = getName
 
+    # oid -> id of the first transaction in the changes that stored the
+    # object.  None if not built yet and False if the changes can't be
+    # iterated.
+    _changes_index = None
+
+    def _first_change(self, oid):
+        """Return the first tid of an oid in the changes
+
+        Return None if the oid isn't in the changes, and False if this
+        isn't known because the changes can't be indexed.
+        """
+        index = self._changes_index
+        if index is None:
+            index = self._index_changes()
+        if index is False:
+            return False
+        return index.get(oid)
+
+    def _index_changes(self):
+        with self._lock:
+            index = {}
+            try:
+                it = self.changes.iterator()
+            except (AttributeError, NotImplementedError,
+                    ZODB.POSException.Unsupported):
+                index = False
+            else:
+                try:
+                    for txn in it:
+                        for record in txn:
+                            index.setdefault(record.oid, txn.tid)
+                finally:
+                    close = getattr(it, 'close', None)
+                    if close is not None:
+                        close()
+            self._changes_index = index
+        return index
+
     def getTid(self, oid):
+        if self._first_change(oid) is None:
+            return self.base.getTid(oid)
         try:
             return self.changes.getTid(oid)
         except ZODB.POSException.POSKeyError:
@@ -218,7 +262,68 @@ class DemoStorage(ConflictResolvingStorage):
     # still want load for old clients (e.g. zeo servers)
     load = load_current
 
+    # A _CurrentRecords shared by the storages of a push/pop stack, and
+    # the oids of the records this storage added to it.
+    _current = None
+    _touched = None
+    # The _CurrentRecords that may hold records of this storage.
+    _currents = None
+
     def loadBefore(self, oid, tid):
+        current = self._current
+        if current is None or current.owner is not self:
+            return self._loadBefore(oid, tid)
+
+        record = current.records.get(oid)
+        if record is not None and record[1] < tid:
+            return record + (None,)
+        generation = current.generation
+        result = self._loadBefore(oid, tid)
+        if result and result[-1] is None:
+            self._add_current(oid, result[:2], generation)
+        return result
+
+    def _add_current(self, oid, record, generation):
+        # Remember the current record, and which storages of the stack
+        # must forget it when popped: the one whose changes hold it.
+        current = self._current
+        with self._lock:
+            layer = self
+            while getattr(layer, '_current', None) is current:
+                first = layer._first_change(oid)
+                if first is not None:
+                    layer._touched.add(oid)
+                    if first is not False:
+                        break
+                layer = layer.base
+            with current.lock:
+                # A commit since the record was loaded may have made
+                # it out of date.
+                if current.generation != generation:
+                    return
+                old = current.records.get(oid)
+                if old is None or old[1] <= record[1]:
+                    current.records[oid] = record
+
+    def _loadBefore(self, oid, tid):
+        first = self._first_change(oid)
+        if first is None:
+            # The oid isn't in the changes.
+            return self.base.loadBefore(oid, tid)
+        if first is not False:
+            if first < tid:
+                return self.changes.loadBefore(oid, tid)
+            # The object was only changed at or after tid.
+            try:
+                result = self.base.loadBefore(oid, tid)
+            except ZODB.POSException.POSKeyError:
+                return None
+            if result and not result[-1]:
+                # The oid is current in the base, until its first change.
+                result = result[:2] + (first,)
+            return result
+
+        # The changes can't be indexed.
         try:
             result = self.changes.loadBefore(oid, tid)
         except ZODB.POSException.POSKeyError:
@@ -289,6 +394,8 @@ class DemoStorage(ConflictResolvingStorage):
             raise
 
     def loadSerial(self, oid, serial):
+        if self._first_change(oid) is None:
+            return self.base.loadSerial(oid, serial)
         try:
             return self.changes.loadSerial(oid, serial)
         except ZODB.POSException.POSKeyError:
@@ -312,6 +419,15 @@ class DemoStorage(ConflictResolvingStorage):
                 self._next_oid = random.randint(1, 1 << 62)
 
     def pack(self, t, referencesf, gc=None):
+        try:
+            return self._pack(t, referencesf, gc)
+        finally:
+            # Packing may remove early records, or whole objects.
+            self._changes_index = None
+            if self._current is not None and self._current.owner is self:
+                self._current.records.clear()
+
+    def _pack(self, t, referencesf, gc):
         if gc is None:
             if self._temporary_changes:
                 return self.changes.pack(t, referencesf)
@@ -331,8 +447,21 @@ class DemoStorage(ConflictResolvingStorage):
 
     def pop(self):
         """Close the changes database and return the base.
+
+        The current records this storage added to those shared by the
+        stack are forgotten, so this takes time proportional to what
+        the storage changed or loaded from its changes.
         """
         self.changes.close()
+        current = self._current
+        if current is not None and current.owner is self:
+            with current.lock:
+                for oid in self._touched:
+                    current.records.pop(oid, None)
+            if getattr(self.base, '_current', None) is current:
+                current.owner = self.base
+            else:
+                current.owner = None
         return self.base
 
     def push(self, changes=None):
@@ -340,9 +469,30 @@ class DemoStorage(ConflictResolvingStorage):
 
         The given changes are used as the changes for the returned
         storage and ``False`` is passed as ``close_base_on_close``.
+
+        The storages of a push/pop stack share the current records
+        they loaded, so that the top storage loads them with a single
+        lookup instead of asking each storage below it.
         """
-        return self.__class__(base=self, changes=changes,
-                              close_base_on_close=False)
+        storage = self.__class__(base=self, changes=changes,
+                                 close_base_on_close=False)
+        current = self._current
+        if current is None:
+            current = self._current = _CurrentRecords()
+            self._touched = set()
+        elif current.owner is not self:
+            # Another storage was pushed on this one, don't share.
+            current = _CurrentRecords()
+        current.owner = storage
+        storage._current = current
+        storage._touched = set()
+        layer = storage
+        while isinstance(layer, DemoStorage):
+            if layer._currents is None:
+                layer._currents = weakref.WeakSet()
+            layer._currents.add(current)
+            layer = layer.base
+        return storage
 
     def store(self, oid, serial, data, version, transaction):
         assert version == '', "versions aren't supported"
@@ -363,8 +513,10 @@ class DemoStorage(ConflictResolvingStorage):
             rdata = self.tryToResolveConflict(oid, old, serial, data)
             self.changes.store(oid, old, rdata, '', transaction)
             self._resolved.append(oid)
+            self._stored_data[oid] = rdata
         else:
             self.changes.store(oid, serial, data, '', transaction)
+            self._stored_data[oid] = data
 
     def storeBlob(self, oid, oldserial, data, blobfilename, version,
                   transaction):
@@ -384,10 +536,19 @@ class DemoStorage(ConflictResolvingStorage):
                 raise
             self.changes.storeBlob(
                 oid, oldserial, data, blobfilename, '', transaction)
+        self._stored_data[oid] = data
 
     checkCurrentSerialInTransaction = (
         ZODB.BaseStorage.checkCurrentSerialInTransaction)
 
+    def _undo(self, transaction_id, transaction):
+        # The changes undo, but the current records of the undone
+        # objects must be forgotten when the transaction is finished.
+        result = self.changes.undo(transaction_id, transaction)
+        if result:
+            self._undone_oids.update(result[1])
+        return result
+
     def temporaryDirectory(self):
         try:
             return self.changes.temporaryDirectory()
@@ -401,6 +562,8 @@ class DemoStorage(ConflictResolvingStorage):
             if transaction is not self._transaction:
                 return
             self._stored_oids = set()
+            self._stored_data = {}
+            self._undone_oids = set()
             self._transaction = None
             self.changes.tpc_abort(transaction)
             self._commit_lock.release()
@@ -418,6 +581,8 @@ class DemoStorage(ConflictResolvingStorage):
             self.changes.tpc_begin(transaction, *a, **k)
             self._transaction = transaction
             self._stored_oids = set()
+            self._stored_data = {}
+            self._undone_oids = set()
             del self._resolved[:]
 
     def tpc_vote(self, *a, **k):
@@ -431,13 +596,76 @@ class DemoStorage(ConflictResolvingStorage):
             if (transaction is not self._transaction):
                 raise ZODB.POSException.StorageTransactionError(
                     "tpc_finish called with wrong transaction")
-            self._issued_oids.difference_update(self._stored_oids)
+            stored = self._stored_oids
+            indexed = []
+
+            def finish(tid):
+                # Index the new objects before invalidations are sent.
+                index = self._changes_index
+                if index is not None and index is not False:
+                    for oid in stored:
+                        if oid not in index:
+                            index[oid] = tid
+                            indexed.append((index, oid))
+                self._commit_current(
+                    self._stored_data, self._undone_oids, tid)
+                func(tid)
+
+            try:
+                tid = self.changes.tpc_finish(transaction, finish)
+            except BaseException:
+                # The transaction may be aborted, forget the new objects
+                # and records.
+                for index, oid in indexed:
+                    index.pop(oid, None)
+                self._commit_current(self._stored_data, self._undone_oids)
+                raise
+            self._issued_oids.difference_update(stored)
             self._stored_oids = set()
+            self._stored_data = {}
+            self._undone_oids = set()
             self._transaction = None
-            tid = self.changes.tpc_finish(transaction, func)
             self._commit_lock.release()
         return tid
 
+    def _commit_current(self, stored_data, undone_oids, tid=None):
+        # Update the current records that may hold records of this
+        # storage with the committed ones, or forget them without tid.
+        # The records of undone objects are forgotten.
+        for current in list(self._currents or ()):
+            with current.lock:
+                if current.owner is self and tid is not None:
+                    for oid, data in stored_data.items():
+                        self._touched.add(oid)
+                        current.records[oid] = data, tid
+                    stale = undone_oids
+                elif current.owner is not None:
+                    # Storages above this one may hide the records,
+                    # let the owner load them again.
+                    stale = set(stored_data).union(undone_oids)
+                else:
+                    continue
+                if stale:
+                    current.generation += 1
+                    for oid in stale:
+                        current.records.pop(oid, None)
+
+
+class _CurrentRecords:
+    """Current records shared by the storages of a push/pop stack
+
+    Only the storage at the top of the stack, the owner, uses them.
+    Commits by storages below the owner bump the generation, so that
+    records loaded before them aren't added.
+    """
+
+    owner = None
+    generation = 0
+
+    def __init__(self):
+        self.records = {}  # oid -> (data, serial)
+        self.lock = threading.Lock()
+
 
 _temporary_blobdirs = {}
 
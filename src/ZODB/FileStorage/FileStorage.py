@@ -18,12 +18,17 @@ import binascii
 import contextlib
 import errno
 import logging
+import mmap
 import os
+import queue
+import threading
 import time
 from base64 import decodebytes
 from base64 import encodebytes
+from io import BytesIO
 from struct import pack
 from struct import unpack
+from struct import unpack_from
 
 from persistent.TimeStamp import TimeStamp
 from zc.lockfile import LockFile
@@ -32,12 +37,14 @@ from zope.interface import implementer
 
 from ZODB._compat import FILESTORAGE_MAGIC
 from ZODB._compat import Pickler
+from ZODB._compat import Unpickler
 from ZODB._compat import _protocol
 from ZODB._compat import loads
 from ZODB.BaseStorage import BaseStorage
 from ZODB.BaseStorage import DataRecord as _DataRecord
 from ZODB.BaseStorage import TransactionRecord as _TransactionRecord
 from ZODB.blob import BlobStorageMixin
+from ZODB.blob import clone_file
 from ZODB.blob import link_or_copy
 from ZODB.blob import remove_committed
 from ZODB.blob import remove_committed_dir
@@ -50,9 +57,13 @@ from ZODB.FileStorage.format import CorruptedDataError
 from ZODB.FileStorage.format import CorruptedError
 from ZODB.FileStorage.format import DataHeader
 from ZODB.FileStorage.format import FileStorageFormatter
+from ZODB.FileStorage.format import MappedFile
+from ZODB.FileStorage.format import MappedFileFormatter
 from ZODB.FileStorage.format import TxnHeader
+from ZODB.FileStorage.format import TxnHeaderFromString
 from ZODB.FileStorage.fspack import FileStoragePacker
 from ZODB.fsIndex import fsIndex
+from ZODB.fsIndex import save_buckets
 from ZODB.interfaces import IBlobStorageRestoreable
 from ZODB.interfaces import IExternalGC
 from ZODB.interfaces import IStorage
@@ -128,6 +139,14 @@ class RedundantPackWarning(FileStorageError):
     pass
 
 
+class PackInterrupted(FileStorageError):
+    """A pack stopped before it was done
+
+    This is raised by pack when the pack time budget is spent.  The
+    next pack resumes from the pack checkpoint.
+    """
+
+
 class TempFormatter(FileStorageFormatter):
     """Helper class used to read formatted FileStorage data."""
 
@@ -157,7 +176,11 @@ class FileStorage(
 
     def __init__(self, file_name, create=False, read_only=False, stop=None,
                  quota=None, pack_gc=True, pack_keep_old=True, packer=None,
-                 blob_dir=None):
+                 blob_dir=None, checkpoint_transactions=None,
+                 checkpoint_bytes=None, rebuild_index_jobs=1,
+                 pack_rate=None, pack_progress=None,
+                 pack_checkpoint_bytes=None, pack_time_budget=None,
+                 pack_gc_low_memory=False, pack_gc_stack_memory=None):
         """Create a file storage
 
         :param str file_name: Path to store data file
@@ -180,6 +203,35 @@ class FileStorage(
            :interface:`packer <ZODB.FileStorage.interfaces.IFileStoragePacker>`.
         :param str blob_dir: A blob-directory path name.
            Blobs will be supported if this option is provided.
+        :param int checkpoint_transactions: Checkpoint the index in the
+           background after this many transactions.
+        :param int checkpoint_bytes: Checkpoint the index in the
+           background after this many bytes have been committed.
+        :param int rebuild_index_jobs: Number of processes used to
+           rebuild the index when no usable index file is found.
+        :param int pack_rate: Maximum number of bytes per second read
+           by the default packer, so that packing doesn't starve
+           other reads of the file.
+        :param callable pack_progress: Called by the default packer
+           with a phase name, the position reached in the file and
+           the file size as packing progresses.
+        :param int pack_checkpoint_bytes: Make packs resumable by
+           checkpointing the default packer's progress each time this
+           many bytes of data before the pack time have been copied.
+        :param float pack_time_budget: Stop packing after this many
+           seconds of copying data before the pack time, raising
+           :class:`PackInterrupted`.  This requires
+           ``pack_checkpoint_bytes``, so that the next pack resumes
+           where it stopped.
+        :param bool pack_gc_low_memory: Keep the indexes used by pack
+           garbage collection in memory-mapped files rather than in
+           memory, for databases with more objects than fit in memory.
+           The memory they use is bounded by the operating system's
+           paging of the files.
+        :param int pack_gc_stack_memory: With ``pack_gc_low_memory``,
+           the bytes of oids still to visit kept in memory by pack
+           garbage collection, beyond which they are spilled to a
+           temporary file.  Defaults to 16MB.
 
         A file storage stores data in a single file that behaves like
         a traditional transaction log. New data records are appended
@@ -208,6 +260,12 @@ class FileStorage(
            long because it's necessary to scan the data file to build
            the index.
 
+        .index_journal
+           Changes to the index since the ``.index`` file was written,
+           appended by index checkpoints when ``checkpoint_transactions``
+           or ``checkpoint_bytes`` is given.  This limits the part of the
+           data file that has to be scanned on startup after a crash.
+
         .lock
            A lock file preventing multiple processes from opening a
            file storage on non-read-only mode.
@@ -225,6 +283,18 @@ class FileStorage(
           A temporary file written while packing containing current
           records as of and after the pack time.
 
+        .pack_checkpoint
+          The garbage-collection results and copy progress of a pack,
+          written when ``pack_checkpoint_bytes`` is given.  A pack
+          that's interrupted resumes from it if the data file didn't
+          change other than by new transactions.
+
+        .pack_oid2curpos, .pack_reachable
+          Memory-mapped indexes of object record positions written
+          while packing when ``pack_gc_low_memory`` is true.  They are
+          removed after packing, except for the index needed to resume
+          from a ``.pack_checkpoint`` file.
+
         .old
           The previous database file after a pack.
 
@@ -241,6 +311,9 @@ class FileStorage(
                 raise ValueError("can't create a read-only file")
         elif stop is not None:
             raise ValueError("time-travel only supported in read-only mode")
+        if pack_time_budget is not None and not pack_checkpoint_bytes:
+            raise ValueError(
+                "pack_time_budget requires pack_checkpoint_bytes")
 
         if stop is None:
             stop = b'\377' * 8
@@ -258,6 +331,14 @@ class FileStorage(
 
         self._pack_gc = pack_gc
         self.pack_keep_old = pack_keep_old
+        self.pack_rate = pack_rate
+        self.pack_progress = pack_progress
+        self.pack_checkpoint_bytes = pack_checkpoint_bytes
+        self.pack_time_budget = pack_time_budget
+        self.pack_gc_low_memory = pack_gc_low_memory
+        self.pack_gc_stack_memory = pack_gc_stack_memory
+        self._pack_resumed = threading.Event()
+        self._pack_resumed.set()
         if packer is not None:
             self.packer = packer
 
@@ -312,9 +393,21 @@ class FileStorage(
             self._used_index = 0  # Marker for testing
             self._pos, self._oid, tid = read_index(
                 self._file, file_name, index, tindex, stop,
-                read_only=read_only,
+                read_only=read_only, jobs=rebuild_index_jobs,
             )
             self._save_index()
+            start = self._pos
+
+        if not read_only and (checkpoint_transactions or checkpoint_bytes):
+            if start != self._pos:
+                # Checkpoints only write the buckets changed since the
+                # index on disk, so bring it up to date.
+                self._save_index()
+            self._checkpointer = IndexCheckpointer(
+                file_name, self._pos, checkpoint_transactions,
+                checkpoint_bytes)
+            if start != self._pos or not self._used_journal:
+                self._checkpointer.saved(self._pos)
 
         self._ltid = tid
 
@@ -365,6 +458,13 @@ class FileStorage(
         return fsIndex(), {}
 
     _saved = 0
+    _checkpointer = None
+    _used_journal = 0
+    _metrics = None
+
+    def setMetrics(self, metrics):
+        """Record metrics in a :class:`ZODB.metrics.Metrics` object"""
+        self._metrics = metrics
 
     def _save_index(self):
         """Write the database index to a file to support quick startup."""
@@ -372,12 +472,20 @@ class FileStorage(
         if self._is_read_only:
             return
 
+        checkpointer = self._checkpointer
+        if checkpointer is not None:
+            checkpointer.flush()
+
         index_name = self.__name__ + '.index'
         tmp_name = index_name + '.index_tmp'
 
         self._index.save(self._pos, tmp_name)
 
         try:
+            try:
+                os.remove(index_name + '_journal')
+            except OSError:
+                pass
             try:
                 os.remove(index_name)
             except OSError:
@@ -387,6 +495,8 @@ class FileStorage(
             pass
 
         self._saved += 1
+        if checkpointer is not None:
+            checkpointer.saved(self._pos)
 
     def _clear_index(self):
         index_name = self.__name__ + '.index'
@@ -505,6 +615,17 @@ class FileStorage(
                 # Now call this method again to get the new data.
                 return self._restore_index()
 
+        self._used_journal = 0
+        journal_pos = read_index_journal(
+            index_name + '_journal', index, pos)
+        if journal_pos is not None:
+            tid = self._sane(index, journal_pos)
+            if tid:
+                self._used_journal = 1  # Marker for testing
+                return index, journal_pos, tid
+            # Fall back to the index without the journal.
+            index = fsIndex.load(index_name)['index']
+
         tid = self._sane(index, pos)
         if not tid:
             return None
@@ -518,6 +639,9 @@ class FileStorage(
             self._lock_file.close()
         if self._tfile:
             self._tfile.close()
+        if self._checkpointer is not None:
+            self._checkpointer.close()
+            self._checkpointer = None
         try:
             self._save_index()
         except:  # noqa: E722 do not use bare 'except'
@@ -554,19 +678,19 @@ class FileStorage(
                 raise POSKeyError(oid)
 
     def loadSerial(self, oid, serial):
-        with self._lock:
+        with self._files.get() as _file:
             pos = self._lookup_pos(oid)
             while 1:
-                h = self._read_data_header(pos, oid)
+                h = self._read_data_header(pos, oid, _file)
                 if h.tid == serial:
                     break
                 pos = h.prev
                 if h.tid < serial or not pos:
                     raise POSKeyError(oid)
             if h.plen:
-                return self._file.read(h.plen)
+                return _file.read(h.plen)
             else:
-                return self._loadBack_impl(oid, h.back)[0]
+                return self._loadBack_impl(oid, h.back, _file=_file)[0]
 
     def loadBefore(self, oid, tid):
         with self._files.get() as _file:
@@ -841,6 +965,9 @@ class FileStorage(
                     if f is not None:
                         f(tid)
                     self._finish(tid, *self._ude)
+                    if self._checkpointer is not None:
+                        self._checkpointer.committed(
+                            self._tindex, self._pos, self._index)
                     self._clear_temp()
                 finally:
                     self._ude = None
@@ -867,9 +994,17 @@ class FileStorage(
         # This is a separate method to allow tests to replace it with
         # something broken. :)
 
+        metrics = self._metrics
+        if metrics is not None:
+            start = time.perf_counter()
         self._file.flush()
         if fsync is not None:
             fsync(self._file.fileno())
+        if metrics is not None:
+            metrics.observe('filestorage_sync_seconds',
+                            time.perf_counter() - start)
+            metrics.increment('filestorage_bytes_written',
+                              self._nextpos - self._pos)
 
         self._pos = self._nextpos
         self._index.update(self._tindex)
@@ -911,9 +1046,9 @@ class FileStorage(
         return h.tid, pos, data
 
     def getTid(self, oid):
-        with self._lock:
+        with self._files.get() as _file:
             pos = self._lookup_pos(oid)
-            h = self._read_data_header(pos, oid)
+            h = self._read_data_header(pos, oid, _file)
             if h.plen == 0 and h.back == 0:
                 # Undone creation
                 raise POSKeyError(oid)
@@ -1023,23 +1158,23 @@ class FileStorage(
             # the normalization code was incorrect for years (used +1
             # instead -- off by 1), until ZODB 3.4.
             last = first - last
-        with self._lock:
-            if self._pack_is_in_progress:
-                raise UndoError(
-                    'Undo is currently disabled for database maintenance.<p>')
-            us = UndoSearch(self._file, self._pos, first, last, filter)
-            while not us.finished():
-                # Hold lock for batches of 20 searches, so default search
-                # parameters will finish without letting another thread run.
+        if self._pack_is_in_progress:
+            raise UndoError(
+                'Undo is currently disabled for database maintenance.<p>')
+        with self._files.get() as _file:
+            us = UndoSearch(_file, self._pos, first, last, filter)
+        while not us.finished():
+            # Hold a file for batches of 20 searches, so default search
+            # parameters will finish in one go.  Between batches, we
+            # give the file back, so that a long undoLog() operation
+            # doesn't hold up commits.
+            with self._files.get() as _file:
+                us.file = _file
                 for i in range(20):
                     if us.finished():
                         break
                     us.search()
-                # Give another thread a chance, so that a long undoLog()
-                # operation doesn't block all other activity.
-                self._lock.release()
-                self._lock.acquire()
-            return us.results
+        return us.results
 
     def undo(self, transaction_id, transaction):
         """Undo a transaction, given by transaction_id.
@@ -1125,10 +1260,7 @@ class FileStorage(
                             # We're undoing a blob modification operation.
                             # We have to copy the blob data
                             tmp = mktemp(dir=self.fshelper.temp_dir)
-                            with self.openCommittedBlobFile(
-                                    h.oid, userial) as sfp:
-                                with open(tmp, 'wb') as dfp:
-                                    cp(sfp, dfp)
+                            clone_file(self.loadBlob(h.oid, userial), tmp)
                             self._blob_storeblob(h.oid, self._tid, tmp)
 
                 new = DataHeader(h.oid, self._tid, ipos, otloc, 0, len(p))
@@ -1155,16 +1287,16 @@ class FileStorage(
         return tindex
 
     def history(self, oid, size=1, filter=None):
-        with self._lock:
+        with self._files.get() as _file:
             r = []
             pos = self._lookup_pos(oid)
 
             while 1:
                 if len(r) >= size:
                     return r
-                h = self._read_data_header(pos)
+                h = self._read_data_header(pos, _file=_file)
 
-                th = self._read_txn_header(h.tloc)
+                th = self._read_txn_header(h.tloc, _file=_file)
                 if th.ext:
                     d = loads(th.ext)
                 else:
@@ -1198,7 +1330,13 @@ class FileStorage(
         # simply adapt the old interface to the new.  We don't really
         # want to invest much in the old packer, at least for now.
         assert referencesf is not None
-        p = FileStoragePacker(storage, referencesf, stop, gc)
+        p = FileStoragePacker(storage, referencesf, stop, gc,
+                              storage.pack_rate, storage.pack_progress,
+                              storage.pack_checkpoint_bytes,
+                              storage.pack_time_budget,
+                              storage._pack_resumed,
+                              storage.pack_gc_low_memory,
+                              storage.pack_gc_stack_memory)
         try:
             opos = p.pack()
             if opos is None:
@@ -1248,6 +1386,9 @@ class FileStorage(
                 pack_result = self.packer(self, referencesf, stop, gc)
             except RedundantPackWarning as detail:
                 logger.info(str(detail))
+            except PackInterrupted as detail:
+                logger.warning(str(detail))
+                raise
             if pack_result is None:
                 return
             have_commit_lock = True
@@ -1267,6 +1408,8 @@ class FileStorage(
                     self._file = open(self._file_name, 'r+b')
                     self._initIndex(index, self._tindex)
                     self._pos = opos
+                    if self._checkpointer is not None:
+                        self._checkpointer.reset()
 
             # We're basically done.  Now we need to deal with removed
             # blobs and removing the .old file (see further down).
@@ -1288,6 +1431,17 @@ class FileStorage(
         with self._lock:
             self._save_index()
 
+    def pausePack(self):
+        """Pause a pack in progress at the next transaction it copies
+
+        The commit lock isn't held while a pack is paused.
+        """
+        self._pack_resumed.clear()
+
+    def resumePack(self):
+        """Resume a paused pack"""
+        self._pack_resumed.set()
+
     def _remove_blob_files_tagged_for_removal_during_pack(self):
         lblob_dir = len(self.blob_dir)
         fshelper = self.fshelper
@@ -1373,6 +1527,7 @@ class FileStorage(
                 maybe_remove_empty_dir_containing(path)
 
         os.remove(os.path.join(self.blob_dir, '.removed'))
+        fshelper.removeUnusedContent(self._lock)
 
         if not self.pack_keep_old:
             return
@@ -1392,17 +1547,15 @@ class FileStorage(
         return FileIterator(self._file_name, start, stop)
 
     def lastInvalidations(self, count):
-        file = self._file
-        seek = file.seek
-        read = file.read
-        with self._lock:
+        with self._files.get() as file:
+            seek = file.seek
+            read = file.read
             pos = self._pos
             while count > 0 and pos > 4:
                 count -= 1
                 seek(pos - 8)
                 pos = pos - 8 - u64(read(8))
 
-            seek(0)
             return [(trans.tid, [r.oid for r in trans])
                     for trans in FileIterator(self._file_name, pos=pos)]
 
@@ -1419,7 +1572,9 @@ class FileStorage(
 
     def cleanup(self):
         """Remove all files created by this storage."""
-        for ext in '', '.old', '.tmp', '.lock', '.index', '.pack':
+        for ext in ('', '.old', '.tmp', '.lock', '.index', '.index_journal',
+                    '.pack', '.pack_checkpoint', '.pack_oid2curpos',
+                    '.pack_reachable'):
             try:
                 os.remove(self._file_name + ext)
             except OSError as e:
@@ -1595,7 +1750,8 @@ def recover(file_name):
 
 
 def read_index(file, name, index, tindex, stop=b'\377' * 8,
-               ltid=z64, start=4, maxoid=z64, recover=0, read_only=0):
+               ltid=z64, start=4, maxoid=z64, recover=0, read_only=0,
+               jobs=1):
     """Scan the file storage and update the index.
 
     Returns file position, max oid, and last transaction id.  It also
@@ -1620,6 +1776,11 @@ def read_index(file, name, index, tindex, stop=b'\377' * 8,
     maxoid -- ignored (it meant something prior to ZODB 3.2.6; the argument
               still exists just so the signature of read_index() stayed the
               same)
+    jobs -- when scanning the whole file (start is 4), the number of
+            processes used to index ranges of transactions in parallel.
+            The ranges are merged in order, and scanning goes on in this
+            process from the first transaction a range couldn't index, so
+            the result is the same as with a single process.
 
     The file position returned is the position just after the last
     valid transaction record.  The oid returned is the maximum object
@@ -1644,6 +1805,9 @@ def read_index(file, name, index, tindex, stop=b'\377' * 8,
             file.write(packed_version)
         return 4, z64, ltid
 
+    if jobs > 1 and start == 4:
+        start, ltid = _read_index_parallel(name, index, stop, ltid, jobs)
+
     index_get = index.get
 
     pos = start
@@ -1780,6 +1944,92 @@ def read_index(file, name, index, tindex, stop=b'\377' * 8,
     return pos, maxoid, ltid
 
 
+def _read_index_parallel(name, index, stop, ltid, jobs):
+    # Index ranges of transactions in worker processes and merge them
+    # into index.  Return the position and id of the last transaction
+    # merged.
+    from ZODB.FileStorage import parallel
+    pos = 4
+    results = parallel.map_ranges(name, _read_index_range, jobs, stop)
+    for end, tid, rindex, new, complete in results:
+        index_get = index.get
+        for oid, prev in new:
+            if index_get(oid, 0) != prev:
+                # Let read_index() deal with this range.
+                return pos, ltid
+        index.update(rindex)
+        pos, ltid = end, tid
+        if not complete:
+            break
+    return pos, ltid
+
+
+def _read_index_range(name, trange, stop):
+    """Index a range of transactions of a FileStorage file.
+
+    The file is mapped in memory and only headers are parsed.  Return
+    the position just after the last transaction indexed, the id of
+    that transaction, an fsIndex of its records, a list of (oid, prev)
+    for records whose previous record isn't in the range, to be checked
+    against the index of the previous ranges, and whether the whole
+    range was indexed.
+
+    Indexing stops at the first transaction that read_index() would
+    complain about or not index.
+    """
+    index = fsIndex()
+    new = []
+    pos = trange.pos
+    ltid = trange.prev_tid
+    with open(name, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        file_size = len(mm)
+        end = file_size if trange.end is None else trange.end
+        while pos < end and pos + TRANS_HDR_LEN <= file_size:
+            tid, tl, status, ul, dl, el = unpack_from(TRANS_HDR, mm, pos)
+            tend = pos + tl
+            hlen = TRANS_HDR_LEN + ul + dl + el
+            if (tid <= ltid or tid >= stop or status not in b' up'
+                    or tend + 8 > file_size or tl < hlen
+                    or unpack_from(">Q", mm, tend)[0] != tl):
+                break
+            if status != b'u':
+                tnew = []
+                tindex = _read_index_records(mm, pos, tend, hlen, index, tnew)
+                if tindex is None:
+                    break
+                index.update(tindex)
+                new.extend(tnew)
+            ltid = tid
+            pos = tend + 8
+    finally:
+        mm.close()
+    return pos, ltid, index, new, pos == end
+
+
+def _read_index_records(mm, tpos, tend, hlen, index, new):
+    # Return the records of a transaction in a dict, or None if
+    # something looks wrong.
+    tindex = {}
+    pos = tpos + hlen
+    while pos < tend:
+        if pos + DATA_HDR_LEN > tend:
+            return None
+        oid, _, prev, tloc, vlen, plen = unpack_from(DATA_HDR, mm, pos)
+        dlen = DATA_HDR_LEN + (plen or 8)
+        if vlen or tloc != tpos or pos + dlen > tend:
+            return None
+        known = index.get(oid)
+        if known is None:
+            new.append((oid, prev))
+        elif known != prev:
+            return None
+        tindex[oid] = pos
+        pos += dlen
+    return tindex
+
+
 def _truncate(file, name, pos):
     file.seek(0, 2)
     file_size = file.tell()
@@ -1805,8 +2055,11 @@ def _truncate(file, name, pos):
     file.truncate()
 
 
-class FileIterator(FileStorageFormatter):
+class FileIterator(MappedFileFormatter):
     """Iterate over the transactions in a FileStorage file.
+
+    If the file ends with a complete transaction, it's memory-mapped up
+    to there and read without system calls.
     """
     _ltid = z64
     _file = None
@@ -1823,6 +2076,7 @@ class FileIterator(FileStorageFormatter):
         if (pos < 4) or pos > self._file_size:
             raise ValueError("Given position is greater than the file size",
                              pos, self._file_size)
+        self._map()
         self._pos = pos
         assert start is None or isinstance(start, bytes)
         assert stop is None or isinstance(stop, bytes)
@@ -1854,6 +2108,33 @@ class FileIterator(FileStorageFormatter):
             self._file = None
             file.close()
 
+    def _map(self):
+        # Only map a file ending with a committed transaction.  The
+        # file may be truncated back to its end if a transaction being
+        # committed is aborted, and accessing a truncated part of a
+        # map crashes the process.
+        file = self._file
+        size = self._file_size
+        if size <= 4:
+            return
+        file.seek(size - 8)
+        tlen = u64(file.read(8))
+        if not TRANS_HDR_LEN <= tlen <= size - 12:
+            return
+        file.seek(size - 8 - tlen)
+        h = file.read(TRANS_HDR_LEN)
+        if len(h) != TRANS_HDR_LEN:
+            return
+        h = TxnHeaderFromString(h)
+        if h.tlen != tlen or h.status == 'c':
+            return
+        try:
+            mapped = MappedFile(file, size)
+        except (OSError, ValueError, OverflowError):
+            return
+        file.close()
+        self._file = mapped
+
     def _skip_to_start(self, start):
         file = self._file
         pos1 = self._pos
@@ -2043,7 +2324,7 @@ class TransactionRecord(_TransactionRecord):
         return TransactionRecordIterator(self)
 
 
-class TransactionRecordIterator(FileStorageFormatter):
+class TransactionRecordIterator(MappedFileFormatter):
     """Iterate over the transactions in a FileStorage file."""
 
     def __init__(self, record):
@@ -2236,3 +2517,213 @@ class FilePool:
                 self._out.pop().close()
             self.empty()
             self.writing = self.writers = 0
+
+
+def read_index_journal(file_name, index, pos):
+    """Apply the checkpoints of an index journal to an index.
+
+    pos is the position of the index read from the ``.index`` file.
+    Return the position the index is up to date with, or None if there
+    is no journal for that index.  Checkpoints cut short by a crash are
+    ignored.
+    """
+    try:
+        f = open(file_name, 'rb')
+    except OSError:
+        return None
+    with f:
+        unpickler = Unpickler(f)
+        try:
+            if unpickler.load() != pos:
+                return None
+        except Exception:
+            return None
+        end = None
+        while True:
+            try:
+                pos, buckets = unpickler.load()
+            except Exception:
+                break
+            index.update_buckets(buckets)
+            end = pos
+        return end
+
+
+def _merge_buckets(unpickler, changes):
+    # Generate the buckets of an index file read by unpickler, in the
+    # order of their prefixes, replaced by the changed buckets.  Empty
+    # buckets are left out.
+    changes = sorted(changes.items())
+    i = 0
+    while True:
+        item = unpickler.load()
+        if item is None:
+            break
+        prefix, data = item
+        while i < len(changes) and changes[i][0] < prefix:
+            if changes[i][1]:
+                yield changes[i]
+            i += 1
+        if i < len(changes) and changes[i][0] == prefix:
+            data = changes[i][1]
+            i += 1
+        if data:
+            yield prefix, data
+    for prefix, data in changes[i:]:
+        if data:
+            yield prefix, data
+
+
+class IndexCheckpointer:
+    """Checkpoint the index of a FileStorage in a background thread.
+
+    A checkpoint is taken after a number of transactions or bytes have
+    been committed.  Only the buckets of the index changed since the
+    previous checkpoint are copied, with the storage lock held.  They
+    are appended to the ``.index_journal`` file, which is applied to
+    the ``.index`` file on startup.  If the journal gets bigger than the
+    index file, the background thread merges them, with the changed
+    buckets, into a new index file and starts the journal over.
+
+    Checkpoints need an index file up to date with the start of the
+    journal.  When there's none, because the index was replaced or a
+    checkpoint failed, checkpoints are skipped until the storage saves
+    its index.
+    """
+
+    def __init__(self, file_name, pos, transactions=None, bytes=None):
+        self.index_name = file_name + '.index'
+        self.journal_name = self.index_name + '_journal'
+        self.transactions = transactions
+        self.bytes = bytes
+        # Set when there's no index file to checkpoint changes to.
+        self._full = False
+        self._changed = set()
+        self._count = 0
+        self._pos = pos
+        try:
+            self._index_size = os.path.getsize(self.index_name)
+            self._journal_size = os.path.getsize(self.journal_name)
+        except OSError:
+            self._full = True
+            self._index_size = self._journal_size = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name='index checkpointer for ' + file_name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def committed(self, oids, pos, index):
+        """Note a committed transaction and checkpoint if it's time
+
+        oids are the oids changed by the transaction and pos the end of
+        the transaction in the data file.
+        """
+        self._changed.update(oid[:6] for oid in oids)
+        self._count += 1
+        if ((self.transactions and self._count >= self.transactions) or
+                (self.bytes and pos - self._pos >= self.bytes)):
+            self.checkpoint(pos, index)
+
+    def checkpoint(self, pos, index):
+        """Checkpoint the index, up to date with pos
+
+        This must be called with the storage lock held.  Only the
+        changed buckets are copied here, they're written by the
+        background thread.
+        """
+        if not self._full:
+            merge = self._journal_size > self._index_size
+            self._queue.put((merge, pos, index.buckets(self._changed)))
+        self._changed = set()
+        self._count = 0
+        self._pos = pos
+
+    def flush(self):
+        """Wait for pending checkpoints to be written"""
+        self._queue.join()
+
+    def reset(self):
+        """The index was replaced, skip checkpoints until it's saved"""
+        self._full = True
+        self._changed = set()
+
+    def saved(self, pos):
+        """Restart the journal after the storage saved the full index
+
+        This must be called with the storage lock held, after flush().
+        """
+        self._changed = set()
+        self._count = 0
+        self._pos = pos
+        try:
+            self._index_size = os.path.getsize(self.index_name)
+            self._start_journal(pos)
+            self._full = False
+        except Exception:
+            logger.exception("Error starting %s", self.journal_name)
+            self._full = True
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    break
+                merge, pos, buckets = item
+                if self._full:
+                    pass  # a previous checkpoint failed
+                elif merge:
+                    self._write_index(pos, buckets)
+                else:
+                    self._append(pos, buckets)
+            except Exception:
+                logger.exception("Error checkpointing %s", self.index_name)
+                self._full = True
+            finally:
+                self._queue.task_done()
+
+    def _write_index(self, pos, buckets):
+        # Merge the index file, the journal and the changed buckets
+        # into a new index file, a bucket at a time.
+        changes = {}
+        with open(self.journal_name, 'rb') as f:
+            unpickler = Unpickler(f)
+            unpickler.load()  # the position of the index
+            while True:
+                try:
+                    changes.update(unpickler.load()[1])
+                except EOFError:
+                    break
+        changes.update(buckets)
+        tmp_name = self.index_name + '.index_tmp'
+        with open(self.index_name, 'rb') as f:
+            unpickler = Unpickler(f)
+            if not isinstance(unpickler.load(), int):
+                raise ValueError("Can't merge an index in the old format")
+            save_buckets(pos, _merge_buckets(unpickler, changes), tmp_name)
+        # The journal belongs to the old index, remove it first.
+        if os.path.exists(self.journal_name):
+            os.remove(self.journal_name)
+        os.replace(tmp_name, self.index_name)
+        self._index_size = os.path.getsize(self.index_name)
+        self._start_journal(pos)
+
+    def _start_journal(self, pos):
+        with open(self.journal_name, 'wb') as f:
+            Pickler(f, _protocol).dump(pos)
+            self._journal_size = f.tell()
+
+    def _append(self, pos, buckets):
+        data = BytesIO()
+        Pickler(data, _protocol).dump((pos, buckets))
+        with open(self.journal_name, 'ab') as f:
+            f.write(data.getvalue())
+            f.flush()
+            if fsync is not None:
+                fsync(f.fileno())
+            self._journal_size = f.tell()
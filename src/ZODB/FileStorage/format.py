@@ -84,6 +84,7 @@
 #   data.  Instead, we write records with back pointers.
 
 import logging
+import mmap
 import struct
 
 from ZODB.POSException import POSKeyError
@@ -159,17 +160,20 @@ class FileStorageFormatter:
             h.back = u64(_file.read(8))
         return h
 
-    def _read_txn_header(self, pos, tid=None):
-        self._file.seek(pos)
-        s = self._file.read(TRANS_HDR_LEN)
+    def _read_txn_header(self, pos, tid=None, _file=None):
+        if _file is None:
+            _file = self._file
+
+        _file.seek(pos)
+        s = _file.read(TRANS_HDR_LEN)
         if len(s) != TRANS_HDR_LEN:
             raise CorruptedDataError(tid, s, pos)
         h = TxnHeaderFromString(s)
         if tid is not None and tid != h.tid:
             raise CorruptedDataError(tid, s, pos)
-        h.user = self._file.read(h.ulen)
-        h.descr = self._file.read(h.dlen)
-        h.ext = self._file.read(h.elen)
+        h.user = _file.read(h.ulen)
+        h.descr = _file.read(h.dlen)
+        h.ext = _file.read(h.elen)
         return h
 
     def _loadBack_impl(self, oid, back, fail=True, _file=None):
@@ -295,3 +299,87 @@ class TxnHeader:
 
     def headerlen(self):
         return TRANS_HDR_LEN + self.ulen + self.dlen + self.elen
+
+
+class MappedFile:
+    """A read-only, file-like view of the start of a memory-mapped file.
+
+    Reading from it copies bytes out of the map rather than making
+    system calls, which makes sequential scans of a FileStorage file
+    much cheaper.  The file must not be truncated below size while
+    mapped.
+    """
+
+    def __init__(self, file, size):
+        self.name = file.name
+        self.map = mmap.mmap(file.fileno(), size, access=mmap.ACCESS_READ)
+        self.size = size
+        self.pos = 0
+
+    def seek(self, pos, whence=0):
+        if whence == 1:
+            pos += self.pos
+        elif whence == 2:
+            pos += self.size
+        self.pos = pos
+        return pos
+
+    def tell(self):
+        return self.pos
+
+    def read(self, size=-1):
+        pos = self.pos
+        data = self.map[pos:] if size < 0 else self.map[pos:pos + size]
+        self.pos = pos + len(data)
+        return data
+
+    def close(self):
+        self.map.close()
+
+
+class MappedFileFormatter(FileStorageFormatter):
+    """Formatter parsing headers straight out of a MappedFile
+
+    Other files are read as usual.
+    """
+
+    def _read_data_header(self, pos, oid=None, _file=None):
+        if _file is None:
+            _file = self._file
+        if _file.__class__ is not MappedFile:
+            return FileStorageFormatter._read_data_header(
+                self, pos, oid, _file)
+
+        end = pos + DATA_HDR_LEN
+        if end > _file.size or pos < 0:
+            raise CorruptedDataError(oid, _file.map[pos:end], pos)
+        h = DataHeader(*struct.unpack_from(DATA_HDR, _file.map, pos))
+        if oid is not None and oid != h.oid:
+            raise CorruptedDataError(oid, _file.map[pos:end], pos)
+        if not h.plen:
+            h.back = u64(_file.map[end:end + 8])
+            end += 8
+        _file.pos = end
+        return h
+
+    def _read_txn_header(self, pos, tid=None, _file=None):
+        if _file is None:
+            _file = self._file
+        if _file.__class__ is not MappedFile:
+            return FileStorageFormatter._read_txn_header(self, pos, tid, _file)
+
+        end = pos + TRANS_HDR_LEN
+        if end > _file.size or pos < 0:
+            raise CorruptedDataError(tid, _file.map[pos:end], pos)
+        h = TxnHeader(*struct.unpack_from(TRANS_HDR, _file.map, pos))
+        h.status = h.status.decode('ascii')
+        if tid is not None and tid != h.tid:
+            raise CorruptedDataError(tid, _file.map[pos:end], pos)
+        m = _file.map
+        h.user = m[end:end + h.ulen]
+        end += h.ulen
+        h.descr = m[end:end + h.dlen]
+        end += h.dlen
+        h.ext = m[end:end + h.elen]
+        _file.pos = end + h.elen
+        return h
@@ -0,0 +1,380 @@
+##############################################################################
+#
+# Copyright (c) 2026 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Gather statistics about a FileStorage in a single pass.
+
+The scripts in ZODB.scripts (analyze, fsstats, space, netspace and
+fsrefs) each read the whole file to compute their own numbers.  This
+module reads the file once and hands every transaction and data record
+to a set of collectors, each of which computes one kind of statistics.
+The results are plain data that can be written as JSON.
+
+The file can also be split into ranges of transactions that are
+analyzed by separate processes.  Collectors know how to merge the
+results of consecutive ranges.
+"""
+import argparse
+import json
+import math
+import sys
+
+from ZODB.FileStorage import parallel
+from ZODB.serialize import referencesf
+from ZODB.TimeStamp import TimeStamp
+from ZODB.utils import get_pickle_metadata
+from ZODB.utils import oid_repr
+
+
+def record_class(data):
+    """Return the dotted name of the class of a record's object
+    """
+    module, name = get_pickle_metadata(data)
+    return f"{module}.{name}"
+
+
+class Collector:
+    """Base class for collectors
+
+    A collector is fed the transactions and records of a range of
+    transactions, in order.  Collectors for consecutive ranges are
+    combined with merge, so collectors must be picklable.
+    """
+
+    name = None
+
+    def transaction(self, txn):
+        """Called for each transaction, before its records"""
+
+    def record(self, txn, record, klass):
+        """Called for each data record.
+
+        klass is the dotted class name of the record's object, or None
+        if the record has no data (undo of object creation or deletion).
+        """
+
+    def merge(self, later):
+        """Combine with a collector for the range right after ours"""
+        raise NotImplementedError
+
+    def result(self):
+        """Return the statistics as plain (JSON-serializable) data"""
+        raise NotImplementedError
+
+
+class Histogram(dict):
+    """A histogram of values grouped in bins of a given size
+    """
+
+    def __init__(self, binsize):
+        self.binsize = binsize
+
+    def add(self, value, n=1):
+        b = value // self.binsize * self.binsize
+        self[b] = self.get(b, 0) + n
+
+    def update(self, other):
+        for b, n in other.items():
+            self[b] = self.get(b, 0) + n
+
+    def result(self):
+        return {'binsize': self.binsize,
+                'bins': [[b, n] for b, n in sorted(self.items())]}
+
+
+class ClassHistogram(Collector):
+    """Number of records and bytes per class"""
+
+    name = 'classes'
+
+    def __init__(self):
+        self.classes = {}  # class -> [records, bytes]
+
+    def record(self, txn, record, klass):
+        if klass is not None:
+            counts = self.classes.get(klass)
+            if counts is None:
+                counts = self.classes[klass] = [0, 0]
+            counts[0] += 1
+            counts[1] += len(record.data)
+
+    def merge(self, later):
+        for klass, (records, size) in later.classes.items():
+            counts = self.classes.setdefault(klass, [0, 0])
+            counts[0] += records
+            counts[1] += size
+
+    def result(self):
+        return {klass: {'records': records, 'bytes': size}
+                for klass, (records, size) in sorted(self.classes.items())}
+
+
+class RecordSizes(Collector):
+    """Distributions of record and transaction sizes"""
+
+    name = 'sizes'
+
+    def __init__(self):
+        self.records = Histogram(128)
+        self.transaction_bytes = Histogram(1024)
+        self.transaction_records = Histogram(10)
+        self._records = self._bytes = None
+
+    def transaction(self, txn):
+        self._end_transaction()
+        self._records = self._bytes = 0
+
+    def _end_transaction(self):
+        if self._records is not None:
+            self.transaction_records.add(self._records)
+            self.transaction_bytes.add(self._bytes)
+            self._records = self._bytes = None
+
+    def record(self, txn, record, klass):
+        size = 0 if record.data is None else len(record.data)
+        self.records.add(size)
+        self._records += 1
+        self._bytes += size
+
+    def merge(self, later):
+        self._end_transaction()
+        later._end_transaction()
+        self.records.update(later.records)
+        self.transaction_bytes.update(later.transaction_bytes)
+        self.transaction_records.update(later.transaction_records)
+
+    def result(self):
+        self._end_transaction()
+        return {'records': self.records.result(),
+                'transaction_bytes': self.transaction_bytes.result(),
+                'transaction_records': self.transaction_records.result()}
+
+
+class RevisionLifetimes(Collector):
+    """How often objects are changed, and how long revisions last
+
+    Lifetimes are the number of seconds between a revision and the
+    one that replaced it.  They are grouped in powers of 2: the count
+    given for n seconds is the number of revisions that lasted less
+    than n seconds, but at least n/2.
+    """
+
+    name = 'revisions'
+
+    def __init__(self):
+        self.oids = {}  # oid -> [revisions, first tid, last tid]
+        self.lifetimes = {}  # log2(seconds) -> revisions
+
+    def _add_lifetime(self, tid, next_tid):
+        seconds = (TimeStamp(next_tid).timeTime() -
+                   TimeStamp(tid).timeTime())
+        b = math.frexp(seconds)[1] if seconds >= 1 else 0
+        self.lifetimes[b] = self.lifetimes.get(b, 0) + 1
+
+    def record(self, txn, record, klass):
+        info = self.oids.get(record.oid)
+        if info is None:
+            self.oids[record.oid] = [1, record.tid, record.tid]
+        else:
+            self._add_lifetime(info[2], record.tid)
+            info[0] += 1
+            info[2] = record.tid
+
+    def merge(self, later):
+        for b, n in later.lifetimes.items():
+            self.lifetimes[b] = self.lifetimes.get(b, 0) + n
+        for oid, (revisions, first, last) in later.oids.items():
+            info = self.oids.get(oid)
+            if info is None:
+                self.oids[oid] = [revisions, first, last]
+            else:
+                self._add_lifetime(info[2], first)
+                info[0] += revisions
+                info[2] = last
+
+    def result(self):
+        revisions = {}
+        for n, first, last in self.oids.values():
+            revisions[n] = revisions.get(n, 0) + 1
+        return {
+            'objects': len(self.oids),
+            'revisions': [[n, c] for n, c in sorted(revisions.items())],
+            'lifetimes': [[2 ** b, n]
+                          for b, n in sorted(self.lifetimes.items())],
+        }
+
+
+class NetSpace(Collector):
+    """Space used by current revisions and by older ones, per class
+
+    The space used by older revisions is an upper bound of what a pack
+    (to the present) could reclaim.
+    """
+
+    name = 'space'
+
+    def __init__(self):
+        self.current = {}  # oid -> (class, size)
+        self.old = {}  # class -> [revisions, bytes]
+
+    def _replaced(self, info):
+        if info is not None and info[0] is not None:
+            old = self.old.setdefault(info[0], [0, 0])
+            old[0] += 1
+            old[1] += info[1]
+
+    def record(self, txn, record, klass):
+        self._replaced(self.current.get(record.oid))
+        self.current[record.oid] = (
+            klass, 0 if record.data is None else len(record.data))
+
+    def merge(self, later):
+        for klass, (revisions, size) in later.old.items():
+            old = self.old.setdefault(klass, [0, 0])
+            old[0] += revisions
+            old[1] += size
+        for oid, info in later.current.items():
+            self._replaced(self.current.get(oid))
+            self.current[oid] = info
+
+    def result(self):
+        result = {}
+        for klass, size in self.current.values():
+            if klass is not None:
+                r = result.setdefault(klass, dict.fromkeys(
+                    ('objects', 'bytes', 'old_revisions', 'old_bytes'), 0))
+                r['objects'] += 1
+                r['bytes'] += size
+        for klass, (revisions, size) in self.old.items():
+            r = result.setdefault(klass, dict.fromkeys(
+                ('objects', 'bytes', 'old_revisions', 'old_bytes'), 0))
+            r['old_revisions'] += revisions
+            r['old_bytes'] += size
+        return dict(sorted(result.items()))
+
+
+class DanglingReferences(Collector):
+    """References from current revisions to objects that don't exist
+    """
+
+    name = 'dangling'
+
+    def __init__(self):
+        self.refs = {}  # oid -> referenced oids, or None if deleted
+
+    def record(self, txn, record, klass):
+        if record.data is None:
+            self.refs[record.oid] = None
+        else:
+            self.refs[record.oid] = tuple(referencesf(record.data))
+
+    def merge(self, later):
+        self.refs.update(later.refs)
+
+    def result(self):
+        refs = self.refs
+        dangling = []
+        for oid, referenced in sorted(refs.items()):
+            for ref in referenced or ():
+                if refs.get(ref) is None:
+                    dangling.append([oid_repr(oid), oid_repr(ref)])
+        return dangling
+
+
+collectors = {
+    factory.name: factory
+    for factory in (ClassHistogram, RecordSizes, RevisionLifetimes,
+                    NetSpace, DanglingReferences)
+}
+
+
+def _analyze_range(path, trange, names):
+    stats = [collectors[name]() for name in names]
+    transactions = records = 0
+    it = parallel.iterator(path, trange)
+    try:
+        for txn in it:
+            transactions += 1
+            for collector in stats:
+                collector.transaction(txn)
+            for record in txn:
+                records += 1
+                klass = (None if record.data is None
+                         else record_class(record.data))
+                for collector in stats:
+                    collector.record(txn, record, klass)
+    finally:
+        it.close()
+    return transactions, records, stats
+
+
+def analyze(path, names=None, jobs=1):
+    """Analyze a file storage with the named collectors.
+
+    If no names are given, all collectors are used.  If jobs is more
+    than 1, the file is split in ranges of transactions that are
+    analyzed in separate processes.
+
+    Return a dictionary of plain data with the totals and the results
+    of the collectors.
+    """
+    if names is None:
+        names = sorted(collectors)
+    for name in names:
+        if name not in collectors:
+            raise ValueError("Unknown collector", name)
+
+    results = parallel.map_ranges(path, _analyze_range, jobs, names)
+    transactions, records, stats = results[0]
+    for t, r, later in results[1:]:
+        transactions += t
+        records += r
+        for collector, other in zip(stats, later):
+            collector.merge(other)
+
+    return {
+        'path': path,
+        'transactions': transactions,
+        'records': records,
+        'collectors': {c.name: c.result() for c in stats},
+    }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Gather statistics about a FileStorage in a single pass"
+                    " and write them as JSON.")
+    parser.add_argument('path', help="The FileStorage file to analyze")
+    parser.add_argument(
+        '-c', '--collector', action='append', dest='collectors',
+        choices=sorted(collectors),
+        help="A collector to use; may be given more than once."
+             " Defaults to all collectors.")
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=1,
+        help="Number of processes used to analyze the file. Default: 1")
+    parser.add_argument(
+        '-o', '--output',
+        help="Write the results to this file instead of standard output")
+    options = parser.parse_args(args)
+
+    result = analyze(options.path, options.collectors, options.jobs)
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(result, f, indent=1)
+    else:
+        json.dump(result, sys.stdout, indent=1)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -13,6 +13,7 @@
 ##############################################################################
 
 import ZODB.FileStorage
+from ZODB.FileStorage import parallel
 from ZODB.serialize import get_refs
 from ZODB.TimeStamp import TimeStamp
 from ZODB.utils import get_pickle_metadata
@@ -134,13 +135,42 @@ class Tracer:
             print("       ", msg)
 
     # Do the analysis.
-    def run(self):
-        """Find all occurrences of the registered oids in the database."""
+    def run(self, jobs=1):
+        """Find all occurrences of the registered oids in the database.
+
+        If jobs is more than 1, the file is split in ranges of transactions
+        that are read by separate processes.
+        """
 
         # Maps oid of a reference to its module.class name.
         self._ref2name = {}
-        for txn in ZODB.FileStorage.FileIterator(self.path):
-            self._check_trec(txn)
+        # (index in msgs, ref) for references whose class wasn't known.
+        self._unknown = []
+        if jobs > 1:
+            for tracer in parallel.map_ranges(
+                    self.path, _trace_range, jobs, self.oids):
+                self._merge(tracer)
+        else:
+            for txn in ZODB.FileStorage.FileIterator(self.path):
+                self._check_trec(txn)
+
+    # Add the findings of a tracer that ran on the transactions right
+    # after ours.
+    def _merge(self, other):
+        # A reference class unknown in other's range may have been seen
+        # in ours.
+        msgs = other.msgs
+        for i, ref in other._unknown:
+            klass = self._ref2name.get(ref)
+            if klass is not None:
+                oid, tid, msg = msgs[i]
+                msgs[i] = oid, tid, msg.replace("<unknown>", klass, 1)
+        self.msgs.extend(msgs)
+        self.tid2info.update(other.tid2info)
+        for oid, n in other.oids.items():
+            self.oids[oid] += n
+        self.oid2name.update(other.oid2name)
+        self._ref2name.update(other._ref2name)
 
     # Process next transaction record.
     def _check_trec(self, txn):
@@ -202,6 +232,7 @@ class Tracer:
                             # we may still got "<unknown>" class name.
                             if r is None:
                                 klass = "<unknown>"
+                                self._unknown.append((len(self.msgs), ref))
                             else:
                                 ref2name[ref] = klass = get_class(r.data)
                     elif isinstance(klass, tuple):
@@ -211,3 +242,18 @@ class Tracer:
 
                     self._msg(oid, tid, "references", oid_repr(ref), klass,
                               "at", pos)
+
+
+def _trace_range(path, trange, oids):
+    tracer = Tracer(path)
+    tracer.oids.update(oids)
+    tracer._ref2name = {}
+    tracer._unknown = []
+    it = parallel.iterator(path, trange)
+    try:
+        for txn in it:
+            tracer._check_trec(txn)
+    finally:
+        it.close()
+    tracer._records = tracer._records_map = None
+    return tracer
@@ -26,21 +26,36 @@ a backpointer after that time.
 
 import binascii
 import logging
+import mmap
 import os
+import tempfile
+import time
+from array import array
 
 import ZODB.fsIndex
 import ZODB.POSException
+from ZODB._compat import Pickler
+from ZODB._compat import Unpickler
+from ZODB._compat import _protocol
 from ZODB.FileStorage.format import TRANS_HDR_LEN
 from ZODB.FileStorage.format import CorruptedDataError
 from ZODB.FileStorage.format import DataHeader
 from ZODB.FileStorage.format import FileStorageFormatter
 from ZODB.utils import p64
+from ZODB.utils import readable_tid_repr
 from ZODB.utils import u64
 from ZODB.utils import z64
 
 
 logger = logging.getLogger(__name__)
 
+# The packer copies transactions committed while it runs in catch-up
+# rounds, without the commit lock.  Once fewer than FINAL_BYTES are
+# left, or after MAX_CATCH_UP_ROUNDS rounds, the rest is copied while
+# holding the commit lock.
+FINAL_BYTES = 1 << 20
+MAX_CATCH_UP_ROUNDS = 10
+
 
 class PackError(ZODB.POSException.POSError):
     pass
@@ -152,9 +167,190 @@ class PackCopier(FileStorageFormatter):
             self._file.seek(pos)
 
 
+class Throttle:
+    """Limit the rate at which pack reads the storage file
+
+    Calling a throttle with a number of bytes read sleeps long enough
+    to keep the average rate under ``rate`` bytes per second.  A rate
+    of None doesn't limit anything.
+    """
+
+    def __init__(self, rate=None):
+        self.rate = rate
+        self.start = time.monotonic()
+        self.bytes = 0
+
+    def __call__(self, nbytes):
+        if not self.rate:
+            return
+        self.bytes += nbytes
+        delay = self.bytes / self.rate - (time.monotonic() - self.start)
+        if delay > .01:
+            time.sleep(delay)
+
+
+# Oids from this one on are kept in memory by PosArray.
+MAX_ARRAY_OID = 1 << 32
+
+# Default bytes of oids to visit kept in memory by low-memory GC
+STACK_MEMORY = 16 << 20
+
+
+class PosArray:
+    """A mapping from oids to file positions in a memory-mapped file
+
+    The position of the object with oid n is stored in 8 bytes at
+    offset 8 * n, 0 meaning that there is no position.  Oids are
+    allocated sequentially, so the array is dense.  The file is
+    sparse until positions are stored and its pages can be evicted by
+    the operating system, so the array needs little memory, however
+    many objects there are.  Oids from MAX_ARRAY_OID on are kept in a
+    dictionary.
+
+    If length is given, the array already stored in the file is used,
+    with its overflow dictionary.
+    """
+
+    def __init__(self, path, length=None, overflow=None):
+        self.path = path
+        if length is None:
+            self._file = open(path, 'w+b')
+            self._len = 0
+            self._overflow = {}
+        else:
+            self._file = open(path, 'r+b')
+            self._len = length
+            self._overflow = overflow
+        self._map = None
+        self._size = 0
+        self._remap(os.fstat(self._file.fileno()).st_size)
+
+    def _remap(self, size):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if size > self._size:
+            self._file.truncate(size)
+        self._size = size
+        if size:
+            self._map = mmap.mmap(self._file.fileno(), size)
+
+    def _offset(self, oid):
+        n = u64(oid)
+        if n >= MAX_ARRAY_OID:
+            return None
+        return n * 8
+
+    def get(self, oid, default=None):
+        offset = self._offset(oid)
+        if offset is None:
+            return self._overflow.get(oid, default)
+        if offset >= self._size:
+            return default
+        return u64(self._map[offset:offset + 8]) or default
+
+    def __getitem__(self, oid):
+        pos = self.get(oid)
+        if pos is None:
+            raise KeyError(oid)
+        return pos
+
+    def __contains__(self, oid):
+        return self.get(oid) is not None
+
+    def __setitem__(self, oid, pos):
+        offset = self._offset(oid)
+        if offset is None:
+            if oid not in self._overflow:
+                self._len += 1
+            self._overflow[oid] = pos
+            return
+        if offset >= self._size:
+            size = max(offset + 8, self._size * 2, 1 << 20)
+            self._remap(size + -size % mmap.ALLOCATIONGRANULARITY)
+        if self._map[offset:offset + 8] == z64:
+            self._len += 1
+        self._map[offset:offset + 8] = p64(pos)
+
+    def __delitem__(self, oid):
+        offset = self._offset(oid)
+        if offset is None:
+            del self._overflow[oid]
+        elif self.get(oid) is None:
+            raise KeyError(oid)
+        else:
+            self._map[offset:offset + 8] = z64
+        self._len -= 1
+
+    def __len__(self):
+        return self._len
+
+    def flush(self):
+        if self._map is not None:
+            self._map.flush()
+
+    def close(self, remove=True):
+        if self._file.closed:
+            return
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+        if remove:
+            os.remove(self.path)
+
+
+class OidStack:
+    """A stack of oids that spills to a file beyond a memory limit
+
+    Oids are kept as 64-bit integers.  When they take more than
+    ``limit`` bytes, the older half is written to a temporary file in
+    ``directory``, to be read back once the oids in memory are popped.
+    A limit of None keeps all oids in memory.
+    """
+
+    def __init__(self, limit=None, directory=None):
+        self.limit = limit
+        self.directory = directory
+        self._items = array('Q')
+        self._file = None
+        self._chunks = []  # numbers of oids spilled
+
+    def __len__(self):
+        return len(self._items) + sum(self._chunks)
+
+    def push(self, oid):
+        items = self._items
+        items.append(u64(oid))
+        if self.limit and len(items) * items.itemsize > self.limit:
+            if self._file is None:
+                self._file = tempfile.TemporaryFile(dir=self.directory)
+            n = len(items) // 2
+            self._file.seek(0, 2)
+            items[:n].tofile(self._file)
+            del items[:n]
+            self._chunks.append(n)
+
+    def pop(self):
+        items = self._items
+        if not items and self._chunks:
+            n = self._chunks.pop()
+            self._file.seek(-n * items.itemsize, 2)
+            items.fromfile(self._file, n)
+            self._file.seek(-n * items.itemsize, 2)
+            self._file.truncate()
+        return p64(items.pop())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
 class GC(FileStorageFormatter):
 
-    def __init__(self, file, eof, packtime, gc, referencesf):
+    def __init__(self, file, eof, packtime, gc, referencesf, throttle=None,
+                 low_memory=False, stack_memory=STACK_MEMORY):
         self._file = file
         self._name = file.name
         self.eof = eof
@@ -163,6 +359,13 @@ class GC(FileStorageFormatter):
         # packpos: position of first txn header after pack time
         self.packpos = None
 
+        # In low-memory mode, oid2curpos and reachable are PosArrays
+        # in files next to the storage file, created by findReachable,
+        # and the oids to visit beyond stack_memory bytes are spilled
+        # to a temporary file.
+        self.low_memory = low_memory
+        self.stack_memory = stack_memory
+
         # {oid -> current data record position}:
         self.oid2curpos = ZODB.fsIndex.fsIndex()
 
@@ -177,6 +380,9 @@ class GC(FileStorageFormatter):
         # for which we must keep multiple revisions.
         self.reachable = ZODB.fsIndex.fsIndex()
         self.reach_ex = {}
+        self.throttle = throttle or Throttle()
+        if low_memory:
+            self.oid2curpos = self.reachable = None
 
         # keep ltid for consistency checks during initial scan
         self.ltid = z64
@@ -194,16 +400,47 @@ class GC(FileStorageFormatter):
         return pos in self.reach_ex.get(oid, [])
 
     def findReachable(self):
+        if self.low_memory:
+            self.oid2curpos = PosArray(self._name + '.pack_oid2curpos')
+            if self.gc:
+                self.reachable = PosArray(self._name + '.pack_reachable')
         self.buildPackIndex()
         if self.gc:
             self.findReachableAtPacktime([z64])
             self.findReachableFromFuture()
             # These mappings are no longer needed and may consume a lot of
             # space.
+            if self.low_memory:
+                self.oid2curpos.close()
             del self.oid2curpos
         else:
             self.reachable = self.oid2curpos
 
+    def reachableState(self):
+        """Return the reachable revisions as data to checkpoint"""
+        if self.low_memory:
+            # The array is kept in its file.
+            reachable = self.reachable
+            reachable.flush()
+            return reachable.path, len(reachable), reachable._overflow
+        return self.reachable.buckets()
+
+    def setReachableState(self, state):
+        """Restore the reachable revisions from reachableState()"""
+        if self.low_memory:
+            self.reachable = PosArray(*state)
+        else:
+            self.reachable.update_buckets(state)
+
+    def close(self, keep=False):
+        """Close the files used in low-memory mode
+
+        They are removed, unless keep is true.
+        """
+        for index in (getattr(self, 'oid2curpos', None), self.reachable):
+            if isinstance(index, PosArray):
+                index.close(remove=not keep)
+
     def buildPackIndex(self):
         pos = 4
         # We make the initial assumption that the database has been
@@ -240,6 +477,7 @@ class GC(FileStorageFormatter):
                           "match initial transaction length: %d != %d",
                           tlen, th.tlen)
             pos += 8
+            self.throttle(th.tlen + 8)
 
         self.packpos = pos
 
@@ -266,24 +504,30 @@ class GC(FileStorageFormatter):
         reachable = self.reachable
         oid2curpos = self.oid2curpos
 
-        todo = list(roots)
-        while todo:
-            oid = todo.pop()
-            if oid in reachable:
-                continue
-
-            try:
-                pos = oid2curpos[oid]
-            except KeyError:
-                if oid == z64 and len(oid2curpos) == 0:
-                    # special case, pack to before creation time
+        todo = OidStack(self.stack_memory if self.low_memory else None,
+                        os.path.dirname(self._name))
+        try:
+            for oid in roots:
+                todo.push(oid)
+            while todo:
+                oid = todo.pop()
+                if oid in reachable:
                     continue
-                raise KeyError(oid)
 
-            reachable[oid] = pos
-            for oid in self.findrefs(pos):
-                if oid not in reachable:
-                    todo.append(oid)
+                try:
+                    pos = oid2curpos[oid]
+                except KeyError:
+                    if oid == z64 and len(oid2curpos) == 0:
+                        # special case, pack to before creation time
+                        continue
+                    raise KeyError(oid)
+
+                reachable[oid] = pos
+                for oid in self.findrefs(pos):
+                    if oid not in reachable:
+                        todo.push(oid)
+        finally:
+            todo.close()
 
     def findReachableFromFuture(self):
         # In this pass, the roots are positions of object revisions.
@@ -322,6 +566,7 @@ class GC(FileStorageFormatter):
                           "match initial transaction length: %d != %d",
                           tlen, th.tlen)
             pos += 8
+            self.throttle(th.tlen + 8)
 
         for pos in extra_roots:
             refs = self.findrefs(pos)
@@ -346,13 +591,30 @@ class FileStoragePacker(FileStorageFormatter):
     # current_size is the storage's _pos.  All valid data at the start
     # lives before that offset (there may be a checkpoint transaction in
     # progress after it).
-
-    def __init__(self, storage, referencesf, stop, gc=True):
+    # rate limits the bytes read per second, except while the commit
+    # lock is held.
+    # progress, if given, is called with a phase name ('copy',
+    # 'catch-up', 'paused' or 'final'), the position reached in the
+    # storage file and the file size after each round of copying.
+    # checkpoint_bytes, if given, makes the pack resumable: the GC
+    # results and the copy progress, every checkpoint_bytes of input,
+    # are saved in a .pack_checkpoint file.
+    # time_budget, if given, is the number of seconds of copying data
+    # before the pack time, not counting GC, after which the pack
+    # stops, raising PackInterrupted.
+    # resumed, if given, is a threading.Event cleared to pause the pack.
+    # low_memory makes GC keep its indexes in memory-mapped files and
+    # at most gc_stack_memory bytes of oids to visit in memory.
+
+    def __init__(self, storage, referencesf, stop, gc=True,
+                 rate=None, progress=None, checkpoint_bytes=None,
+                 time_budget=None, resumed=None, low_memory=False,
+                 gc_stack_memory=None):
         self._storage = storage
         if storage.blob_dir:
             self.pack_blobs = True
             self.blob_removed = open(
-                os.path.join(storage.blob_dir, '.removed'), 'wb')
+                os.path.join(storage.blob_dir, '.removed'), 'ab')
         else:
             self.pack_blobs = False
             self.blob_removed = None
@@ -366,10 +628,20 @@ class FileStoragePacker(FileStorageFormatter):
         self._file = open(path, "rb")
         self._path = path
         self._stop = stop
+        self._gc = gc
+        self.checkpoint_path = path + '.pack_checkpoint'
+        self.checkpoint_bytes = checkpoint_bytes
+        self.time_budget = time_budget
+        self.resumed = resumed
+        self.started = None  # when the copy to the pack time started
         self.locked = False
         self.file_end = storage.getSize()
+        self.throttle = Throttle(rate)
+        self.progress = progress
 
-        self.gc = GC(self._file, self.file_end, self._stop, gc, referencesf)
+        self.gc = GC(self._file, self.file_end, self._stop, gc, referencesf,
+                     self.throttle, low_memory,
+                     gc_stack_memory or STACK_MEMORY)
 
         # The packer needs to acquire the parent's commit lock
         # during the copying stage, so the two sets of lock acquire
@@ -389,6 +661,9 @@ class FileStoragePacker(FileStorageFormatter):
         self.toid2tid_delete = {}
 
         self._tfile = None
+        self._start = self._metadata_size, self._metadata_size
+        self._checkpoint_file = None
+        self._checkpointed = None
 
     def close(self):
         self._file.close()
@@ -396,6 +671,10 @@ class FileStoragePacker(FileStorageFormatter):
             self._tfile.close()
         if self.blob_removed is not None:
             self.blob_removed.close()
+        if self._checkpoint_file is not None:
+            self._checkpoint_file.close()
+        # Keep the reachable revisions of an interrupted pack to resume.
+        self.gc.close(keep=self._checkpointed is not None)
 
     def pack(self):
         # Pack copies all data reachable at the pack time or later.
@@ -411,7 +690,9 @@ class FileStoragePacker(FileStorageFormatter):
 
         # TODO:  Should add sanity checking to pack.
 
-        self.gc.findReachable()
+        resumed = self.checkpoint_bytes and self.loadCheckpoint()
+        if not resumed:
+            self.gc.findReachable()
 
         def close_files_remove():
             # blank except: we might be in an IOError situation/handler
@@ -424,58 +705,78 @@ class FileStoragePacker(FileStorageFormatter):
                 self._file.close()
             except:  # noqa: E722 do not use bare 'except'
                 pass
-            try:
-                os.remove(self._name + ".pack")
-            except:  # noqa: E722 do not use bare 'except'
-                pass
+            if self._checkpointed is None:
+                try:
+                    os.remove(self._name + ".pack")
+                except:  # noqa: E722 do not use bare 'except'
+                    pass
+            # else keep the .pack file to resume from the checkpoint
             if self.blob_removed is not None:
                 self.blob_removed.close()
+            if self._checkpoint_file is not None:
+                self._checkpoint_file.close()
 
-        # Setup the destination file and copy the metadata.
-        # TODO:  rename from _tfile to something clearer.
-        self._tfile = open(self._name + ".pack", "w+b")
         try:
-            self._file.seek(0)
-            self._tfile.write(self._file.read(self._metadata_size))
+            if resumed:
+                self._tfile = open(self._name + ".pack", "r+b")
+                self._resume(*self._checkpointed)
+            else:
+                # Setup the destination file and copy the metadata.
+                # TODO:  rename from _tfile to something clearer.
+                self._tfile = open(self._name + ".pack", "w+b")
+                self._file.seek(0)
+                self._tfile.write(self._file.read(self._metadata_size))
+                if self.blob_removed is not None:
+                    self.blob_removed.truncate(0)
+                if self.checkpoint_bytes:
+                    self.saveCheckpoint()
 
             self._copier = PackCopier(self._tfile, self.index, self.tindex)
 
+            # The time budget covers the copy, not GC.
+            self.started = time.monotonic()
             ipos, opos = self.copyToPacktime()
-        except OSError:
-            # most probably ran out of disk space or some other IO error
+        except (OSError, ZODB.POSException.StorageError):
+            # most probably ran out of disk space or some other IO
+            # error, or the pack was interrupted
             close_files_remove()
             raise  # don't succeed silently
 
         assert ipos == self.gc.packpos
+        self.removeCheckpoint()
         if ipos == opos:
             # pack didn't free any data.  there's no point in continuing.
             close_files_remove()
             return None
-        self._commit_lock.acquire()
-        self.locked = True
+        self._report('copy', ipos)
         try:
-            with self._lock:
-                # Re-open the file in unbuffered mode.
-
-                # The main thread may write new transactions to the
-                # file, which creates the possibility that we will
-                # read a status 'c' transaction into the pack thread's
-                # stdio buffer even though we're acquiring the commit
-                # lock.  Transactions can still be in progress
-                # throughout much of packing, and are written to the
-                # same physical file but via a distinct Python file
-                # object.  The code used to leave off the trailing 0
-                # argument, and then on every platform except native
-                # Windows it was observed that we could read stale
-                # data from the tail end of the file.
-                self._file.close()  # else self.gc keeps the original
-                # alive & open
-                self._file = open(self._path, "rb", 0)
-                self._file.seek(0, 2)
-                self.file_end = self._file.tell()
+            # Re-open the file in unbuffered mode.
+
+            # The main thread may write new transactions to the
+            # file, which creates the possibility that we will
+            # read a status 'c' transaction into the pack thread's
+            # stdio buffer even though we're acquiring the commit
+            # lock.  Transactions can still be in progress
+            # throughout much of packing, and are written to the
+            # same physical file but via a distinct Python file
+            # object.  The code used to leave off the trailing 0
+            # argument, and then on every platform except native
+            # Windows it was observed that we could read stale
+            # data from the tail end of the file.
+            self._file.close()  # else self.gc keeps the original
+            # alive & open
+            self._file = open(self._path, "rb", 0)
+
+            ipos = self.catchUp(ipos)
+
+            self._commit_lock.acquire()
+            self.locked = True
+            self._file.seek(0, 2)
+            self.file_end = self._file.tell()
 
             if ipos < self.file_end:
                 self.copyRest(ipos)
+            self._report('final', self.file_end)
 
             # OK, we've copied everything. Now we need to wrap things up.
             pos = self._tfile.tell()
@@ -498,10 +799,10 @@ class FileStoragePacker(FileStorageFormatter):
             raise
 
     def copyToPacktime(self):
-        pos = self._metadata_size
-        new_pos = pos
+        pos, new_pos = self._start
 
         while pos < self.gc.packpos:
+            self._pause(pos, new_pos)
             th = self._read_txn_header(pos)
             new_tpos, pos = self.copyDataRecords(pos, th)
 
@@ -520,9 +821,187 @@ class FileStoragePacker(FileStorageFormatter):
                           "match initial transaction length: %d != %d",
                           tlen, th.tlen)
             pos += 8
+            self.throttle(th.tlen + 8)
+            if (self.checkpoint_bytes and
+                    pos - self._checkpointed[0] >= self.checkpoint_bytes):
+                self.recordProgress(pos, new_pos)
 
         return pos, new_pos
 
+    # Checkpoints make the copy to the pack time resumable.  A
+    # checkpoint file starts with the GC results, followed by progress
+    # records.  Each progress record holds the input and output
+    # positions of a txn boundary and the size of the blob .removed
+    # file at that point.
+
+    def _fingerprint(self, eof):
+        # Identify the input file by the last txn found by GC.
+        if eof <= self._metadata_size:
+            return eof, None
+        th = self._read_txn_header(eof - 8 - self._read_num(eof - 8))
+        return eof, th.tid
+
+    def saveCheckpoint(self):
+        """Save the GC results in a new checkpoint file"""
+        gc = self.gc
+        state = dict(
+            packtime=gc.packtime,
+            gc=self._gc,
+            low_memory=gc.low_memory,
+            packpos=gc.packpos,
+            fingerprint=self._fingerprint(gc.eof),
+            reachable=gc.reachableState(),
+            reach_ex=gc.reach_ex,
+            )
+        self._checkpoint_file = open(self.checkpoint_path, 'wb')
+        pickler = Pickler(self._checkpoint_file, _protocol)
+        pickler.fast = True
+        pickler.dump(state)
+        self.recordProgress(self._metadata_size, self._metadata_size)
+
+    def recordProgress(self, ipos, opos):
+        """Record that all txns before ipos were copied"""
+        self._tfile.flush()
+        os.fsync(self._tfile.fileno())
+        removed = 0
+        if self.blob_removed is not None:
+            self.blob_removed.flush()
+            os.fsync(self.blob_removed.fileno())
+            removed = self.blob_removed.tell()
+        self._checkpointed = ipos, opos, removed
+        Pickler(self._checkpoint_file, _protocol).dump(self._checkpointed)
+        self._checkpoint_file.flush()
+        os.fsync(self._checkpoint_file.fileno())
+
+    def loadCheckpoint(self):
+        """Load a checkpoint left by an interrupted pack
+
+        The checkpoint is only used if it was made with the same GC
+        option and a pack time no later than ours, and if the file
+        it was made for is unchanged.  The pack then completes to the
+        checkpoint's pack time.  Returns whether it's used.
+        """
+        try:
+            f = open(self.checkpoint_path, 'rb')
+        except FileNotFoundError:
+            return False
+        with f:
+            unpickler = Unpickler(f)
+            try:
+                state = unpickler.load()
+                progress = unpickler.load()
+            except Exception:
+                logger.warning("Ignoring unreadable pack checkpoint %s",
+                               self.checkpoint_path)
+                return False
+            while 1:
+                try:
+                    progress = unpickler.load()
+                except Exception:
+                    # at the end, possibly of a torn last record
+                    break
+
+        eof, tid = state['fingerprint']
+        if (state['gc'] != self._gc or state['packtime'] > self._stop or
+                state['low_memory'] != self.gc.low_memory or
+                eof > self.file_end):
+            return False
+        try:
+            if (self._fingerprint(eof) != (eof, tid) or
+                    os.path.getsize(self._name + '.pack') < progress[1] or
+                    self._backBefore(eof, state['packpos'])):
+                return False
+            self.gc.setReachableState(state['reachable'])
+        except (OSError, CorruptedDataError):
+            return False
+
+        gc = self.gc
+        gc.eof = eof
+        gc.packtime = state['packtime']
+        gc.packpos = state['packpos']
+        gc.reach_ex = state['reach_ex']
+        self._checkpointed = progress
+        if state['packtime'] < self._stop:
+            logger.warning(
+                "Resuming pack of %s to %s, earlier than the requested %s,"
+                " from position %d", self._name,
+                readable_tid_repr(state['packtime']),
+                readable_tid_repr(self._stop), progress[0])
+        else:
+            logger.info("Resuming pack of %s to %s from position %d",
+                        self._name, readable_tid_repr(state['packtime']),
+                        progress[0])
+        return True
+
+    def _backBefore(self, pos, packpos):
+        # Return whether a txn committed after the checkpointed GC,
+        # such as an undo, points back before the pack time.  Records
+        # it revives may not have been found reachable.
+        while pos < self.file_end:
+            th = self._read_txn_header(pos)
+            tend = pos + th.tlen
+            pos += th.headerlen()
+            while pos < tend:
+                h = self._read_data_header(pos)
+                if h.back and h.back < packpos:
+                    return True
+                pos += h.recordlen()
+            pos += 8
+        return False
+
+    def _resume(self, ipos, opos, removed):
+        # Discard what was written after the checkpoint and rebuild
+        # the index of the records copied before it.
+        self._tfile.truncate(opos)
+        self._tfile.seek(opos)
+        if self.blob_removed is not None:
+            self.blob_removed.truncate(removed)
+        reader = FileStorageFormatter()
+        reader._file = self._tfile
+        reader._name = self._tfile.name
+        pos = self._metadata_size
+        while pos < opos:
+            th = reader._read_txn_header(pos)
+            tend = pos + th.tlen
+            pos += th.headerlen()
+            while pos < tend:
+                h = reader._read_data_header(pos)
+                self.index[h.oid] = pos
+                pos += h.recordlen()
+            pos += 8
+        self._tfile.seek(opos)
+        self._checkpoint_file = open(self.checkpoint_path, 'ab')
+        self._start = ipos, opos
+
+    def removeCheckpoint(self):
+        if self._checkpoint_file is not None:
+            self._checkpoint_file.close()
+            self._checkpoint_file = None
+            self._checkpointed = None
+            os.remove(self.checkpoint_path)
+
+    def _pause(self, ipos, opos=None):
+        # Wait while the pack is paused and stop once the time
+        # budget is spent.  The pause and the stop are recorded in
+        # the checkpoint, if any, when copying to the pack time.
+        if self.resumed is not None and not self.resumed.is_set():
+            if opos is not None and self.checkpoint_bytes:
+                self.recordProgress(ipos, opos)
+            self._report('paused', ipos)
+            paused = time.monotonic()
+            self.resumed.wait()
+            paused = time.monotonic() - paused
+            self.started += paused
+            self.throttle.start += paused
+        if (opos is not None and self.time_budget is not None and
+                time.monotonic() - self.started > self.time_budget):
+            if self.checkpoint_bytes:
+                self.recordProgress(ipos, opos)
+            # Delayed import to cope with circular imports.
+            from ZODB.FileStorage.FileStorage import PackInterrupted
+            raise PackInterrupted(
+                "The pack time budget was spent at position %d" % ipos)
+
     def copyDataRecords(self, pos, th):
         """Copy any current data records between pos and tend.
 
@@ -618,13 +1097,49 @@ class FileStoragePacker(FileStorageFormatter):
             # This is a George Bailey event.
             self._tfile.write(z64)
 
+    def _report(self, phase, pos):
+        if self.progress is not None:
+            self.progress(phase, pos, self.file_end)
+
+    def catchUp(self, ipos):
+        """Copy the txns committed since the pack started
+
+        The txns are copied in rounds without holding the commit lock,
+        so that commits can proceed.  Each round copies the txns
+        committed before it started.  Rounds stop when the txns left
+        to copy are small enough to be copied with the commit lock
+        held, or if commits outpace the pack.
+
+        Returns the position of the first txn not copied.
+        """
+        for n in range(1, MAX_CATCH_UP_ROUNDS + 1):
+            with self._lock:
+                # Only txns before the storage's _pos are finished.
+                self.file_end = self._storage._pos
+            if self.file_end - ipos <= FINAL_BYTES:
+                break
+            logger.info("pack catch-up round %d: copying %d bytes",
+                        n, self.file_end - ipos)
+            while ipos < self.file_end:
+                self._pause(ipos)
+                start = ipos
+                ipos = self.copyOne(ipos)
+                self.throttle(ipos - start)
+            self._report('catch-up', ipos)
+        return ipos
+
     def copyRest(self, ipos):
         # After the pack time, all data records are copied.
         # Copy one txn at a time, using copy() for data.
+        # The commit lock is held, so this copies to the end of the file.
+        # If commits outpaced the catch-up rounds, the lock is released
+        # while copying each txn until at most FINAL_BYTES are left, so
+        # that the step holding it stays bounded.
 
         try:
             while 1:
-                ipos = self.copyOne(ipos)
+                release = self._storage._pos - ipos > FINAL_BYTES
+                ipos = self.copyOne(ipos, release)
         except CorruptedDataError as err:
             # The last call to copyOne() will raise
             # CorruptedDataError, because it will attempt to read past
@@ -634,13 +1149,16 @@ class FileStoragePacker(FileStorageFormatter):
             endpos = self._file.tell()
             if endpos != err.pos:
                 raise
+            self.file_end = endpos
 
-    def copyOne(self, ipos):
+    def copyOne(self, ipos, release=False):
         # The call below will raise CorruptedDataError at EOF.
         th = self._read_txn_header(ipos)
-        # Release commit lock while writing to pack file
-        self._commit_lock.release()
-        self.locked = False
+        if release:
+            # Release commit lock while writing to pack file
+            self._commit_lock.release()
+            self.locked = False
+        start = ipos
         pos = self._tfile.tell()
         self._copier.setTxnPos(pos)
         self._tfile.write(th.asString())
@@ -668,6 +1186,8 @@ class FileStoragePacker(FileStorageFormatter):
 
         self.index.update(self.tindex)
         self.tindex.clear()
-        self._commit_lock.acquire()
-        self.locked = True
+        if release:
+            self.throttle(ipos - start)
+            self._commit_lock.acquire()
+            self.locked = True
         return ipos
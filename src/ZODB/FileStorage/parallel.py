@@ -0,0 +1,110 @@
+##############################################################################
+#
+# Copyright (c) 2026 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Scan a FileStorage file with several processes.
+
+Tools that read a whole file storage (fsanalyze, fstest, fsoids, ...)
+are limited by how fast a single process can parse records.  split()
+cuts a file in ranges of transactions of about the same size, reading
+only transaction headers, and map_ranges() processes the ranges in
+worker processes and returns their results in file order.
+"""
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from ZODB.FileStorage.FileStorage import FileIterator
+from ZODB.FileStorage.FileStorage import FileStorageFormatError
+from ZODB.FileStorage.FileStorage import packed_version
+from ZODB.FileStorage.format import TRANS_HDR_LEN
+from ZODB.FileStorage.format import TxnHeaderFromString
+from ZODB.utils import z64
+
+
+TransactionRange = namedtuple(
+    'TransactionRange', ['pos', 'end', 'index', 'prev_tid', 'last_tid'])
+TransactionRange.__doc__ = """A range of transactions in a FileStorage file
+
+pos is the offset of the first transaction in the range and end the
+offset just past its last transaction.  index is the number of
+transactions before the range, and prev_tid the id of the transaction
+just before it (z64 for the first range).  last_tid is the id of the
+last transaction in the range.
+
+For the last range, end and last_tid are None: it extends to the end of
+the file, including any transactions committed after the split.
+"""
+
+
+def split(file_name, n):
+    """Split a FileStorage file in at most n ranges of transactions
+
+    The ranges have about the same size in bytes and are returned in
+    file order.  Only transaction headers are read, trusting the
+    transaction lengths.  If a header looks damaged, the last range
+    extends from there, so that whoever processes it sees the damage.
+    """
+    with open(file_name, 'rb') as file:
+        if file.read(4) != packed_version:
+            raise FileStorageFormatError(file_name)
+        file.seek(0, 2)
+        size = file.tell()
+
+        step = max((size - 4) // max(n, 1), 1)
+        ranges = []
+        pos = start = 4
+        index = start_index = 0
+        tid = prev_tid = z64
+        while pos < size:
+            file.seek(pos)
+            h = file.read(TRANS_HDR_LEN)
+            if len(h) < TRANS_HDR_LEN:
+                break
+            h = TxnHeaderFromString(h)
+            if (h.status == 'c' or h.tlen < h.headerlen()
+                    or pos + h.tlen + 8 > size):
+                break
+            if pos - start >= step and len(ranges) < n - 1:
+                ranges.append(
+                    TransactionRange(start, pos, start_index, prev_tid, tid))
+                start, start_index, prev_tid = pos, index, tid
+            tid = h.tid
+            index += 1
+            pos += h.tlen + 8
+
+    ranges.append(TransactionRange(start, None, start_index, prev_tid, None))
+    return ranges
+
+
+def iterator(file_name, trange):
+    """Return a FileIterator over the transactions in a range
+    """
+    return FileIterator(file_name, stop=trange.last_tid, pos=trange.pos)
+
+
+def map_ranges(file_name, func, jobs, *args):
+    """Process a FileStorage file in up to jobs worker processes
+
+    The file is split in ranges and ``func(file_name, trange, *args)``
+    is called for each range in a worker process.  func, its arguments
+    and its result must be picklable.  The results are returned in file
+    order.  If there is a single range, func is called in the current
+    process.
+    """
+    ranges = split(file_name, jobs)
+    if len(ranges) == 1:
+        return [func(file_name, ranges[0], *args)]
+
+    with ProcessPoolExecutor(len(ranges)) as executor:
+        futures = [executor.submit(func, file_name, trange, *args)
+                   for trange in ranges]
+        return [future.result() for future in futures]
@@ -22,6 +22,7 @@ from zope.testing import renormalizing
 
 import ZODB.blob
 import ZODB.FileStorage
+import ZODB.FileStorage.parallel
 import ZODB.tests.util
 from ZODB.Connection import TransactionMetaData
 
@@ -314,6 +315,63 @@ check the data we added
     """
 
 
+def split_in_ranges():
+    """
+ZODB.FileStorage.parallel.split cuts a file in ranges of transactions
+of about the same size:
+
+    >>> from ZODB.FileStorage import parallel
+    >>> db = ZODB.DB('data.fs')
+    >>> conn = db.open()
+    >>> for i in range(30):
+    ...     conn.root()[i] = i
+    ...     transaction.commit()
+    >>> db.close()
+
+    >>> ranges = parallel.split('data.fs', 4)
+    >>> len(ranges)
+    4
+    >>> ranges[0].pos, ranges[0].prev_tid
+    (4, b'\\x00\\x00\\x00\\x00\\x00\\x00\\x00\\x00')
+    >>> all(r.end == n.pos and r.last_tid == n.prev_tid and r.index < n.index
+    ...     for r, n in zip(ranges, ranges[1:]))
+    True
+    >>> ranges[-1].end, ranges[-1].last_tid
+    (None, None)
+
+Iterating over the ranges gives all the transactions, in order:
+
+    >>> tids = [t.tid for t in ZODB.FileStorage.FileIterator('data.fs')]
+    >>> [t.tid for r in ranges for t in parallel.iterator('data.fs', r)
+    ...  ] == tids
+    True
+
+There can't be more ranges than transactions:
+
+    >>> len(parallel.split('data.fs', 100))
+    31
+    >>> parallel.split('data.fs', 1)
+    ... # doctest: +NORMALIZE_WHITESPACE
+    [TransactionRange(pos=4, end=None, index=0,
+      prev_tid=b'\\x00\\x00\\x00\\x00\\x00\\x00\\x00\\x00',
+      last_tid=None)]
+
+map_ranges calls a function for each range in worker processes, and
+returns the results in order:
+
+    >>> sum(parallel.map_ranges('data.fs', count_transactions, 4))
+    31
+    """
+
+
+def count_transactions(file_name, trange):
+    it = ZODB.FileStorage.parallel.iterator(file_name, trange)
+    try:
+        return sum(1 for t in it)
+    finally:
+        it.close()
+
+
 def test_suite():
     return unittest.TestSuite((
         doctest.DocFileSuite(
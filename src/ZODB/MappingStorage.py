@@ -15,8 +15,12 @@
 
 This storage provides an example implementation of a fairly full
 storage without distracting storage details.
+
+Its contents can be saved to a snapshot file and loaded from it,
+which is much faster than building them again, e.g. for test fixtures.
 """
 
+import pickle
 import time
 
 import BTrees
@@ -39,16 +43,23 @@ class MappingStorage:
     Note that this implementation is somewhat naive and inefficient
     with regard to locking.  Its implementation is primarily meant to
     be a simple illustration of storage implementation. It's also
-    useful for testing and exploration where scalability and efficiency
-    are unimportant.
+    useful for testing and exploration where scalability is unimportant.
+
+    The size of the storage is kept up to date as transactions are
+    committed.  Packing only looks for old revisions of objects that
+    have some, and garbage collection reuses the references of records
+    found by earlier packs.
     """
 
-    def __init__(self, name='MappingStorage'):
+    def __init__(self, name='MappingStorage', snapshot=None):
         """Create a mapping storage
 
         The name parameter is used by the
         :meth:`~ZODB.interfaces.IStorage.getName` and
         :meth:`~ZODB.interfaces.IStorage.sortKey` methods.
+
+        If a snapshot file name is given, the storage contents are
+        loaded from it (see :meth:`loadSnapshot`).
         """
         self.__name__ = name
         self._data = {}                               # {oid->{tid->pickle}}
@@ -61,6 +72,9 @@ class MappingStorage:
         self._opened = True
         self._transaction = None
         self._oid = 0
+        self._record_info = _RecordInfo()
+        if snapshot is not None:
+            self.loadSnapshot(snapshot)
 
     ######################################################################
     # Preconditions:
@@ -94,12 +108,7 @@ class MappingStorage:
     # ZODB.interfaces.IStorage
     @ZODB.utils.locked(opened)
     def getSize(self):
-        size = 0
-        for oid, tid_data in self._data.items():
-            size += 50
-            for tid, pickle in tid_data.items():
-                size += 100 + len(pickle)
-        return size
+        return self._record_info.size
 
     # ZEO.interfaces.IServeable
     @ZODB.utils.locked(opened)
@@ -201,42 +210,51 @@ class MappingStorage:
             raise ValueError("Already packed to a later time")
 
         self._last_pack = stop
-        transactions = self._transactions
+        data = self._data
+        info = self._record_info
 
-        # Step 1, remove old non-current records
-        for oid, tid_data in self._data.items():
+        # Step 1, remove old non-current records of objects that have some
+        for oid in list(info.history):
+            tid_data = data[oid]
             tids_to_remove = tid_data.keys(None, stop)
             if tids_to_remove:
                 tids_to_remove.pop()    # Keep the last, if any
-
-                if tids_to_remove:
-                    for tid in tids_to_remove:
-                        del tid_data[tid]
-                        if transactions[tid].pack(oid):
-                            del transactions[tid]
+                for tid in tids_to_remove:
+                    self._remove_record(oid, tid_data, tid)
+            if len(tid_data) < 2:
+                info.history.discard(oid)
 
         if gc:
-            # Step 2, GC.  A simple sweep+copy
-            new_data = BTrees.OOBTree.OOBTree()
-            to_copy = {ZODB.utils.z64}
-            while to_copy:
-                oid = to_copy.pop()
-                tid_data = self._data.pop(oid)
-                new_data[oid] = tid_data
-                for pickle in tid_data.values():
-                    for oid in referencesf(pickle):
-                        if oid in new_data:
-                            continue
-                        to_copy.add(oid)
-
-            # Remove left over data from transactions
-            for oid, tid_data in self._data.items():
-                for tid in tid_data:
-                    if transactions[tid].pack(oid):
-                        del transactions[tid]
-
-            self._data.clear()
-            self._data.update(new_data)
+            # Step 2, GC.  Mark the objects reachable from the root,
+            # using the references of records found by earlier packs.
+            reachable = {ZODB.utils.z64}
+            to_visit = [ZODB.utils.z64]
+            while to_visit:
+                oid = to_visit.pop()
+                tid_data = data.get(oid)
+                if not tid_data:
+                    continue
+                for tid, record in tid_data.items():
+                    for ref in info.references(
+                            oid, tid, record, referencesf):
+                        if ref not in reachable:
+                            reachable.add(ref)
+                            to_visit.append(ref)
+
+            # and sweep the others.
+            for oid in [oid for oid in data if oid not in reachable]:
+                tid_data = data.pop(oid)
+                for tid in list(tid_data):
+                    self._remove_record(oid, tid_data, tid)
+                info.history.discard(oid)
+                info.size -= 50
+
+    def _remove_record(self, oid, tid_data, tid):
+        info = self._record_info
+        info.size -= 100 + len(tid_data.pop(tid))
+        info.refs.pop((oid, tid), None)
+        if self._transactions[tid].pack(oid):
+            del self._transactions[tid]
 
     # ZODB.interfaces.IStorage
     def registerDB(self, db):
@@ -309,12 +327,7 @@ class MappingStorage:
         func(tid)
 
         tdata = self._tdata
-        for oid in tdata:
-            tid_data = self._data.get(oid)
-            if tid_data is None:
-                tid_data = BTrees.OOBTree.OOBucket()
-                self._data[oid] = tid_data
-            tid_data[tid] = tdata[oid]
+        self._add_records(tid, tdata)
 
         self._ltid = tid
         self._transactions[tid] = TransactionRecord(tid, transaction, tdata)
@@ -323,6 +336,55 @@ class MappingStorage:
         self._commit_lock.release()
         return tid
 
+    def _add_records(self, tid, records):
+        info = self._record_info
+        for oid, data in records.items():
+            tid_data = self._data.get(oid)
+            if tid_data is None:
+                tid_data = BTrees.OOBTree.OOBucket()
+                self._data[oid] = tid_data
+                info.size += 50
+            else:
+                info.history.add(oid)
+            tid_data[tid] = data
+            info.size += 100 + len(data)
+
+    @ZODB.utils.locked(opened)
+    def snapshot(self, file_name):
+        """Save the contents of the storage to a file
+
+        The file can be given to :meth:`loadSnapshot`, or to the
+        constructor, to get a storage with the same contents.
+        """
+        if self._transaction is not None:
+            raise ZODB.POSException.StorageTransactionError(
+                "Can't take a snapshot while committing")
+        with open(file_name, 'wb') as f:
+            f.write(SNAPSHOT_MAGIC)
+            pickle.dump(
+                (self._ltid, self._oid, self._last_pack,
+                 list(self._transactions.values())),
+                f, pickle.HIGHEST_PROTOCOL)
+
+    @ZODB.utils.locked(opened)
+    def loadSnapshot(self, file_name):
+        """Load the contents of the storage from a snapshot file
+
+        The storage must be empty.
+        """
+        if self._transactions:
+            raise ZODB.POSException.StorageError(
+                "Can only load a snapshot in an empty storage")
+        with open(file_name, 'rb') as f:
+            if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                raise ZODB.POSException.StorageError(
+                    "Not a MappingStorage snapshot", file_name)
+            self._ltid, self._oid, self._last_pack, transactions = (
+                pickle.load(f))
+        for record in transactions:
+            self._transactions[record.tid] = record
+            self._add_records(record.tid, record.data)
+
     # ZEO.interfaces.IServeable
     @ZODB.utils.locked(opened)
     def tpc_transaction(self):
@@ -335,6 +397,28 @@ class MappingStorage:
                 "tpc_vote called with wrong transaction")
 
 
+SNAPSHOT_MAGIC = b'MSS1'
+
+
+class _RecordInfo:
+    """What MappingStorage knows about its records, besides their data
+
+    The record information is shared by the instances of MVCC storages built on
+    MappingStorage.
+    """
+
+    def __init__(self):
+        self.size = 0        # As computed by getSize
+        self.history = set()  # oids of objects with more than one record
+        self.refs = {}       # (oid, tid) -> oids referenced by the record
+
+    def references(self, oid, tid, data, referencesf):
+        refs = self.refs.get((oid, tid))
+        if refs is None:
+            refs = self.refs[oid, tid] = tuple(referencesf(data))
+        return refs
+
+
 class TransactionRecord:
 
     status = ' '
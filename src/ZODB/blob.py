@@ -15,15 +15,24 @@
 """
 
 import binascii
+import errno
+import hashlib
+import io
 import logging
+import mmap
 import os
+import queue
 import re
 import shutil
+import socket
 import stat
 import sys
 import tempfile
+import threading
 import weakref
+import zlib
 from base64 import decodebytes
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from io import FileIO
 
@@ -38,6 +47,12 @@ from ZODB.interfaces import BlobError
 from ZODB.POSException import POSKeyError
 
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover (Windows)
+    fcntl = None
+
+
 logger = logging.getLogger('ZODB.blob')
 
 BLOB_SUFFIX = ".blob"
@@ -46,8 +61,15 @@ SAVEPOINT_SUFFIX = ".spb"
 LAYOUT_MARKER = '.layout'
 LAYOUTS = {}
 
+# Directory, in a blob directory, of the content store of layouts
+# sharing the data of identical blob files
+CONTENT_DIR = '.content'
+
 valid_modes = 'r', 'w', 'r+', 'a', 'c'
 
+# Default size, in bytes, of the chunks of chunked blobs
+CHUNK_SIZE = 1 << 20
+
 # Threading issues:
 # We want to support closing blob files when they are destroyed.
 # This introduces a threading issue, since a blob file may be destroyed
@@ -185,12 +207,10 @@ class Blob(persistent.Persistent):
                 if self._p_blob_uncommitted is None:
                     # Create a new working copy
                     self._create_uncommitted_file()
-                    result = BlobFile(self._p_blob_uncommitted, mode, self)
                     if self._p_blob_committed:
-                        with open(self._p_blob_committed, 'rb') as fp:
-                            utils.cp(fp, result)
-                        if mode == 'r+':
-                            result.seek(0)
+                        clone_file(self._p_blob_committed,
+                                   self._p_blob_uncommitted)
+                    result = BlobFile(self._p_blob_uncommitted, mode, self)
                 else:
                     # Re-use existing working copy
                     result = BlobFile(self._p_blob_uncommitted, mode, self)
@@ -224,6 +244,20 @@ class Blob(persistent.Persistent):
 
         return result
 
+    def openCommitted(self):
+        if (self._p_blob_uncommitted
+                or
+                not self._p_blob_committed
+                or
+                self._p_blob_committed.endswith(SAVEPOINT_SUFFIX)):
+            raise BlobError('Uncommitted changes')
+
+        storage = self._p_jar._storage
+        open_committed = getattr(storage, 'openCommittedBlob', None)
+        if open_committed is not None:
+            return open_committed(self._p_oid, self._p_serial)
+        return CommittedBlob(storage.loadBlob(self._p_oid, self._p_serial))
+
     def consumeFile(self, filename):
         """Will replace the current data of the blob with the file given under
         filename.
@@ -341,6 +375,322 @@ class BlobFile(FileIO):
         raise TypeError("Pickling a BlobFile is not allowed")
 
 
+class CommittedBlob:
+    """Read-only access to the data of a committed blob file.
+
+    Data are read through an open file descriptor, without Python file
+    objects, so they can be served with os.sendfile or mapped in memory.
+    Holding the descriptor keeps them readable if a pack removes the
+    file, until the committed blob is closed.
+    """
+
+    fd = None
+
+    def __init__(self, name):
+        flags = os.O_RDONLY | getattr(os, 'O_BINARY', 0)
+        self.name = name
+        self.fd = os.open(name, flags)
+        self.size = os.fstat(self.fd).st_size
+
+    def sendfile(self, out, offset=0, count=None):
+        """Send data to a socket or file descriptor.
+
+        out may also be an object with a fileno method.  The number of
+        bytes sent is returned.
+        """
+        if count is None or count > self.size - offset:
+            count = self.size - offset
+        if count <= 0:
+            return 0
+        if isinstance(out, socket.socket):
+            # Falls back to send where sendfile isn't supported
+            with open(self.fd, 'rb', closefd=False) as f:
+                return out.sendfile(f, offset, count)
+
+        out_fd = out if isinstance(out, int) else out.fileno()
+        sent = 0
+        if hasattr(os, 'sendfile'):
+            while sent < count:
+                n = os.sendfile(out_fd, self.fd, offset + sent, count - sent)
+                if not n:
+                    break
+                sent += n
+        else:
+            with self.mmap() as data:
+                view = memoryview(data)[offset:offset + count]
+                try:
+                    while sent < count:
+                        sent += os.write(out_fd, view[sent:])
+                finally:
+                    view.release()
+        return sent
+
+    def mmap(self):
+        """Return a read-only memory map of the data.
+
+        The map stays valid after the committed blob is closed.  As
+        empty files can't be mapped, empty data are returned as bytes.
+        """
+        if not self.size:
+            return b''
+        return mmap.mmap(self.fd, 0, access=mmap.ACCESS_READ)
+
+    @property
+    def closed(self):
+        return self.fd is None
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+
+class ChunkedBlob(persistent.Persistent):
+    """A large binary object stored as a sequence of blob chunks.
+
+    The data are split in chunks of chunk_size bytes, each a Blob.  A
+    change only writes new revisions of the chunks it touches, the
+    other chunks are shared by the revisions of the chunked blob, so
+    appending to or patching a large chunked blob takes time and space
+    proportional to the change rather than to the size of the data.
+
+    Chunked blobs are opened like blobs, and can be exported and
+    imported like other persistent objects.
+    """
+
+    _v_readers = _v_writer = None
+
+    def __init__(self, data=None, chunk_size=CHUNK_SIZE):
+        if chunk_size < 1:
+            raise ValueError("invalid chunk size", chunk_size)
+        self.chunk_size = chunk_size
+        self._chunks = []
+        self._size = 0
+        if data is not None:
+            with self.open('w') as f:
+                f.write(data)
+
+    def size(self):
+        return self._size
+
+    def opened(self):
+        writer = self._v_writer and self._v_writer()
+        return bool(writer is not None or self._v_readers)
+
+    def open(self, mode="r"):
+        if mode not in valid_modes:
+            raise ValueError("invalid mode", mode)
+
+        if mode == 'c' and self._p_changed:
+            raise BlobError('Uncommitted changes')
+        writer = self._v_writer and self._v_writer()
+        if writer is not None and not writer.closed:
+            raise BlobError("Already opened for writing.")
+
+        if mode in ('r', 'c'):
+            result = ChunkedBlobFile(self, mode)
+            if self._v_readers is None:
+                self._v_readers = weakref.WeakSet()
+            self._v_readers.add(result)
+        else:
+            if self._v_readers:
+                raise BlobError("Already opened for reading.")
+            result = ChunkedBlobFile(self, mode)
+            self._v_writer = weakref.ref(result)
+
+        return result
+
+    def closed(self, f):
+        if self._v_readers is not None:
+            self._v_readers.discard(f)
+        if self._v_writer is not None and self._v_writer() is f:
+            self._v_writer = None
+
+    # utility methods
+
+    def _add_chunk(self):
+        chunk = Blob()
+        if self._p_jar is not None:
+            # Create the uncommitted file in the storage's directory
+            self._p_jar.add(chunk)
+        self._chunks.append(chunk)
+        self._p_changed = True
+        return chunk
+
+    def _truncate(self, size):
+        if size >= self._size:
+            return
+        chunk_size = self.chunk_size
+        n = -(-size // chunk_size)
+        self._chunks = self._chunks[:n]
+        if size % chunk_size:
+            with self._chunks[-1].open('r+') as f:
+                f.truncate(size % chunk_size)
+        self._size = size
+
+
+class ChunkedBlobFile(io.RawIOBase):
+    """A file reading or writing the data of a chunked blob.
+
+    Data are read and written a chunk at a time, keeping at most one
+    chunk blob file open.
+    """
+
+    def __init__(self, blob, mode):
+        super().__init__()
+        self.blob = blob
+        self.mode = mode
+        self._pos = 0
+        self._chunk = None  # (index, mode, open chunk blob file)
+        if mode == 'w':
+            blob._truncate(0)
+        elif mode == 'a':
+            self._pos = blob._size
+
+    def readable(self):
+        return self.mode in ('r', 'r+', 'c')
+
+    def writable(self):
+        return self.mode in ('w', 'a', 'r+')
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        self._checkClosed()
+        return self._pos
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        self._checkClosed()
+        if whence == io.SEEK_CUR:
+            pos += self._pos
+        elif whence == io.SEEK_END:
+            pos += self.blob._size
+        elif whence != io.SEEK_SET:
+            raise ValueError("invalid whence", whence)
+        if pos < 0:
+            raise ValueError("negative seek position", pos)
+        self._pos = pos
+        return pos
+
+    def _open_chunk(self, index, mode):
+        if self._chunk is not None:
+            if self._chunk[:2] == (index, mode):
+                return self._chunk[2]
+            self._close_chunk()
+        f = self.blob._chunks[index].open(mode)
+        self._chunk = index, mode, f
+        return f
+
+    def _close_chunk(self):
+        if self._chunk is not None:
+            self._chunk[2].close()
+            self._chunk = None
+
+    def read(self, size=-1):
+        self._checkClosed()
+        if not self.readable():
+            raise io.UnsupportedOperation('read')
+        blob = self.blob
+        chunk_size = blob.chunk_size
+        end = blob._size
+        if size is not None and size >= 0:
+            end = min(end, self._pos + size)
+        result = []
+        mode = 'c' if self.mode == 'c' else 'r'
+        while self._pos < end:
+            index, offset = divmod(self._pos, chunk_size)
+            f = self._open_chunk(index, mode)
+            f.seek(offset)
+            data = f.read(min(end - self._pos, chunk_size - offset))
+            if not data:
+                break
+            result.append(data)
+            self._pos += len(data)
+        return b''.join(result)
+
+    def readall(self):
+        return self.read()
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def write(self, data):
+        self._checkClosed()
+        if not self.writable():
+            raise io.UnsupportedOperation('write')
+        if self.mode == 'a':
+            self._pos = self.blob._size
+        self._fill()
+        return self._write(data)
+
+    def _fill(self):
+        # Fill the data up to the current position with zeros, like
+        # files do when written past their end.
+        blob = self.blob
+        pos = self._pos
+        if pos <= blob._size:
+            return
+        self._pos = blob._size
+        while self._pos < pos:
+            self._write(bytes(min(pos - self._pos, blob.chunk_size)))
+
+    def _write(self, data):
+        blob = self.blob
+        chunk_size = blob.chunk_size
+        data = memoryview(data).cast('B')
+        written = len(data)
+        while data:
+            index, offset = divmod(self._pos, chunk_size)
+            if index == len(blob._chunks):
+                blob._add_chunk()
+            f = self._open_chunk(index, 'r+')
+            f.seek(offset)
+            n = f.write(data[:chunk_size - offset])
+            data = data[n:]
+            self._pos += n
+        if self._pos > blob._size:
+            blob._size = self._pos
+        return written
+
+    def truncate(self, size=None):
+        self._checkClosed()
+        if not self.writable():
+            raise io.UnsupportedOperation('truncate')
+        if size is None:
+            size = self._pos
+        self._close_chunk()
+        blob = self.blob
+        if size > blob._size:
+            pos = self._pos
+            self._pos = size
+            self._fill()
+            self._pos = pos
+        else:
+            blob._truncate(size)
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._close_chunk()
+            self.blob.closed(self)
+        super().close()
+
+    def __reduce__(self):
+        raise TypeError("Pickling a ChunkedBlobFile is not allowed")
+
+
 _pid = str(os.getpid())
 
 
@@ -420,13 +770,16 @@ class FilesystemHelper:
         path = self.layout.oid_to_path(oid)
         path = os.path.join(self.base_dir, path)
 
-        if create and not os.path.exists(path):
+        if create:
+            # Most of the time either the path or its parent exists,
+            # so try the cheapest system call first.
             try:
-                os.makedirs(path)
-            except OSError:
-                # We might have lost a race.  If so, the directory
-                # must exist now
-                assert os.path.exists(path)
+                os.mkdir(path)
+            except FileExistsError:
+                pass
+            except FileNotFoundError:
+                # exist_ok, we might lose a race
+                os.makedirs(path, exist_ok=True)
         return path
 
     def getOIDForPath(self, path):
@@ -511,7 +864,13 @@ class FilesystemHelper:
         """Iterates over all paths under the base directory that contain blob
         files.
         """
+        list_oids = getattr(self.layout, 'listOIDs', None)
+        if list_oids is not None:
+            yield from list_oids(self.base_dir)
+            return
         for path, dirs, files in os.walk(self.base_dir):
+            if path == self.base_dir and CONTENT_DIR in dirs:
+                dirs.remove(CONTENT_DIR)
             # Make sure we traverse in a stable order. This is mainly to make
             # testing predictable.
             dirs.sort()
@@ -522,6 +881,78 @@ class FilesystemHelper:
                 continue
             yield oid, path
 
+    def getContentPath(self, filename):
+        """Return the path of the data of a blob file in the content store.
+
+        None is returned if the layout doesn't share blob data.
+        """
+        if not self.layout.content_addressed:
+            return None
+        digest = hashlib.sha256()
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return os.path.join(self.base_dir,
+                            self.layout.digest_to_path(digest.hexdigest()))
+
+    def shareBlobFile(self, filename, content_path=None):
+        """Make a committed blob file share its data with identical ones.
+
+        If the content store has the data already, the blob file is
+        replaced by a hard link to them, otherwise it is linked into the
+        store.  Nothing is shared if hard links aren't supported.  The
+        caller must hold the storage lock, so removeUnusedContent
+        can't remove the data while they are linked.
+        """
+        if content_path is None:
+            content_path = self.getContentPath(filename)
+            if content_path is None:
+                return
+        try:
+            if os.path.exists(content_path):
+                tmp = utils.mktemp(dir=self.temp_dir, prefix='BCS')
+                os.remove(tmp)
+                os.link(content_path, tmp)
+                try:
+                    os.replace(tmp, filename)
+                except OSError:
+                    os.remove(tmp)
+                    raise
+            else:
+                os.makedirs(os.path.dirname(content_path), exist_ok=True)
+                os.link(filename, content_path)
+        except OSError:
+            log("Couldn't share the data of blob file %s" % filename,
+                level=logging.DEBUG, exc_info=True)
+
+    def removeUnusedContent(self, lock):
+        """Remove the data in the content store no blob file links to.
+
+        Each file is checked and removed holding the storage lock, so
+        that a blob being stored can't link to data being removed.
+        Return the number of files removed.
+        """
+        content_dir = os.path.join(self.base_dir, CONTENT_DIR)
+        removed = 0
+        if not self.layout.content_addressed:
+            return removed
+        for path, dirs, files in os.walk(content_dir, topdown=False):
+            for name in files:
+                file_path = os.path.join(path, name)
+                with lock:
+                    try:
+                        if os.stat(file_path).st_nlink > 1:
+                            continue
+                        remove_committed(file_path)
+                    except FileNotFoundError:
+                        continue
+                removed += 1
+            if path != content_dir:
+                with lock:
+                    if not os.listdir(path):
+                        os.rmdir(path)
+        return removed
+
 
 class NoBlobsFileSystemHelper:
 
@@ -575,6 +1006,10 @@ class BushyLayout:
 
     """
 
+    # Whether blob files with the same data share them, see
+    # ContentAddressedLayout.
+    content_addressed = False
+
     blob_path_pattern = re.compile(
         r'(0x[0-9a-f]{1,2}\%s){7,7}0x[0-9a-f]{1,2}$' % os.path.sep)
 
@@ -641,6 +1076,82 @@ class LawnLayout(BushyLayout):
 LAYOUTS['lawn'] = LawnLayout()
 
 
+class HashedLayout(BushyLayout):
+    """A shallow but wide directory layout for very many blobs.
+
+    Creates two levels of 256 directories, chosen by a hash of the OID,
+    containing one directory per OID, named by its 16 hex digits.  This
+    keeps directories small for tens of millions of blobs, with fewer
+    directories to create and walk than the bushy layout.
+
+    """
+
+    blob_path_pattern = re.compile(
+        r'([0-9a-f]{2})\%s([0-9a-f]{2})\%s([0-9a-f]{16})$'
+        % (os.path.sep, os.path.sep))
+
+    def _prefix(self, oid):
+        h = zlib.crc32(oid)
+        return '%02x' % (h & 0xff), '%02x' % (h >> 8 & 0xff)
+
+    def oid_to_path(self, oid):
+        oid = ascii_bytes(oid)
+        return os.path.join(*self._prefix(oid),
+                            binascii.hexlify(oid).decode('ascii'))
+
+    def path_to_oid(self, path):
+        match = self.blob_path_pattern.match(path)
+        if match is not None:
+            oid = binascii.unhexlify(match.group(3))
+            if self._prefix(oid) == match.group(1, 2):
+                return oid
+        raise ValueError("Not a valid OID path: `%s`" % path)
+
+    def listOIDs(self, base_dir):
+        """Iterate over the (oid, path) of the OID directories
+
+        Only the three levels of the layout are listed, in a stable
+        order.
+        """
+        hex_digits = set('0123456789abcdef')
+
+        def subdirs(path, length):
+            try:
+                names = sorted(os.listdir(path))
+            except FileNotFoundError:
+                return
+            for name in names:
+                if len(name) == length and hex_digits.issuperset(name):
+                    yield name, os.path.join(path, name)
+
+        for _, path1 in subdirs(base_dir, 2):
+            for _, path2 in subdirs(path1, 2):
+                for name, path in subdirs(path2, 16):
+                    yield binascii.unhexlify(name), path
+
+
+LAYOUTS['hashed'] = HashedLayout()
+
+
+class ContentAddressedLayout(BushyLayout):
+    """A bushy directory layout sharing the data of identical blob files.
+
+    Blob files are hard links into a content store, in which data are
+    kept under their SHA-256 digest, so identical revisions of blobs
+    take the space of one.  Data no blob file links to anymore are
+    removed when the storage is packed.
+
+    """
+
+    content_addressed = True
+
+    def digest_to_path(self, digest):
+        return os.path.join(CONTENT_DIR, digest[:2], digest[2:4], digest)
+
+
+LAYOUTS['content'] = ContentAddressedLayout()
+
+
 class BlobStorageMixin:
     """A mix-in to help storages support blobs."""
 
@@ -695,6 +1206,16 @@ class BlobStorageMixin:
             raise POSKeyError("No blob file at %s" % filename, oid, serial)
         return filename
 
+    def openCommittedBlob(self, oid, serial):
+        """Return a CommittedBlob to read the data of a blob revision.
+        """
+        filename = self.loadBlob(oid, serial)
+        try:
+            return CommittedBlob(filename)
+        except FileNotFoundError:
+            # A pack removed it
+            raise POSKeyError("No blob file at %s" % filename, oid, serial)
+
     def openCommittedBlobFile(self, oid, serial, blob=None):
         blob_filename = self.loadBlob(oid, serial)
         if blob is None:
@@ -712,10 +1233,18 @@ class BlobStorageMixin:
         return self._tid
 
     def _blob_storeblob(self, oid, serial, blobfilename):
+        # Compute the digest of content-addressed blobs before getting
+        # the lock, it reads all the data.
+        content_path = self.fshelper.getContentPath(blobfilename)
         with self._lock:
             self.fshelper.getPathForOID(oid, create=True)
             targetname = self.fshelper.getBlobFilename(oid, serial)
-            rename_or_copy_blob(blobfilename, targetname)
+            if content_path is None:
+                rename_or_copy_blob(blobfilename, targetname)
+            else:
+                rename_or_copy_blob(blobfilename, targetname, chmod=False)
+                self.fshelper.shareBlobFile(targetname, content_path)
+                set_not_writable(targetname)
 
             # if oid already in there, something is really hosed.
             # The underlying storage should have complained anyway
@@ -841,6 +1370,7 @@ class BlobStorage(BlobStorageMixin):
                 self._packUndoing(packtime, referencesf)
             else:
                 self._packNonUndoing(packtime, referencesf)
+            self.fshelper.removeUnusedContent(self._lock)
         finally:
             with self._lock:
                 self._blobs_pack_is_in_progress = False
@@ -885,9 +1415,8 @@ class BlobStorage(BlobStorageMixin):
                     data, serial_before, serial_after = load_result
                     orig_fn = self.fshelper.getBlobFilename(oid, serial_before)
                     new_fn = self.fshelper.getBlobFilename(oid, undo_serial)
-                with open(orig_fn, "rb") as orig:
-                    with open(new_fn, "wb") as new:
-                        utils.cp(orig, new)
+                clone_file(orig_fn, new_fn)
+                self.fshelper.shareBlobFile(new_fn)
                 self.dirty_oids.append((oid, undo_serial))
 
         return undo_serial, keys
@@ -919,15 +1448,79 @@ def rename_or_copy_blob(f1, f2, chmod=True):
         os.rename(f1, f2)
     except OSError:
         copied("Copied blob file %r to %r.", f1, f2)
-        with open(f1, 'rb') as file1:
-            with open(f2, 'wb') as file2:
-                utils.cp(file1, file2)
+        clone_file(f1, f2)
         remove_committed(f1)
 
     if chmod:
         set_not_writable(f2)
 
 
+if sys.platform.startswith('linux'):
+    # The ioctl making a file share the data of another (a reflink),
+    # supported by btrfs, XFS, bcachefs and others.
+    FICLONE = 0x40049409
+else:
+    FICLONE = None
+
+# Errors meaning that a pair of files can't be cloned or copied in
+# the kernel, e.g. because they are on different file systems or the
+# file system or kernel doesn't support it.
+_clone_unsupported = frozenset(
+    getattr(errno, name)
+    for name in ('EXDEV', 'EOPNOTSUPP', 'ENOTSUP', 'EINVAL', 'ENOTTY',
+                 'ENOSYS', 'EBADF', 'EPERM', 'ETXTBSY')
+    if hasattr(errno, name))
+
+
+def _clone_fd(fd1, fd2):
+    """Try to copy the data of fd1 to fd2 without reading it in Python
+
+    Return whether the data were copied.
+    """
+    if FICLONE is not None and fcntl is not None:
+        try:
+            fcntl.ioctl(fd2, FICLONE, fd1)
+        except OSError as v:
+            if v.errno not in _clone_unsupported:
+                raise
+        else:
+            return True
+
+    if hasattr(os, 'copy_file_range'):
+        size = os.fstat(fd1).st_size
+        try:
+            while size > 0:
+                n = os.copy_file_range(fd1, fd2, size)
+                if not n:
+                    break
+                size -= n
+        except OSError as v:
+            if v.errno not in _clone_unsupported:
+                raise
+        else:
+            return size <= 0
+
+    return False
+
+
+def clone_file(f1, f2):
+    """Copy the data of file f1 to a new file f2.
+
+    Where the file system supports it, f2 is a reflink sharing the
+    data blocks of f1, so the copy takes constant time and space
+    however big the file is.  Otherwise, the data are copied by the
+    kernel with copy_file_range and, failing that, in Python.
+    """
+    with open(f1, 'rb', buffering=0) as file1:
+        with open(f2, 'wb', buffering=0) as file2:
+            if _clone_fd(file1.fileno(), file2.fileno()):
+                return
+
+    with open(f1, 'rb') as file1:
+        with open(f2, 'wb') as file2:
+            utils.cp(file1, file2)
+
+
 if sys.platform == 'win32':
     # On Windows, you can't remove read-only files, so make the
     # file writable first.
@@ -962,7 +1555,12 @@ def is_blob_record(record):
     storage to another.
 
     """
-    if record and (b'ZODB.blob' in record):
+    if not record:
+        return False
+    record_class = utils.get_record_class(record)
+    if record_class is not None:
+        return record_class == ('ZODB.blob', 'Blob')
+    if b'ZODB.blob' in record:
         unpickler = PersistentUnpickler(
             find_global_Blob, None, BytesIO(record))
 
@@ -976,32 +1574,124 @@ def is_blob_record(record):
     return False
 
 
-def copyTransactionsFromTo(source, destination):
-    for trans in source.iterator():
-        destination.tpc_begin(trans, trans.tid, trans.status)
-        for record in trans:
-            blobfilename = None
-            if is_blob_record(record.data):
-                try:
-                    blobfilename = source.loadBlob(record.oid, record.tid)
-                except POSKeyError:
-                    pass
-            if blobfilename is not None:
-                fd, name = tempfile.mkstemp(
-                    prefix='CTFT',
-                    suffix='.tmp', dir=destination.fshelper.temp_dir)
-                os.close(fd)
-                with open(blobfilename, 'rb') as sf:
-                    with open(name, 'wb') as df:
-                        utils.cp(sf, df)
-                destination.restoreBlob(record.oid, record.tid, record.data,
-                                        name, record.data_txn, trans)
+def copyTransactionsFromTo(source, destination, workers=4, prefetch=16):
+    """Copy all transactions, including blobs, to a destination storage.
+
+    A thread reads the transactions of the source while a pool of
+    workers threads links (or clones) their blob files in the temporary
+    directory of the destination, up to prefetch transactions ahead of
+    the calling thread, which restores the transactions in order.
+    """
+    pipeline = queue.Queue(prefetch)
+    stop = threading.Event()
+    failed = []
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pipeline.put(item, timeout=.1)
+            except queue.Full:
+                pass
             else:
-                destination.restore(record.oid, record.tid, record.data,
-                                    '', record.data_txn, trans)
+                return True
+        return False
 
-        destination.tpc_vote(trans)
-        destination.tpc_finish(trans)
+    def read(executor):
+        it = source.iterator()
+        try:
+            for trans in it:
+                records = []
+                for record in trans:
+                    blob = None
+                    if is_blob_record(record.data):
+                        blob = executor.submit(
+                            _copy_blob, source, destination, record)
+                    records.append((record, blob))
+                if not put((trans, records)):
+                    _discard_blobs(records)
+                    break
+        except Exception as v:
+            failed.append(v)
+        finally:
+            put(None)
+            close = getattr(it, 'close', None)
+            if close is not None:
+                close()
+
+    with ThreadPoolExecutor(workers) as executor:
+        reader = threading.Thread(
+            target=read, args=(executor,), name='copyTransactionsFromTo')
+        reader.daemon = True
+        reader.start()
+        records = ()
+        trans = None
+        try:
+            while True:
+                item = pipeline.get()
+                if item is None:
+                    break
+                trans, records = item
+                destination.tpc_begin(trans, trans.tid, trans.status)
+                for record, blob in records:
+                    blobfilename = None if blob is None else blob.result()
+                    if blobfilename is not None:
+                        destination.restoreBlob(
+                            record.oid, record.tid, record.data,
+                            blobfilename, record.data_txn, trans)
+                    else:
+                        destination.restore(
+                            record.oid, record.tid, record.data,
+                            '', record.data_txn, trans)
+
+                destination.tpc_vote(trans)
+                destination.tpc_finish(trans)
+                records = ()
+                trans = None
+        finally:
+            if trans is not None:
+                # Don't leave the destination in the failed transaction
+                destination.tpc_abort(trans)
+            stop.set()
+            reader.join()
+            # Remove the files of blobs that weren't restored
+            _discard_blobs(records)
+            while not pipeline.empty():
+                item = pipeline.get()
+                if item is not None:
+                    _discard_blobs(item[1])
+
+    if failed:
+        raise failed[0]
+
+
+def _copy_blob(source, destination, record):
+    # Return a file, in the destination's temporary directory, with
+    # the data of a blob record, or None if the blob is missing.
+    try:
+        blobfilename = source.loadBlob(record.oid, record.tid)
+    except POSKeyError:
+        return None
+    fd, name = tempfile.mkstemp(
+        prefix='CTFT', suffix='.tmp', dir=destination.fshelper.temp_dir)
+    os.close(fd)
+    try:
+        os.remove(name)
+        os.link(blobfilename, name)
+    except OSError:
+        clone_file(blobfilename, name)
+    return name
+
+
+def _discard_blobs(records):
+    for _, blob in records:
+        if blob is None:
+            continue
+        try:
+            name = blob.result()
+        except Exception:
+            continue
+        if name is not None and os.path.exists(name):
+            remove_committed(name)
 
 
 NO_WRITE = ~ (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
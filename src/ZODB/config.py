@@ -176,6 +176,8 @@ class ZODBDatabase(BaseConfig):
         _option('allow_implicit_cross_references', 'xrefs')
         _option('large_record_size')
         _option('class_factory')
+        _option('hot_set_file')
+        _option('warm_up_time')
 
         try:
             return ZODB.DB(
@@ -187,6 +189,9 @@ class ZODBDatabase(BaseConfig):
                 historical_cache_size=section.historical_cache_size,
                 historical_cache_size_bytes=section.historical_cache_size_bytes,  # noqa: E501 line too long
                 historical_timeout=section.historical_timeout,
+                total_cache_size_bytes=section.total_cache_size_bytes,
+                historical_record_cache_size_bytes=(
+                    section.historical_record_cache_size_bytes),
                 database_name=section.database_name or self.name or '',
                 databases=databases,
                 **options)
@@ -199,7 +204,7 @@ class MappingStorage(BaseConfig):
 
     def open(self):
         from ZODB.MappingStorage import MappingStorage
-        return MappingStorage(self.config.name)
+        return MappingStorage(self.config.name, self.config.snapshot)
 
 
 class DemoStorage(BaseConfig):
@@ -237,7 +242,10 @@ class FileStorage(BaseConfig):
                 options['packer'] = getattr(m, name)
 
         for name in ('blob_dir', 'create', 'read_only', 'quota', 'pack_gc',
-                     'pack_keep_old'):
+                     'pack_keep_old', 'checkpoint_transactions',
+                     'checkpoint_bytes', 'rebuild_index_jobs', 'pack_rate',
+                     'pack_checkpoint_bytes', 'pack_time_budget',
+                     'pack_gc_low_memory', 'pack_gc_stack_memory'):
             v = getattr(config, name, self)
             if v is not self:
                 options[name] = v
@@ -73,6 +73,17 @@ def ensure_bytes(s):
     return s if isinstance(s, bytes) else s.encode('ascii')
 
 
+def save_buckets(pos, buckets, fname):
+    """Save (prefix, string) bucket pairs in the format read by load"""
+    with open(fname, 'wb') as f:
+        pickler = Pickler(f, _protocol)
+        pickler.fast = True
+        pickler.dump(pos)
+        for k, v in buckets:
+            pickler.dump((k, v))
+        pickler.dump(None)
+
+
 class fsIndex:
 
     def __init__(self, data=None):
@@ -111,13 +122,33 @@ class fsIndex:
         return str2num(self._data[key[:6]][key[6:]])
 
     def save(self, pos, fname):
-        with open(fname, 'wb') as f:
-            pickler = Pickler(f, _protocol)
-            pickler.fast = True
-            pickler.dump(pos)
-            for k, v in self._data.items():
-                pickler.dump((k, v.toString()))
-            pickler.dump(None)
+        save_buckets(pos, ((k, v.toString()) for k, v in self._data.items()),
+                     fname)
+
+    def buckets(self, prefixes=None):
+        """Return the buckets as a list of (prefix, string) pairs
+
+        If prefixes are given, only the buckets for these prefixes are
+        returned, and an empty string for prefixes without a bucket.
+        """
+        data = self._data
+        if prefixes is None:
+            return [(k, v.toString()) for k, v in data.items()]
+        result = []
+        for k in sorted(prefixes):
+            v = data.get(k)
+            result.append((k, b'' if v is None else v.toString()))
+        return result
+
+    def update_buckets(self, buckets):
+        """Replace buckets by ones returned by buckets()"""
+        data = self._data
+        for k, v in buckets:
+            k = ensure_bytes(k)
+            if v:
+                data[k] = fsBucket().fromString(ensure_bytes(v))
+            elif k in data:
+                del data[k]
 
     @classmethod
     def load(class_, fname):
@@ -177,6 +208,16 @@ class fsIndex:
         return r
 
     def update(self, mapping):
+        if isinstance(mapping, fsIndex):
+            # Merge bucket by bucket rather than item by item.
+            data = self._data
+            for k, v in mapping._data.items():
+                tree = data.get(k)
+                if tree is None:
+                    data[k] = fsBucket(v)
+                else:
+                    tree.update(v)
+            return
         for k, v in mapping.items():
             self[ensure_bytes(k)] = v
 
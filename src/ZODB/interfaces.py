@@ -1352,6 +1352,19 @@ class IBlob(Interface):
         A BlobError will be raised if the blob has any uncommitted data.
         """
 
+    def openCommitted():
+        """Return read-only access to the committed data.
+
+        The result has the committed file ``name``, its ``size`` and
+        an open file descriptor, ``fd``, suitable for ``os.sendfile``.
+        Its ``sendfile`` method sends the data to a socket or file
+        descriptor and its ``mmap`` method maps the data in memory for
+        random access.  The data stay readable, even if the file is
+        removed by packing, until the result is closed.
+
+        A BlobError will be raised if the blob has any uncommitted data.
+        """
+
     def consumeFile(filename):
         """Consume a file.
 
@@ -1457,6 +1470,15 @@ class IBroken(Interface):
     __Broken_state__ = Attribute("Value passed to __setstate__.")
 
 
+class IMetricsExporter(Interface):
+    """Export the values of a ZODB.metrics.Metrics object
+    """
+
+    def export(metrics):
+        """Return the values of the metrics in the exporter's format
+        """
+
+
 class BlobError(Exception):
     pass
 
@@ -0,0 +1,265 @@
+##############################################################################
+#
+# Copyright (c) 2026 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Low-overhead database metrics
+
+A Metrics object keeps counters and latency histograms.  Counters keep
+a total and, in a ring buffer of time buckets, their recent history.
+Both have a fixed size, so recording a value takes constant time and
+memory, however busy the database.
+
+Metrics are set on a database with DB.setMetrics.  Connections then
+record loads, stores, commits and cache activity, and a FileStorage
+records the bytes it writes and the time spent syncing them.  The
+recorded values are exported by exporters, such as PrometheusExporter.
+
+Cache hits and misses count the lookups of objects by oid, by
+Connection.get and when references are unpickled.  A miss creates a
+ghost, whose state is loaded, and counted in loads, when it's used.
+Objects already referenced from memory aren't looked up.
+"""
+import bisect
+import time
+from contextlib import contextmanager
+
+from zope.interface import implementer
+
+from ZODB import utils
+from ZODB.interfaces import IMetricsExporter
+
+
+# Upper bounds, in seconds, of the default latency histogram buckets
+LATENCY_BOUNDS = (
+    .0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5,
+    1, 2.5, 5, 10)
+
+
+class RingBuffer:
+    """Sums of values over a period of time, in fixed time buckets
+
+    The last ``length`` seconds are divided in ``size`` buckets.  Each
+    bucket holds the sums of ``width`` values added during its time.
+    Older buckets are reused as time passes.
+    """
+
+    def __init__(self, length, size=60, width=1):
+        self.length = length
+        self.size = size
+        self.width = width
+        self.period = length / size
+        self._stamps = [None] * size
+        self._sums = [[0] * width for _ in range(size)]
+
+    def add(self, values, now=None):
+        if now is None:
+            now = time.time()
+        stamp = int(now // self.period)
+        i = stamp % self.size
+        sums = self._sums[i]
+        if self._stamps[i] != stamp:
+            self._stamps[i] = stamp
+            sums[:] = values
+        else:
+            for j, v in enumerate(values):
+                sums[j] += v
+
+    def buckets(self, start=0, end=None):
+        """Return the (time, sums) of buckets in a time range
+
+        The time of a bucket is the start of its period.  Buckets
+        older than the buffer length are ignored.  The buckets are
+        returned in chronological order.
+        """
+        now = time.time()
+        if end is None:
+            end = now
+        start = max(start, now - self.length)
+        result = []
+        for stamp, sums in zip(self._stamps, self._sums):
+            if stamp is not None:
+                t = stamp * self.period
+                if start <= t + self.period and t <= end:
+                    result.append((t, list(sums)))
+        result.sort()
+        return result
+
+    def totals(self, start=0, end=None):
+        """Return the sums of the values added in a time range"""
+        totals = [0] * self.width
+        for _, sums in self.buckets(start, end):
+            for j, v in enumerate(sums):
+                totals[j] += v
+        return totals
+
+
+class Histogram:
+    """A histogram of values, with fixed bucket upper bounds"""
+
+    def __init__(self, bounds=LATENCY_BOUNDS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """Return (upper bound, count of values <= bound) pairs
+
+        The last bound is infinity.
+        """
+        result = []
+        n = 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            n += count
+            result.append((bound, n))
+        return result
+
+
+class Metrics:
+    """Counters and histograms recorded by a database
+
+    Counters are created when first incremented and histograms when
+    first observed.  The names used by ZODB are documented in
+    COUNTERS and HISTOGRAMS.
+    """
+
+    def __init__(self, history_length=3600, buckets=60):
+        self.history_length = history_length
+        self.buckets = buckets
+        self.counters = {}  # name -> [total, RingBuffer]
+        self.histograms = {}  # name -> Histogram
+        self._lock = utils.Lock()
+
+    def increment(self, name, n=1):
+        with self._lock:
+            counter = self.counters.get(name)
+            if counter is None:
+                counter = self.counters[name] = [
+                    0, RingBuffer(self.history_length, self.buckets)]
+            counter[0] += n
+            counter[1].add((n,))
+
+    def observe(self, name, value):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name):
+        """Observe the time spent in a with block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def total(self, name):
+        """Return the total of a counter since the metrics were created"""
+        counter = self.counters.get(name)
+        return 0 if counter is None else counter[0]
+
+    def recent(self, name, seconds=None):
+        """Return the total of a counter over the last seconds
+
+        seconds defaults to (and cannot exceed) the history length.
+        """
+        counter = self.counters.get(name)
+        if counter is None:
+            return 0
+        start = 0 if seconds is None else time.time() - seconds
+        with self._lock:
+            return counter[1].totals(start)[0]
+
+    def snapshot(self):
+        """Return the current values as plain data"""
+        with self._lock:
+            return {
+                'counters': {name: total
+                             for name, (total, _)
+                             in sorted(self.counters.items())},
+                'histograms': {name: {'count': h.count,
+                                      'sum': h.sum,
+                                      'buckets': h.cumulative()}
+                               for name, h
+                               in sorted(self.histograms.items())},
+            }
+
+    def export(self, exporter):
+        return exporter.export(self)
+
+
+COUNTERS = {
+    'loads': "Objects loaded by connections",
+    'bytes_read': "Bytes of object records loaded by connections",
+    'stores': "Objects stored by connections",
+    'bytes_written': "Bytes of object records stored by connections",
+    'conflicts': "Conflict errors raised in connections",
+    'cache_hits': "Object lookups found in connection caches",
+    'cache_misses': "Object lookups that created a ghost",
+    'cache_evictions': "Objects removed from connection caches by GC",
+    'connections_closed': "Connections closed",
+    'filestorage_bytes_written': "Bytes of transactions written to files",
+}
+
+HISTOGRAMS = {
+    'load_seconds': "Time spent loading object records",
+    'store_seconds': "Time spent storing object records",
+    'commit_seconds': "Time spent in the commit phase of transactions",
+    'vote_seconds': "Time spent voting on transactions",
+    'finish_seconds': "Time spent finishing transactions",
+    'filestorage_sync_seconds': "Time spent syncing FileStorage files",
+}
+
+
+@implementer(IMetricsExporter)
+class PrometheusExporter:
+    """Export metrics in the Prometheus text exposition format
+    """
+
+    def __init__(self, prefix='zodb', labels=None):
+        self.prefix = prefix
+        self.labels = dict(labels or {})
+
+    def _labels(self, **extra):
+        labels = dict(self.labels, **extra)
+        if not labels:
+            return ''
+        return '{%s}' % ','.join(
+            f'{k}="{v}"' for k, v in sorted(labels.items()))
+
+    def export(self, metrics):
+        lines = []
+        snapshot = metrics.snapshot()
+        for name, total in snapshot['counters'].items():
+            full = f'{self.prefix}_{name}_total'
+            if name in COUNTERS:
+                lines.append(f'# HELP {full} {COUNTERS[name]}')
+            lines.append(f'# TYPE {full} counter')
+            lines.append(f'{full}{self._labels()} {total}')
+        for name, h in snapshot['histograms'].items():
+            full = f'{self.prefix}_{name}'
+            if name in HISTOGRAMS:
+                lines.append(f'# HELP {full} {HISTOGRAMS[name]}')
+            lines.append(f'# TYPE {full} histogram')
+            for bound, n in h['buckets']:
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{full}_bucket{self._labels(le=le)} {n}')
+            lines.append(f'{full}_sum{self._labels()} {h["sum"]}')
+            lines.append(f'{full}_count{self._labels()} {h["count"]}')
+        return '\n'.join(lines) + '\n'
@@ -6,6 +6,8 @@ and start time and moves it into a storage adapter.  This allows ZODB
 to treat Relstoage and other storages in pretty much the same way and
 also simplifies the implementation of the DB and Connection classes.
 """
+from collections import OrderedDict
+
 import zope.interface
 
 from . import POSException
@@ -22,7 +24,7 @@ class Base:
 
     _copy_methods = (
         'getName', 'getSize', 'history', 'lastTransaction', 'sortKey',
-        'loadBlob', 'openCommittedBlobFile',
+        'loadBlob', 'openCommittedBlobFile', 'openCommittedBlob',
         'isReadOnly', 'supportsUndo', 'undoLog', 'undoInfo',
         'temporaryDirectory',
     )
@@ -46,6 +48,9 @@ class Base:
 
 class MVCCAdapter(Base):
 
+    # A HistoricalRecordCache shared by historical instances, if any
+    historical_cache = None
+
     def __init__(self, storage):
         Base.__init__(self, storage)
         self._instances = set()
@@ -60,7 +65,8 @@ class MVCCAdapter(Base):
         return instance
 
     def before_instance(self, before=None):
-        return HistoricalStorageAdapter(self._storage, before)
+        return HistoricalStorageAdapter(
+            self._storage, before, self.historical_cache)
 
     def undo_instance(self):
         return UndoAdapterInstance(self)
@@ -239,9 +245,10 @@ class HistoricalStorageAdapter(Base):
         'checkCurrentSerialInTransaction',
     )
 
-    def __init__(self, storage, before=None):
+    def __init__(self, storage, before=None, cache=None):
         Base.__init__(self, storage)
         self._before = before
+        self._cache = cache
 
     def isReadOnly(self):
         return True
@@ -268,12 +275,91 @@ class HistoricalStorageAdapter(Base):
     new_oid = pack = store = read_only_writer
 
     def load(self, oid, version=''):
+        cache = self._cache
+        if cache is not None:
+            r = cache.load(oid, self._before)
+            if r is not None:
+                return r
+            # Read before loading: a record that is current when loaded
+            # is valid at least up to this transaction.
+            last = self._storage.lastTransaction()
         r = self._storage.loadBefore(oid, self._before)
         if r is None:
             raise POSException.POSKeyError(oid)
+        if cache is not None:
+            cache.store(oid, r, last)
         return r[:2]
 
 
+class HistoricalRecordCache:
+    """A cache of object records shared by historical connections
+
+    Records are kept with the range of transaction ids in which they
+    are current, as returned by loadBefore, so that a record loaded
+    by one historical connection can be used by others that look at the
+    database at any time in this range.  Records never change, so the
+    cache never has to be invalidated.
+
+    The cache is limited to a total size of records, in bytes.  The
+    least recently used records are removed first.
+    """
+
+    def __init__(self, size_bytes):
+        self.size_bytes = size_bytes
+        self.size = 0
+        self.hits = self.misses = 0
+        self._records = {}  # oid -> {serial: (data, end_tid)}
+        self._lru = OrderedDict()  # (oid, serial) -> None
+        self._lock = Lock()
+
+    def load(self, oid, before):
+        """Return the (data, serial) of oid current before a tid, or None
+        """
+        with self._lock:
+            for serial, (data, end) in self._records.get(oid, {}).items():
+                if serial < before <= end:
+                    self._lru.move_to_end((oid, serial))
+                    self.hits += 1
+                    return data, serial
+            self.misses += 1
+        return None
+
+    def store(self, oid, record, last):
+        """Add a record returned by loadBefore
+
+        last is the last transaction id of the storage before the
+        record was loaded.
+        """
+        data, serial, end = record
+        if end is None:
+            end = p64(u64(last) + 1)
+        if data is None or len(data) > self.size_bytes:
+            return
+        with self._lock:
+            records = self._records.setdefault(oid, {})
+            if serial in records:
+                old = records[serial]
+                if old[1] >= end:
+                    return
+                self.size -= len(old[0])
+            records[serial] = data, end
+            self._lru[oid, serial] = None
+            self._lru.move_to_end((oid, serial))
+            self.size += len(data)
+            while self.size > self.size_bytes:
+                (oid, serial), _ = self._lru.popitem(False)
+                records = self._records[oid]
+                self.size -= len(records.pop(serial)[0])
+                if not records:
+                    del self._records[oid]
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self._lru.clear()
+            self.size = 0
+
+
 class UndoAdapterInstance(Base):
 
     _copy_methods = Base._copy_methods + (
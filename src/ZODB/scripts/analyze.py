@@ -7,6 +7,7 @@ from io import BytesIO
 
 from ZODB._compat import PersistentUnpickler
 from ZODB.FileStorage import FileStorage
+from ZODB.utils import get_record_class
 
 
 class FakeError(Exception):
@@ -108,6 +109,9 @@ def analyze_trans(report, txn):
 
 
 def get_type(record):
+    record_class = get_record_class(record.data)
+    if record_class is not None:
+        return "%s.%s" % record_class
     try:
         unpickled = FakeUnpickler(BytesIO(record.data)).load()
     except FakeError as err:
@@ -16,7 +16,7 @@
 
 """FileStorage oid-tracer.
 
-usage: fsoids.py [-f oid_file] Data.fs [oid]...
+usage: fsoids.py [-f oid_file] [-j jobs] Data.fs [oid]...
 
 Display information about all occurrences of specified oids in a FileStorage.
 This is meant for heavy debugging.
@@ -29,6 +29,8 @@ line.  oids are specified as integers, in any of Python's integer
 notations (typically like 0x341a).  One or more oids can also be specified
 on the command line.
 
+With -j, the file is read by that many processes in parallel.
+
 The output is grouped by oid, from smallest to largest, and sub-grouped
 by transaction, from oldest to newest.
 
@@ -51,14 +53,17 @@ def main():
     import getopt
 
     try:
-        opts, args = getopt.getopt(sys.argv[1:], 'f:')
+        opts, args = getopt.getopt(sys.argv[1:], 'f:j:')
         if not args:
             usage()
             raise ValueError("Must specify a FileStorage")
         path = None
+        jobs = 1
         for k, v in opts:
             if k == '-f':
                 path = v
+            if k == '-j':
+                jobs = int(v)
     except (getopt.error, ValueError):
         usage()
         raise
@@ -73,7 +78,7 @@ def main():
             c.register_oids(as_int)
     if not c.oids:
         raise ValueError("no oids specified")
-    c.run()
+    c.run(jobs)
     c.report()
 
 
@@ -14,7 +14,7 @@
 ##############################################################################
 """Simple consistency checker for FileStorage.
 
-usage: fstest.py [-v] data.fs
+usage: fstest.py [-v] [-j jobs] data.fs
 
 The fstest tool will scan all the data in a FileStorage and report an
 error if it finds any corrupt transaction data.  The tool will print a
@@ -26,16 +26,21 @@ If two -v arguments are used, it will also print a line of text for
 each object.  The objects for a transaction will be printed before the
 transaction itself.
 
+With -j, the file is split in ranges of transactions that are checked
+by that many processes in parallel.  The output is the same.
+
 Note: It does not check the consistency of the object pickles.  It is
 possible for the damage to occur only in the part of the file that
 stores object pickles.  Those errors will go undetected.
 """
 
 import binascii
+import io
 import struct
 import sys
 
 from ZODB._compat import FILESTORAGE_MAGIC
+from ZODB.FileStorage import parallel
 
 
 # The implementation is based closely on the read_index() function in
@@ -84,7 +89,7 @@ def U64(v):
         return l_
 
 
-def check(path):
+def check(path, jobs=1):
     with open(path, 'rb') as file:
         file.seek(0, 2)
         file_size = file.tell()
@@ -94,16 +99,51 @@ def check(path):
         if file.read(4) != packed_version:
             raise FormatError("invalid file header")
 
-        pos = 4
-        tid = b'\000' * 8  # lowest possible tid to start
-        i = 0
-        while pos:
-            _pos = pos
-            pos, tid = check_trec(path, file, pos, tid, file_size)
-            if tid is not None:
-                chatter("%10d: transaction tid %s #%d \n" %
-                        (_pos, hexify(tid), i))
-                i = i + 1
+        if jobs <= 1:
+            # lowest possible tid to start
+            check_range(path, file, 4, None, b'\000' * 8, 0, file_size)
+            return
+
+    for output, error in parallel.map_ranges(
+            path, _check_range, jobs, VERBOSE):
+        sys.stdout.write(output)
+        if error is not None:
+            raise error
+
+
+def check_range(path, file, pos, end, tid, i, file_size):
+    """Check the transaction records from pos up to end (or the end)
+
+    tid is the id of the transaction before pos and i the number of
+    transactions before pos.
+    """
+    file.seek(pos)
+    while pos and (end is None or pos < end):
+        _pos = pos
+        pos, tid = check_trec(path, file, pos, tid, file_size)
+        if tid is not None:
+            chatter("%10d: transaction tid %s #%d \n" %
+                    (_pos, hexify(tid), i))
+            i = i + 1
+
+
+def _check_range(path, trange, verbose):
+    # Check a range in a worker process, returning the output and the
+    # error found, if any.
+    global VERBOSE
+    VERBOSE = verbose
+    stdout = sys.stdout
+    sys.stdout = output = io.StringIO()
+    try:
+        with open(path, 'rb') as file:
+            file.seek(0, 2)
+            check_range(path, file, trange.pos, trange.end,
+                        trange.prev_tid, trange.index, file.tell())
+    except FormatError as error:
+        return output.getvalue(), error
+    finally:
+        sys.stdout = stdout
+    return output.getvalue(), None
 
 
 def check_trec(path, file, pos, ltid, file_size):
@@ -215,18 +255,21 @@ def main(args=None):
     import getopt
 
     global VERBOSE
+    jobs = 1
     try:
-        opts, args = getopt.getopt(args, 'v')
+        opts, args = getopt.getopt(args, 'vj:')
         if len(args) != 1:
             raise ValueError("expected one argument")
         for k, v in opts:
             if k == '-v':
                 VERBOSE = VERBOSE + 1
+            if k == '-j':
+                jobs = int(v)
     except (getopt.error, ValueError):
         usage()
 
     try:
-        check(args[0])
+        check(args[0], jobs)
     except FormatError as msg:
         sys.exit(msg)
 
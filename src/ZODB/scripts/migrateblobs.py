@@ -18,9 +18,14 @@ import logging
 import optparse
 import os
 import shutil
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
 
+from ZODB.blob import LAYOUTS
 from ZODB.blob import FilesystemHelper
-from ZODB.utils import oid_repr
 
 
 # Check if we actually have link
@@ -36,24 +41,56 @@ else:
             shutil.copy(f1, f2)
 
 
-def migrate(source, dest, layout):
+def migrate(source, dest, layout, jobs=8, report_interval=10):
+    """Migrate the blobs of directory source to directory dest.
+
+    The OID directories are migrated by a pool of jobs threads.
+    Progress is reported every report_interval seconds.
+    """
     source_fsh = FilesystemHelper(source)
     source_fsh.create()
     dest_fsh = FilesystemHelper(dest, layout)
     dest_fsh.create()
     print("Migrating blob data from `{}` ({}) to `{}` ({})".format(
         source, source_fsh.layout_name, dest, dest_fsh.layout_name))
-    for oid, path in source_fsh.listOIDs():
+
+    # Sharing blob data must be serialized, like in storages.
+    share_lock = threading.Lock()
+
+    def migrate_oid(oid, path):
         dest_path = dest_fsh.getPathForOID(oid, create=True)
         files = os.listdir(path)
         for file in files:
             source_file = os.path.join(path, file)
             dest_file = os.path.join(dest_path, file)
             link_or_copy(source_file, dest_file)
-        print(f"\tOID: {oid_repr(oid)} - {len(files)} files ")
+            if dest_fsh.layout.content_addressed:
+                with share_lock:
+                    dest_fsh.shareBlobFile(dest_file)
+        return len(files)
+
+    oids = files = 0
+    last_report = time.time()
+    with ThreadPoolExecutor(jobs) as executor:
+        pending = set()
+        for oid, path in source_fsh.listOIDs():
+            if len(pending) >= jobs * 4:
+                # Don't queue the whole directory
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    files += future.result()
+                    oids += 1
+                if time.time() - last_report >= report_interval:
+                    print(f"\tMigrated {oids} oids ({files} files)")
+                    last_report = time.time()
+            pending.add(executor.submit(migrate_oid, oid, path))
+        for future in pending:
+            files += future.result()
+            oids += 1
+    print(f"Migrated {oids} oids ({files} files)")
 
 
-def main(source=None, dest=None, layout="bushy"):
+def main(source=None, dest=None, layout="bushy", jobs=8):
     usage = "usage: %prog [options] <source> <dest> <layout>"
     description = ("Create the new directory <dest> and migrate all blob "
                    "data <source> to <dest> while using the new <layout> for "
@@ -62,9 +99,13 @@ def main(source=None, dest=None, layout="bushy"):
     parser = optparse.OptionParser(usage=usage, description=description)
     parser.add_option("-l", "--layout",
                       default=layout, type='choice',
-                      choices=['bushy', 'lawn'],
+                      choices=sorted(LAYOUTS),
                       help="Define the layout to use for the new directory "
-                      "(bushy or lawn). Default: %default")
+                      "(%s). Default: %%default" % ', '.join(sorted(LAYOUTS)))
+    parser.add_option("-j", "--jobs",
+                      default=jobs, type='int',
+                      help="Number of threads migrating blob directories. "
+                      "Default: %default")
     options, args = parser.parse_args()
 
     if not len(args) == 2:
@@ -74,7 +115,7 @@ def main(source=None, dest=None, layout="bushy"):
     logging.getLogger().setLevel(0)
 
     source, dest = args
-    migrate(source, dest, options.layout)
+    migrate(source, dest, options.layout, options.jobs)
 
 
 if __name__ == '__main__':
@@ -42,6 +42,41 @@ def test_fstest_verbose():
     """
 
 
+def test_fstest_jobs():
+    r"""
+    With -j, the file is checked by several processes, with the same
+    output:
+
+    >>> import transaction
+    >>> db = ZODB.DB('data.fs')
+    >>> conn = db.open()
+    >>> for i in range(10):
+    ...     conn.root()[i] = i
+    ...     transaction.commit()
+    >>> db.close()
+    >>> import ZODB.scripts.fstest
+    >>> ZODB.scripts.fstest.main(['-j', '3', 'data.fs'])
+
+    >>> ZODB.scripts.fstest.main(['-v', '-j', '3', 'data.fs'])
+    ... # doctest: +ELLIPSIS +NORMALIZE_WHITESPACE
+             4: transaction tid ... #0
+    ...
+          ...: transaction tid ... #10
+    no errors detected
+    >>> ZODB.scripts.fstest.VERBOSE = 0
+
+    The first error is reported:
+
+    >>> with open('data.fs', 'r+b') as f:
+    ...     _ = f.seek(-4, 2)
+    ...     _ = f.write(b'xxxx')
+    >>> ZODB.scripts.fstest.check('data.fs', 3)  # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+    ...
+    ZODB.scripts.fstest.FormatError: data.fs has inconsistent ...
+    """
+
+
 def test_suite():
     return unittest.TestSuite([
         doctest.DocTestSuite('ZODB.scripts.fstest'),
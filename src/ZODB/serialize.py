@@ -474,25 +474,66 @@ class ObjectReader:
         self._conn = conn
         self._cache = cache
         self._factory = factory
+        # (module name, global name) -> global, as returned by the
+        # factory.  See _get_class.
+        self._class_cache = {}
+        # An unpickler that isn't being used by a load in progress and
+        # can be pointed at the next pickle.  See _get_unpickler.
+        self._unpickler = None
 
     def _get_class(self, module, name):
-        return self._factory(self._conn, module, name)
+        try:
+            return self._class_cache[module, name]
+        except KeyError:
+            pass
+        klass = self._factory(self._conn, module, name)
+        # Don't remember broken classes, so that we notice when the
+        # missing module or class becomes available.
+        if not (isinstance(klass, type) and issubclass(klass, broken.Broken)):
+            self._class_cache[module, name] = klass
+        return klass
+
+    def clearClassCache(self):
+        """Forget the globals looked up through the class factory.
+
+        This must be called if the classes an application uses are
+        replaced, for example when code is reloaded.
+        """
+        self._class_cache.clear()
 
     def _get_unpickler(self, pickle):
-        file = BytesIO(pickle)
-
-        factory = self._factory
-        conn = self._conn
-
-        def find_global(modulename, name):
-            return factory(conn, modulename, name)
-        unpickler = PersistentUnpickler(
-            find_global, self._persistent_load, file)
-
+        # Creating an unpickler for every record is surprisingly
+        # expensive, so we keep one around and point it at the new
+        # pickle.  Loading a record can re-enter the reader (through
+        # persistent_load and Connection.get), in which case the
+        # unpickler is in use and we fall back to a fresh one.
+        # Callers pass the unpickler to _release_unpickler when done;
+        # one whose load failed is simply dropped.
+        unpickler = self._unpickler
+        if unpickler is None:
+            file = BytesIO(pickle)
+            unpickler = PersistentUnpickler(
+                self._get_class, self._persistent_load, file)
+            unpickler.zodb_file = file
+        else:
+            self._unpickler = None
+            unpickler.zodb_file.__init__(pickle)
         return unpickler
 
+    def _release_unpickler(self, unpickler):
+        # Don't keep the last record's pickle and objects alive.
+        unpickler.zodb_file.__init__()
+        unpickler.memo.clear()
+        self._unpickler = unpickler
+
     loaders = {}
 
+    def _count(self, name):
+        # Count a cache lookup in the connection's database metrics
+        metrics = getattr(self._conn, '_metrics', None)
+        if metrics is not None:
+            metrics.increment(name)
+
     def _persistent_load(self, reference):
         if isinstance(reference, tuple):
             return self.load_persistent(*reference)
@@ -518,6 +559,7 @@ class ObjectReader:
 
         obj = self._cache.get(oid, None)
         if obj is not None:
+            self._count('cache_hits')
             return obj
 
         if isinstance(klass, tuple):
@@ -538,6 +580,7 @@ class ObjectReader:
 
         # TODO: should be done by connection
         self._cache.new_ghost(oid, obj)
+        self._count('cache_misses')
         return obj
 
     def load_multi_persistent(self, database_name, oid, klass):
@@ -577,6 +620,7 @@ class ObjectReader:
             oid = oid.encode('ascii')
         obj = self._cache.get(oid, None)
         if obj is not None:
+            self._count('cache_hits')
             return obj
         return self._conn.get(oid)
 
@@ -591,6 +635,7 @@ class ObjectReader:
     def getClassName(self, pickle):
         unpickler = self._get_unpickler(pickle)
         klass = unpickler.load()
+        self._release_unpickler(unpickler)
         if isinstance(klass, tuple):
             klass, args = klass
             if isinstance(klass, tuple):
@@ -601,6 +646,7 @@ class ObjectReader:
     def getGhost(self, pickle):
         unpickler = self._get_unpickler(pickle)
         klass = unpickler.load()
+        self._release_unpickler(unpickler)
         if isinstance(klass, tuple):
             # Here we have a separate class and args.
             # This could be an old record, so the class module ne a named
@@ -628,11 +674,13 @@ class ObjectReader:
         unpickler = self._get_unpickler(pickle)
         try:
             unpickler.load()  # skip the class metadata
-            return unpickler.load()
+            state = unpickler.load()
         except EOFError:
             log = logging.getLogger("ZODB.serialize")
             log.exception("Unpickling error: %r", pickle)
             raise
+        self._release_unpickler(unpickler)
+        return state
 
     def setGhostState(self, obj, pickle):
         state = self.getState(pickle)
@@ -43,6 +43,7 @@ class MVCCMappingStorage(MappingStorage):
         # and OID sequence.
         inst._data = self._data
         inst._transactions = self._transactions
+        inst._record_info = self._record_info
         inst._commit_lock = self._commit_lock
         inst.new_oid = self.new_oid
         inst.pack = self.pack
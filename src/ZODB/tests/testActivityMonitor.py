@@ -50,7 +50,10 @@ class Tests(unittest.TestCase):
         am.closedConnection(c)
         c._transferred(3, 7)
         am.closedConnection(c)
-        self.assertEqual(len(am.log), 2)
+        # Both connections were closed in the same time bucket:
+        self.assertEqual(len(am.log), 1)
+        [(t, loads, stores)] = am.log
+        self.assertEqual((loads, stores), (4, 9))
 
     def testTrim(self):
         am = ActivityMonitor(history_length=0.1)
@@ -63,7 +66,7 @@ class Tests(unittest.TestCase):
         self.assertLessEqual(len(am.log), 1)
 
     def testSetHistoryLength(self):
-        am = ActivityMonitor(history_length=3600)
+        am = ActivityMonitor(history_length=6, buckets=60)
         c = FakeConnection()
         c._transferred(1, 2)
         am.closedConnection(c)
@@ -95,6 +98,7 @@ class Tests(unittest.TestCase):
         div = res[9]
         self.assertEqual(div['stores'], 9)
         self.assertEqual(div['loads'], 4)
+        self.assertEqual(div['connections'], 2)
         self.assertGreater(div['start'], 0)
         self.assertGreaterEqual(div['start'], lastend)
         self.assertLess(div['start'], div['end'])
@@ -18,6 +18,8 @@ import unittest
 import transaction
 
 import ZODB
+import ZODB.DemoStorage
+import ZODB.MappingStorage
 import ZODB.tests.util
 from ZODB.tests.MinPO import MinPO
 
@@ -57,6 +59,115 @@ class DBTests(ZODB.tests.util.TestCase):
         self.db.setCacheSize(15)
         self.db.setHistoricalCacheSize(15)
 
+    def test_hot_set(self):
+        db = ZODB.DB('hot.fs', hot_set_file='hot.set')
+        with db.transaction() as conn:
+            for i in range(20):
+                conn.root()[i] = MinPO(i)
+        db.cacheMinimize()
+        conn = db.open()
+        root = conn.root()
+        for i in range(4):
+            root[i].value
+        conn2 = db.open(transaction.TransactionManager())
+        conn2.root()[4].value
+
+        # Objects used by more connections come first:
+        hot = db.hotSet()
+        self.assertEqual(db.hotSet(2), hot[:2])
+        self.assertEqual(hot[0], root._p_oid)
+        self.assertEqual(sorted(hot[1:]),
+                         sorted(root[i]._p_oid for i in range(5)))
+        conn.close()
+        conn2.close()
+        db.close()
+
+        db = ZODB.DB('hot.fs', hot_set_file='hot.set')
+        conn = db.open()
+        self.assertEqual(sorted(conn._cache.lru_items()[i][0]
+                                for i in range(6)), sorted(hot))
+        conn.close()
+        self.assertEqual(db.warmUp('hot.set', 0), 0)
+
+        # Only so many objects are loaded:
+        db.setCacheSize(2)
+        conn.cacheMinimize()
+        self.assertEqual(db.warmUp(), 2)
+        db.close()
+
+        with open('hot.set', 'wb') as f:
+            f.write(b'junk')
+        db = ZODB.DB('hot.fs', hot_set_file='hot.set')
+        self.assertEqual(db.open()._cache.cache_non_ghost_count, 0)
+        db.close()
+
+    def test_hot_set_other_storages(self):
+        # Objects are loaded in the saved order:
+        for storage in (ZODB.MappingStorage.MappingStorage(),
+                        ZODB.DemoStorage.DemoStorage()):
+            db = ZODB.DB(storage, hot_set_file='hot.set')
+            with db.transaction() as conn:
+                for i in range(5):
+                    conn.root()[i] = MinPO(i)
+            conn = db.open()
+            for i in range(5):
+                conn.root()[i].value
+            hot = db.hotSet()
+            conn.close()
+            db.saveHotSet()
+            db.cacheMinimize()
+            self.assertEqual(db.warmUp(), 6)
+            conn = db.open()
+            self.assertEqual(
+                [oid for oid, _ in conn._cache.lru_items()], hot)
+            conn.close()
+            db.close()
+
+            db = ZODB.DB(storage.__class__(), hot_set_file='hot.set')
+            self.assertEqual(db.open()._cache.cache_non_ghost_count, 1)
+            db.close()
+
+    def test_total_cache_size_bytes(self):
+        db = ZODB.DB(None, total_cache_size_bytes=2000)
+        self.assertEqual(db.getTotalCacheSizeBytes(), 2000)
+        tm1 = transaction.TransactionManager()
+        c1 = db.open(tm1)
+        tm2 = transaction.TransactionManager()
+        c2 = db.open(tm2)
+        # Open connections share the budget:
+        self.assertEqual(c1._cache.cache_size_bytes, 1000)
+        self.assertEqual(c2._cache.cache_size_bytes, 1000)
+
+        root = c1.root()
+        for i in range(10):
+            root[i] = MinPO('x' * 200)
+        tm1.commit()
+        size = c1._cache.total_estimated_size
+        self.assertGreater(size, 0)
+
+        # Pooled connections keep their caches while within budget,
+        # open connections get what's left:
+        c1.close()
+        self.assertEqual(c1._cache.total_estimated_size, size)
+        self.assertEqual(c2._cache.cache_size_bytes, 2000 - size)
+
+        # The caches of pooled connections are minimized when the
+        # budget is exceeded:
+        db.setTotalCacheSizeBytes(size // 2)
+        self.assertEqual(c1._cache.total_estimated_size, 0)
+        self.assertEqual(c2._cache.cache_size_bytes, size // 2)
+
+        # The configured cache size still applies when it's smaller:
+        db.setCacheSizeBytes(100)
+        self.assertEqual(c2._cache.cache_size_bytes, 100)
+
+        db.setTotalCacheSizeBytes(0)
+        self.assertEqual(c2._cache.cache_size_bytes, 100)
+        db.setCacheSizeBytes(0)
+        self.assertEqual(c2._cache.cache_size_bytes, 0)
+        c2.close()
+        db.close()
+
     def test_references(self):
 
         # TODO: For now test that we're using referencesf.  We really should
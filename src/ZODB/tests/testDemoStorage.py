@@ -269,6 +269,245 @@ def load_before_base_storage_current():
     """
 
 
+def load_before_uses_changes_index():
+    """
+    DemoStorage keeps an index of the first transaction in its changes
+    for each object, so it neither asks the changes about objects that
+    aren't in them, nor walks back the changes to find out when a base
+    record stopped being current.
+
+    >>> import ZODB.DB
+    >>> import ZODB.MappingStorage
+    >>> base = ZODB.MappingStorage.MappingStorage()
+    >>> basedb = ZODB.DB(base)
+    >>> with basedb.transaction() as conn:
+    ...     conn.root()['a'] = conn.root().__class__()
+    >>> with basedb.transaction() as conn:
+    ...     a = conn.root()['a']._p_oid
+    >>> base_tid = base.lastTransaction()
+
+    >>> changes = ZODB.MappingStorage.MappingStorage()
+    >>> storage = ZODB.DemoStorage.DemoStorage(
+    ...     base=base, changes=changes,
+    ...     close_base_on_close=False, close_changes_on_close=False)
+    >>> db = ZODB.DB(storage)
+    >>> for i in range(3):
+    ...     with db.transaction() as conn:
+    ...         conn.root()['x'] = i
+    >>> first = storage._changes_index[ZODB.utils.z64]
+    >>> first == load_current(changes, ZODB.utils.z64)[1]
+    False
+
+    >>> loads = []
+    >>> changes_loadBefore = changes.loadBefore
+    >>> def loadBefore(oid, tid):
+    ...     loads.append(oid)
+    ...     return changes_loadBefore(oid, tid)
+    >>> changes.loadBefore = loadBefore
+
+    >>> storage.loadBefore(a, ZODB.utils.maxtid) == base.loadBefore(
+    ...     a, ZODB.utils.maxtid)
+    True
+    >>> before = ZODB.utils.p64(ZODB.utils.u64(base_tid) + 1)
+    >>> storage.loadBefore(ZODB.utils.z64, before) == (
+    ...     load_current(base, ZODB.utils.z64) + (first,))
+    True
+    >>> loads
+    []
+
+    New objects are indexed before invalidations are sent, and
+    forgotten if the transaction fails:
+
+    >>> import transaction
+    >>> seen = []
+    >>> def finish(tid):
+    ...     seen.append(storage._changes_index.get(oid) == tid)
+    >>> def commit(oid):
+    ...     t = transaction.Transaction()
+    ...     storage.tpc_begin(t)
+    ...     storage.store(oid, ZODB.utils.z64, b'x', '', t)
+    ...     storage.tpc_vote(t)
+    ...     try:
+    ...         storage.tpc_finish(t, finish)
+    ...     except ValueError:
+    ...         storage.tpc_abort(t)
+    >>> oid = storage.new_oid()
+    >>> commit(oid)
+    >>> seen
+    [True]
+
+    >>> def tpc_finish(transaction, func):
+    ...     func(b'\\0' * 8)
+    ...     raise ValueError
+    >>> changes.tpc_finish = tpc_finish
+    >>> oid = storage.new_oid()
+    >>> commit(oid)
+    >>> seen
+    [True, True]
+    >>> oid in storage._changes_index
+    False
+    >>> del changes.tpc_finish
+    >>> storage._commit_lock.locked()
+    False
+    >>> del loads[:]
+
+    The index is built from the changes when first needed, so changes
+    that already have data can be used:
+
+    >>> db.close()
+    >>> storage = ZODB.DemoStorage.DemoStorage(base=base, changes=changes)
+    >>> storage.loadBefore(ZODB.utils.z64, before)[-1] == first
+    True
+    >>> loads
+    []
+
+    Changes that can't be iterated are walked back as before:
+
+    >>> del changes.loadBefore
+    >>> def iterator():
+    ...     raise ZODB.POSException.Unsupported
+    >>> changes.iterator = iterator
+    >>> storage = ZODB.DemoStorage.DemoStorage(base=base, changes=changes)
+    >>> storage.loadBefore(ZODB.utils.z64, before)[-1] == first
+    True
+    >>> storage._changes_index
+    False
+
+    >>> storage.close()
+    >>> basedb.close()
+    """
+
+
+def push_pop_share_current_records():
+    """
+    The storages of a push/pop stack share the current records they
+    load, so that the top storage doesn't ask each storage below it.
+
+    >>> import ZODB.DB
+    >>> base = ZODB.DemoStorage.DemoStorage()
+    >>> db = ZODB.DB(base)
+    >>> with db.transaction() as conn:
+    ...     for i in range(10):
+    ...         conn.root()[i] = conn.root().__class__(x=i)
+    >>> with db.transaction() as conn:
+    ...     oids = [conn.root()[i]._p_oid for i in range(10)]
+    >>> db.close()
+
+    >>> storage = base.push()
+    >>> db = ZODB.DB(storage)
+    >>> with db.transaction() as conn:
+    ...     conn.root()[0]['x'] = 'changed'
+
+    >>> loads = []
+    >>> base_loadBefore = base.loadBefore
+    >>> def loadBefore(oid, tid):
+    ...     loads.append(oid)
+    ...     return base_loadBefore(oid, tid)
+    >>> base.loadBefore = loadBefore
+
+    >>> storage2 = storage.push()
+    >>> for oid in oids:
+    ...     _ = load_current(storage2, oid)
+    >>> len(loads)
+    9
+    >>> for oid in oids:
+    ...     _ = load_current(storage2, oid)
+    >>> len(loads)
+    9
+
+    Popping forgets the records of the popped storage, and only those:
+
+    >>> storage2.pop() is storage
+    True
+    >>> load_current(storage, oids[0])[0] == load_current(
+    ...     storage.changes, oids[0])[0]
+    True
+    >>> storage.pop() is base
+    True
+    >>> base._current.owner is base
+    True
+    >>> oids[0] in base._current.records
+    False
+    >>> all(oid in base._current.records for oid in oids[1:])
+    True
+    >>> load_current(base, oids[0]) == load_current(base.changes, oids[0])
+    True
+
+    Storages pushed on a storage that isn't at the top of its stack
+    don't share records with the stack:
+
+    >>> storage = base.push()
+    >>> other = base.push()
+    >>> other._current is storage._current
+    False
+    >>> storage._current.owner is storage
+    True
+
+    Commits to storages below the top of a stack drop their records
+    from the stacks above them:
+
+    >>> _ = load_current(storage, oids[1]), load_current(other, oids[1])
+    >>> import transaction
+    >>> t = transaction.Transaction()
+    >>> base.tpc_begin(t)
+    >>> base.store(oids[1], load_current(base, oids[1])[1], b'new', '', t)
+    >>> _ = base.tpc_vote(t)
+    >>> tid = base.tpc_finish(t)
+    >>> load_current(storage, oids[1]) == (b'new', tid)
+    True
+    >>> load_current(other, oids[1]) == (b'new', tid)
+    True
+
+    Records loaded before a commit don't replace the committed ones:
+
+    >>> current = storage._current
+    >>> storage._add_current(oids[1], (b'old', ZODB.utils.z64),
+    ...                      current.generation)
+    >>> current.records[oids[1]] == (b'new', tid)
+    True
+    >>> generation = current.generation
+    >>> del current.records[oids[2]]
+    >>> t = transaction.Transaction()
+    >>> base.tpc_begin(t)
+    >>> base.store(oids[3], load_current(base, oids[3])[1], b'new', '', t)
+    >>> _ = base.tpc_vote(t)
+    >>> _ = base.tpc_finish(t)
+    >>> storage._add_current(oids[2], (b'old', ZODB.utils.z64), generation)
+    >>> oids[2] in current.records
+    False
+
+    >>> db.close()
+    """
+
+
+def undo_forgets_current_records():
+    """
+    Objects undone through a pushed storage are loaded again:
+
+    >>> import ZODB.DB
+    >>> import ZODB.FileStorage
+    >>> storage = ZODB.DemoStorage.DemoStorage().push(
+    ...     ZODB.FileStorage.FileStorage('changes.fs'))
+    >>> db = ZODB.DB(storage)
+    >>> with db.transaction() as conn:
+    ...     conn.root()['x'] = 0
+    >>> with db.transaction() as conn:
+    ...     conn.root()['x'] = 1
+    >>> with db.transaction() as conn:
+    ...     conn.root()['x']
+    1
+
+    >>> import transaction
+    >>> db.undo(db.undoLog(0, 1)[0]['id'])
+    >>> transaction.commit()
+    >>> with db.transaction() as conn:
+    ...     conn.root()['x']
+    0
+
+    >>> db.close()
+    """
+
+
 def test_suite():
     suite = unittest.TestSuite((
         doctest.DocTestSuite(
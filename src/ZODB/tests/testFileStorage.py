@@ -12,6 +12,7 @@
 #
 ##############################################################################
 import os
+import shutil
 
 
 if os.environ.get('USE_ZOPE_TESTING_DOCTEST'):
@@ -20,12 +21,17 @@ else:
     import doctest
 
 import sys
+import threading
+import time
 import unittest
+from unittest import mock
 
 import transaction
 import zope.testing.setupstack
+from persistent.TimeStamp import TimeStamp
 
 import ZODB.FileStorage
+import ZODB.serialize
 import ZODB.tests.hexstorage
 import ZODB.tests.testblob
 from ZODB import DB
@@ -34,6 +40,10 @@ from ZODB._compat import _protocol
 from ZODB._compat import dump
 from ZODB._compat import dumps
 from ZODB.Connection import TransactionMetaData
+from ZODB.FileStorage.FileStorage import PackInterrupted
+from ZODB.FileStorage.FileStorage import read_index
+from ZODB.FileStorage.FileStorage import read_index_journal
+from ZODB.FileStorage.format import MappedFile
 from ZODB.fsIndex import fsIndex
 from ZODB.interfaces import IStorageWrapper
 from ZODB.tests import BasicStorage
@@ -52,9 +62,11 @@ from ZODB.tests import Synchronization
 from ZODB.tests import TransactionalUndoStorage
 from ZODB.tests.StorageTestBase import MinPO
 from ZODB.tests.StorageTestBase import zodb_pickle
+from ZODB.tests.StorageTestBase import zodb_unpickle
 from ZODB.utils import U64
 from ZODB.utils import load_current
 from ZODB.utils import p64
+from ZODB.utils import readable_tid_repr
 from ZODB.utils import z64
 
 from . import util
@@ -210,6 +222,153 @@ class FileStorageTests(
         self.open()
         self.assertEqual(self._storage._saved, 1)
 
+    def crash_copy(self):
+        # Copy the files as they'd be left by a crash.
+        self._storage._checkpointer.flush()
+        for ext in '', '.index', '.index_journal':
+            shutil.copyfile('FileStorageTests.fs' + ext, 'crash.fs' + ext)
+        return ZODB.FileStorage.FileStorage('crash.fs')
+
+    def test_index_checkpoints(self):
+        # Spread objects over several index buckets:
+        for i in range(20):
+            self._dostore(p64(i << 16))
+        self._storage.close()
+        self.open(checkpoint_transactions=5)
+        positions = []
+        for i in range(12):
+            self._dostore(p64(1 << 16 | i + 1))
+            positions.append(self._storage._pos)
+
+        # The index file wasn't rewritten, but the journal has the
+        # changes up to the 10th transaction:
+        self._storage._checkpointer.flush()
+        pos = fsIndex.load('FileStorageTests.fs.index')['pos']
+        self.assertEqual(
+            read_index_journal(
+                'FileStorageTests.fs.index_journal', fsIndex(), pos),
+            positions[9])
+
+        crashed = self.crash_copy()
+        self.assertTrue(crashed._used_index)
+        self.assertTrue(crashed._used_journal)
+        self.assertEqual(crashed._pos, self._storage._pos)
+        self.assertEqual(list(crashed._index.items()),
+                         list(self._storage._index.items()))
+        crashed.close()
+
+        # Closing saves the full index and removes the journal:
+        self._storage.close()
+        self.assertFalse(os.path.exists('FileStorageTests.fs.index_journal'))
+        self.open()
+        self.assertTrue(self._storage._used_index)
+        self.assertFalse(self._storage._used_journal)
+
+    def test_index_checkpoints_rewrite_index(self):
+        # When the journal gets bigger than the index, checkpoints write
+        # the full index, merged from the index file and the journal.
+        for i in range(20):
+            self._dostore(p64(i << 16))
+        self._storage.close()
+        self.open(checkpoint_transactions=1)
+        index = self._storage._index
+        buckets = index.buckets
+
+        def changed_buckets(prefixes=None):
+            # The full index isn't copied with the storage lock held:
+            self.assertIsNotNone(prefixes)
+            return buckets(prefixes)
+
+        index.buckets = changed_buckets
+        positions = []
+        for i in range(10):
+            self._dostore(p64(3 << 16 | i + 1))
+            positions.append(self._storage._pos)
+        self._storage._checkpointer.flush()
+        pos = fsIndex.load('FileStorageTests.fs.index')['pos']
+        self.assertGreater(pos, positions[5])
+
+        crashed = self.crash_copy()
+        self.assertTrue(crashed._used_index)
+        self.assertEqual(crashed._pos, self._storage._pos)
+        self.assertEqual(list(crashed._index.items()),
+                         list(self._storage._index.items()))
+        crashed.close()
+
+    def test_parallel_index_rebuild(self):
+        revids = {}
+        for i in range(30):
+            oid = p64(i % 7)
+            revids[oid] = self._dostore(oid, revids.get(oid))
+        storage = self._storage
+        expected = (list(storage._index.items()), storage._pos,
+                    storage._oid, storage._ltid)
+        storage.close()
+        os.remove('FileStorageTests.fs.index')
+        self.open(rebuild_index_jobs=3)
+        storage = self._storage
+        self.assertFalse(storage._used_index)
+        self.assertEqual((list(storage._index.items()), storage._pos,
+                          storage._oid, storage._ltid), expected)
+
+    def test_parallel_read_index(self):
+        revids = {}
+        tids = []
+        for i in range(30):
+            oid = p64(i % 7)
+            revids[oid] = tid = self._dostore(oid, revids.get(oid))
+            tids.append(tid)
+        self._storage.close()
+
+        def scan(jobs, **kw):
+            index = fsIndex()
+            with open('FileStorageTests.fs', 'rb') as f:
+                result = read_index(
+                    f, 'FileStorageTests.fs', index, {}, jobs=jobs,
+                    read_only=1, **kw)
+            return list(index.items()), result
+
+        self.assertEqual(scan(3), scan(1))
+        self.assertEqual(scan(3, stop=tids[20]), scan(1, stop=tids[20]))
+
+        # A damaged transaction is left to the sequential scan.
+        with open('FileStorageTests.fs', 'r+b') as f:
+            f.seek(-20, 2)
+            f.truncate()
+        self.assertEqual(scan(3), scan(1))
+
+    def test_iterator_maps_committed_file(self):
+        storage = self._storage
+        revids = {}
+        for i in range(10):
+            oid = p64(i % 3)
+            revids[oid] = self._dostore(oid, revids.get(oid), MinPO(i),
+                                        description='t%d' % i)
+
+        def read():
+            it = ZODB.FileStorage.FileIterator('FileStorageTests.fs')
+            mapped = isinstance(it._file, MappedFile)
+            records = [(t.description, r.oid, r.tid, r.data)
+                       for t in it for r in t]
+            it.close()
+            return mapped, records
+
+        mapped, records = read()
+        self.assertTrue(mapped)
+        self.assertEqual([r[0] for r in records],
+                         [b't%d' % i for i in range(10)])
+        with mock.patch.object(ZODB.FileStorage.FileIterator, '_map'):
+            self.assertEqual(read(), (False, records))
+
+        # The file isn't mapped while a transaction is being committed,
+        # as it will be truncated if the transaction is aborted:
+        t = TransactionMetaData()
+        storage.tpc_begin(t)
+        storage.store(p64(1), revids[p64(1)], zodb_pickle(MinPO(0)), '', t)
+        storage.tpc_vote(t)
+        self.assertEqual(read(), (False, records))
+        storage.tpc_abort(t)
+
     def testStoreBumpsOid(self):
         # If .store() is handed an oid bigger than the storage knows
         # about already, it's crucial that the storage bump its notion
@@ -392,6 +551,38 @@ class FileStorageTests(
             self._storage._files.flush = lambda: None
             self.testFlushAfterTruncate(True)
 
+    def testReadsDontNeedStorageLock(self):
+        # Read-only record access goes through the file pool, so it
+        # isn't serialized with commits and other readers through the
+        # storage lock.
+        r1 = self._dostore(z64, data=MinPO(1))
+        r2 = self._dostore(z64, revid=r1, data=MinPO(2))
+        storage = self._storage
+        results = []
+
+        def read():
+            results.append((
+                storage.loadSerial(z64, r1),
+                storage.getTid(z64),
+                [h['tid'] for h in storage.history(z64, 2)],
+                [d['id'] for d in storage.undoLog(0, 2)],
+                storage.lastInvalidations(1),
+            ))
+
+        with storage._lock:
+            thread = threading.Thread(target=read)
+            thread.daemon = True
+            thread.start()
+            thread.join(10)
+            self.assertFalse(thread.is_alive())
+
+        [(data, tid, history, undo_log, invalidations)] = results
+        self.assertEqual(zodb_unpickle(data), MinPO(1))
+        self.assertEqual(tid, r2)
+        self.assertEqual(history, [r2, r1])
+        self.assertEqual(len(undo_log), 2)
+        self.assertEqual(invalidations, [(r2, [z64])])
+
     def testCommitWithEmptyData(self):
         """
         Verify that transaction is persisted even if it has no data, or even
@@ -421,6 +612,235 @@ class FileStorageTests(
             drecv = list(trec)
             self.assertEqual(drecv, [])
 
+    def testPackCatchUp(self):
+        # Txns committed during a pack are copied in catch-up rounds
+        # without the commit lock, then in a small final step.
+        phases = []
+        storage = ZODB.FileStorage.FileStorage(
+            'catchup.fs', create=True, pack_progress=(
+                lambda phase, pos, end: phases.append(phase)))
+        db = DB(storage)
+        conn = db.open()
+        root = conn.root()
+        for i in range(3):
+            root['x'] = i
+            transaction.commit()
+
+        def commit_during_pack(phase, pos, end):
+            phases.append(phase)
+            if phase != 'final':
+                self.assertFalse(storage._commit_lock.locked())
+                root['y'] = len(phases)
+                transaction.commit()
+
+        storage.pack_progress = commit_during_pack
+        with mock.patch('ZODB.FileStorage.fspack.FINAL_BYTES', 0):
+            with mock.patch('ZODB.FileStorage.fspack.MAX_CATCH_UP_ROUNDS', 2):
+                db.pack(time.time() + 1)
+        self.assertEqual(phases, ['copy', 'catch-up', 'catch-up', 'final'])
+
+        conn.close()
+        db.close()
+        db = DB(ZODB.FileStorage.FileStorage('catchup.fs'))
+        root = db.open().root()
+        self.assertEqual((root['x'], root['y']), (2, 3))
+        db.close()
+
+    def _packData(self, name, **kw):
+        db = DB(ZODB.FileStorage.FileStorage(name, create=True, **kw))
+        conn = db.open()
+        root = conn.root()
+        for i in range(5):
+            root[i] = MinPO(i)
+        transaction.commit()
+        for i in range(20):
+            root[i % 5].value = i
+            transaction.commit()
+        del root[0]
+        transaction.commit()
+        conn.close()
+        return db
+
+    def testResumePack(self):
+        from ZODB.FileStorage import fspack
+        db = self._packData('resume.fs', pack_checkpoint_bytes=1)
+        storage = db.storage
+        shutil.copyfile('resume.fs', 'reference.fs')
+        copyDataRecords = fspack.FileStoragePacker.copyDataRecords
+
+        def copy_some(packer, pos, th):
+            if len(packer.index) >= 3:
+                packer.time_budget = 0
+            return copyDataRecords(packer, pos, th)
+
+        packtime = time.time() + 1
+        with mock.patch.object(fspack.FileStoragePacker, 'copyDataRecords',
+                               copy_some):
+            self.assertRaises(PackInterrupted, db.pack, packtime)
+        self.assertTrue(os.path.exists('resume.fs.pack_checkpoint'))
+        self.assertTrue(os.path.exists('resume.fs.pack'))
+        self.assertEqual(len(storage._index), 6)  # not packed yet
+
+        conn = db.open()
+        conn.root()['new'] = MinPO(42)
+        transaction.commit()
+        conn.close()
+
+        with mock.patch.object(fspack.GC, 'findReachable') as findReachable:
+            db.pack(packtime + 60)
+        self.assertFalse(findReachable.called)
+        self.assertFalse(os.path.exists('resume.fs.pack_checkpoint'))
+        self.assertEqual(len(storage._index), 6)
+        root = db.open().root()
+        self.assertEqual(sorted(root.keys(), key=str), [1, 2, 3, 4, 'new'])
+        self.assertEqual(root[4].value, 19)
+        db.close()
+
+        reference = ZODB.FileStorage.FileStorage('reference.fs')
+        reference.pack(packtime, ZODB.serialize.referencesf)
+        reference.close()
+        with open('reference.fs', 'rb') as f:
+            expected = f.read()
+        with open('resume.fs', 'rb') as f:
+            self.assertEqual(f.read(len(expected)), expected)
+
+    def testPackCheckpointNotResumed(self):
+        db = self._packData('resume.fs', pack_checkpoint_bytes=1,
+                            pack_time_budget=0)
+        self.assertRaises(PackInterrupted, db.pack, time.time() + 1)
+        self.assertTrue(os.path.exists('resume.fs.pack_checkpoint'))
+
+        # A checkpoint for another pack time or GC option isn't used.
+        storage = db.storage
+        storage.pack_time_budget = None
+        with mock.patch('ZODB.FileStorage.fspack.GC.findReachable',
+                        side_effect=ZODB.FileStorage.fspack.GC.findReachable,
+                        autospec=True) as findReachable:
+            storage.pack(time.time() - 3600, ZODB.serialize.referencesf)
+            self.assertEqual(findReachable.call_count, 1)
+            storage.pack(time.time() + 1, ZODB.serialize.referencesf,
+                         gc=False)
+            self.assertEqual(findReachable.call_count, 2)
+        self.assertFalse(os.path.exists('resume.fs.pack_checkpoint'))
+        self.assertEqual(len(storage._index), 6)  # no GC
+        db.close()
+
+    def testPackCheckpointEarlierPackTime(self):
+        db = self._packData('resume.fs', pack_checkpoint_bytes=1,
+                            pack_time_budget=0)
+        packtime = time.time() + 1
+        self.assertRaises(PackInterrupted, db.pack, packtime)
+
+        # A checkpoint for an earlier pack time is resumed, which is
+        # logged with the pack time used.
+        storage = db.storage
+        storage.pack_time_budget = None
+        with self.assertLogs('ZODB.FileStorage.fspack') as logs:
+            storage.pack(packtime + 3600, ZODB.serialize.referencesf)
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(logs.records[0].levelname, 'WARNING')
+
+        def tid(t):
+            return readable_tid_repr(
+                TimeStamp(*time.gmtime(t)[:5] + (t % 60,)).raw())
+
+        self.assertIn(' to %s, earlier than the requested %s,' % (
+            tid(packtime), tid(packtime + 3600)),
+            logs.records[0].getMessage())
+        self.assertFalse(os.path.exists('resume.fs.pack_checkpoint'))
+        db.close()
+
+    def testPackTimeBudgetExcludesGC(self):
+        from ZODB.FileStorage import fspack
+
+        # Without checkpoints, an interrupted pack would start over.
+        self.assertRaises(ValueError, ZODB.FileStorage.FileStorage,
+                          'budget.fs', pack_time_budget=10)
+        db = self._packData('budget.fs', pack_checkpoint_bytes=1 << 20,
+                            pack_time_budget=10)
+        clock = [0]
+        findReachable = fspack.GC.findReachable
+
+        def slow_gc(gc):
+            findReachable(gc)
+            clock[0] += 60
+
+        with mock.patch.object(fspack.GC, 'findReachable', slow_gc), \
+                mock.patch.object(fspack.time, 'monotonic',
+                                  lambda: clock[0]):
+            db.pack(time.time() + 1)
+        self.assertEqual(len(db.storage._index), 5)
+        db.close()
+
+    def testPausePack(self):
+        paused = threading.Event()
+        db = self._packData(
+            'pause.fs', pack_progress=(
+                lambda phase, pos, end: phase == 'paused' and paused.set()))
+        storage = db.storage
+        storage.pausePack()
+        thread = threading.Thread(target=db.pack, args=(time.time() + 1,))
+        thread.daemon = True
+        thread.start()
+        self.assertTrue(paused.wait(10))
+
+        conn = db.open()
+        conn.root()['new'] = MinPO(42)
+        transaction.commit()
+        conn.close()
+
+        storage.resumePack()
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(storage._index), 6)
+        self.assertEqual(db.open().root()['new'].value, 42)
+        db.close()
+
+    def testPackFinalStepBounded(self):
+        # If commits outpace the catch-up rounds, the commit lock is
+        # released while copying each txn until little is left.
+        from ZODB.FileStorage import fspack
+        db = self._packData('bounded.fs')
+        storage = db.storage
+        conn = db.open()
+
+        def commit_during_pack(phase, pos, end):
+            if phase == 'copy':
+                for i in range(3):
+                    conn.root()['y'] = i
+                    transaction.commit()
+
+        storage.pack_progress = commit_during_pack
+        locked = []
+        copy = fspack.PackCopier.copy
+
+        def copy_and_check(copier, *args):
+            locked.append(storage._commit_lock.locked())
+            return copy(copier, *args)
+
+        with mock.patch.object(fspack.PackCopier, 'copy', copy_and_check), \
+                mock.patch.object(fspack, 'MAX_CATCH_UP_ROUNDS', 0), \
+                mock.patch.object(fspack, 'FINAL_BYTES', 0):
+            db.pack(time.time() + 1)
+        self.assertEqual(locked, [False] * 3)
+        self.assertEqual(conn.root()['y'], 2)
+        conn.close()
+        db.close()
+
+    def testPackThrottle(self):
+        from ZODB.FileStorage.fspack import Throttle
+        with mock.patch('time.monotonic', return_value=10):
+            throttle = Throttle(1000)
+        with mock.patch('time.monotonic', return_value=11), \
+                mock.patch('time.sleep') as sleep:
+            throttle(500)
+            self.assertFalse(sleep.called)
+            throttle(1500)
+            sleep.assert_called_once_with(1)
+        with mock.patch('time.sleep') as sleep:
+            Throttle()(1 << 30)
+            self.assertFalse(sleep.called)
+
 
 class FileStorageHexTests(FileStorageTests):
 
@@ -505,6 +925,108 @@ class FileStorageNoRestoreRecoveryTest(FileStorageRecoveryTest):
         pass
 
 
+class FileStorageLowMemoryPackTests(
+    StorageTestBase.StorageTestBase,
+    PackableStorage.PackableStorageWithOptionalGC,
+    PackableStorage.PackableUndoStorage,
+):
+
+    def open(self, **kwargs):
+        self._storage = ZODB.FileStorage.FileStorage(
+            'FileStorageTests.fs', pack_gc_low_memory=True, **kwargs)
+
+    def setUp(self):
+        StorageTestBase.StorageTestBase.setUp(self)
+        self.open(create=1)
+
+    def testPosArray(self):
+        from ZODB.FileStorage.fspack import MAX_ARRAY_OID
+        from ZODB.FileStorage.fspack import PosArray
+        index = PosArray('positions')
+        self.assertEqual(len(index), 0)
+        self.assertNotIn(z64, index)
+        self.assertRaises(KeyError, index.__getitem__, z64)
+        big = p64(MAX_ARRAY_OID)
+        for oid, pos in ((z64, 4), (p64(1 << 20), 42), (big, 7)):
+            index[oid] = pos
+        index[z64] = 5
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index[z64], 5)
+        self.assertEqual(index.get(p64(1 << 20)), 42)
+        self.assertEqual(index.get(p64(1)), None)
+        self.assertEqual(index[big], 7)
+        self.assertGreater(os.path.getsize('positions'), 8 << 20)
+
+        del index[z64]
+        self.assertRaises(KeyError, index.__delitem__, z64)
+        self.assertEqual(len(index), 2)
+        index.flush()
+        index.close(remove=False)
+        index = PosArray('positions', 2, {big: 7})
+        self.assertEqual(index[p64(1 << 20)], 42)
+        self.assertEqual(index.get(z64), None)
+        index.close()
+        self.assertFalse(os.path.exists('positions'))
+
+    def testOidStack(self):
+        from ZODB.FileStorage.fspack import OidStack
+        stack = OidStack(32)
+        for i in range(20):
+            stack.push(p64(i))
+        self.assertEqual(len(stack), 20)
+        self.assertLessEqual(len(stack._items) * 8, 32)
+        popped = [U64(stack.pop()) for i in range(20)]
+        self.assertEqual(sorted(popped), list(range(20)))
+        self.assertFalse(stack)
+        self.assertEqual(stack._file.seek(0, 2), 0)
+        stack.close()
+
+    def testPackSameAsInMemory(self):
+        self._storage.close()
+        results = []
+        for name, low_memory in (('memory.fs', False), ('mapped.fs', True)):
+            db = DB(ZODB.FileStorage.FileStorage(
+                name, create=True, pack_gc_low_memory=low_memory,
+                pack_gc_stack_memory=8))
+            root = db.open().root()
+            root['a'] = MinPO(1)
+            root['b'] = MinPO(root['a'])
+            transaction.commit()
+            del root['a']
+            root['b'].value = MinPO(2)
+            transaction.commit()
+            db.pack(time.time() + 1)
+            results.append((db.storage.getSize(),
+                            list(db.storage._index.keys())))
+            db.close()
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(len(results[0][1]), 3)
+        self.assertEqual(
+            [n for n in os.listdir('.') if n.startswith('mapped.fs.pack')],
+            [])
+
+    def testResumeLowMemoryPack(self):
+        db = DB(self._storage)
+        root = db.open().root()
+        for i in range(10):
+            root[i] = MinPO(i)
+            transaction.commit()
+        self._storage.pack_checkpoint_bytes = 1
+        self._storage.pack_time_budget = 0
+        self.assertRaises(PackInterrupted, db.pack, time.time() + 1)
+        self.assertTrue(os.path.exists('FileStorageTests.fs.pack_reachable'))
+        self.assertFalse(
+            os.path.exists('FileStorageTests.fs.pack_oid2curpos'))
+
+        self._storage.pack_time_budget = None
+        with mock.patch('ZODB.FileStorage.fspack.GC.findReachable') as find:
+            db.pack(time.time() + 1)
+        self.assertFalse(find.called)
+        self.assertFalse(os.path.exists('FileStorageTests.fs.pack_reachable'))
+        self.assertEqual(db.open().root()[9].value, 9)
+        db.close()
+
+
 class AnalyzeDotPyTest(StorageTestBase.StorageTestBase):
 
     def setUp(self):
@@ -831,7 +1353,7 @@ def test_suite():
         FileStorageRecoveryTest, FileStorageHexRecoveryTest,
         FileStorageNoRestoreRecoveryTest,
         FileStorageTestsWithBlobsEnabled, FileStorageHexTestsWithBlobsEnabled,
-        AnalyzeDotPyTest,
+        FileStorageLowMemoryPackTests, AnalyzeDotPyTest,
     ]:
         suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(klass))
     suite.addTest(doctest.DocTestSuite(
@@ -11,11 +11,15 @@
 # FOR A PARTICULAR PURPOSE.
 #
 ##############################################################################
+import time
 import unittest
 from collections import namedtuple
 
+import ZODB.config
 import ZODB.MappingStorage
+import ZODB.POSException
 import ZODB.tests.hexstorage
+import ZODB.tests.util
 from ZODB.tests import BasicStorage
 from ZODB.tests import HistoryStorage
 from ZODB.tests import IteratorStorage
@@ -24,6 +28,7 @@ from ZODB.tests import PackableStorage
 from ZODB.tests import RevisionStorage
 from ZODB.tests import StorageTestBase
 from ZODB.tests import Synchronization
+from ZODB.tests.MinPO import MinPO
 
 
 class MappingStorageTests(
@@ -62,6 +67,97 @@ class MappingStorageHexTests(MappingStorageTests):
             ZODB.MappingStorage.MappingStorage())
 
 
+class MappingStorageBookkeepingTests(ZODB.tests.util.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self._storage = ZODB.MappingStorage.MappingStorage()
+
+    def _populate(self, storage):
+        db = ZODB.DB(storage)
+        with db.transaction() as conn:
+            for i in range(10):
+                conn.root()[i] = MinPO(i)
+        with db.transaction() as conn:
+            for i in range(5):
+                conn.root()[i].value = -i
+            del conn.root()[9]
+        return db
+
+    def _computeSize(self, storage):
+        return sum(50 + sum(100 + len(p) for p in tid_data.values())
+                   for tid_data in storage._data.values())
+
+    def testSizeIsKeptUpToDate(self):
+        storage = self._storage
+        self.assertEqual(storage.getSize(), 0)
+        db = self._populate(storage)
+        self.assertEqual(storage.getSize(), self._computeSize(storage))
+        self.assertEqual(len(storage._record_info.history), 6)
+        db.pack(time.time() + 1)
+        self.assertEqual(len(storage), 10)
+        self.assertEqual(storage.getSize(), self._computeSize(storage))
+        self.assertEqual(storage._record_info.history, set())
+        db.close()
+
+    def testPackReusesReferences(self):
+        storage = self._storage
+        db = self._populate(storage)
+        calls = []
+
+        def referencesf(p):
+            calls.append(p)
+            return ZODB.serialize.referencesf(p)
+
+        storage.pack(time.time() + 1, referencesf)
+        self.assertEqual(len(calls), 10)
+        with db.transaction() as conn:
+            conn.root()[0].value = 42
+        del calls[:]
+        storage.pack(time.time() + 1, referencesf)
+        self.assertEqual(len(calls), 1)
+        db.close()
+
+    def testSnapshot(self):
+        db = self._populate(self._storage)
+        self._storage.snapshot('snapshot')
+
+        storage = ZODB.MappingStorage.MappingStorage(snapshot='snapshot')
+        self.assertEqual(storage.getSize(), self._storage.getSize())
+        self.assertEqual(storage.lastTransaction(),
+                         self._storage.lastTransaction())
+        self.assertEqual(
+            [t.tid for t in storage.iterator()],
+            [t.tid for t in self._storage.iterator()])
+        self.assertNotIn(storage.new_oid(), self._storage._data)
+        self.assertRaises(ZODB.POSException.StorageError,
+                          self._storage.loadSnapshot, 'snapshot')
+        # It's not taken for IStorageRestoreable.restore:
+        self.assertFalse(hasattr(storage, 'restore'))
+        db.close()
+        db = ZODB.DB(storage)
+        with db.transaction() as conn:
+            self.assertEqual(
+                sorted((k, o.value) for k, o in conn.root().items()),
+                [(i, -i) for i in range(5)] + [(i, i) for i in range(5, 9)])
+            conn.root()[0].value = 0
+        db.close()
+
+        storage = ZODB.config.storageFromString("""
+            <mappingstorage>
+              snapshot snapshot
+            </mappingstorage>
+            """)
+        self.assertEqual(len(storage), 11)
+        storage.close()
+
+        with open('junk', 'wb') as f:
+            f.write(b'junk')
+        self.assertRaises(ZODB.POSException.StorageError,
+                          ZODB.MappingStorage.MappingStorage,
+                          snapshot='junk')
+
+
 MockTransaction = namedtuple(
     'transaction',
     ['user', 'description', 'extension']
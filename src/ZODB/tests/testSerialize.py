@@ -106,6 +106,65 @@ class SerializerTestCase(unittest.TestCase):
         g = r.getGhost(self.new_style_without_newargs)
         self.assertIsInstance(g, ClassWithoutNewargs)
 
+    def test_class_cache(self):
+        calls = []
+
+        def factory(conn, module_name, name):
+            calls.append(name)
+            return _factory(conn, module_name, name)
+
+        r = serialize.ObjectReader(factory=factory)
+        r.getGhost(self.new_style_without_newargs)
+        r.getGhost(self.new_style_without_newargs)
+        r.getClassName(self.old_style_without_newargs)
+        self.assertEqual(calls, ['ClassWithoutNewargs'])
+
+        r.clearClassCache()
+        r.getGhost(self.new_style_without_newargs)
+        self.assertEqual(calls, ['ClassWithoutNewargs'] * 2)
+
+    def test_class_cache_skips_broken_classes(self):
+        from ZODB.broken import Broken
+        from ZODB.broken import find_global
+
+        def factory(conn, module_name, name):
+            if module_name == __name__:
+                return find_global('ZODB.not.there', name)
+            return _factory(conn, module_name, name)
+
+        r = serialize.ObjectReader(factory=factory)
+        self.assertIsInstance(
+            r.getGhost(self.new_style_without_newargs), Broken)
+
+        # Once the class can be found, we use it:
+        r._factory = _factory
+        self.assertIsInstance(
+            r.getGhost(self.new_style_without_newargs), ClassWithoutNewargs)
+
+    def test_reentrant_loads(self):
+        # Loading a state can load other records through the same
+        # reader, for example by calling Connection.get.
+        inner = make_pickle(ClassWithoutNewargs) + make_pickle({'x': 1})
+
+        class Reader(serialize.ObjectReader):
+            def load_oid(self, oid):
+                return self.getState(inner)
+
+        def persistent_id(obj):
+            return b'oid' if isinstance(obj, PersistentObject) else None
+
+        sio = BytesIO()
+        p = Pickler(sio, _protocol)
+        p.persistent_id = persistent_id
+        p.dump(ClassWithoutNewargs)
+        p.dump({'inner': PersistentObject()})
+        outer = sio.getvalue()
+
+        r = Reader(factory=_factory)
+        self.assertEqual(r.getState(outer), {'inner': {'x': 1}})
+        self.assertEqual(r.getState(outer), {'inner': {'x': 1}})
+        self.assertEqual(r.getState(inner), {'x': 1})
+
     def test_myhasattr(self):
 
         class OldStyle:
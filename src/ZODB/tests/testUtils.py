@@ -125,6 +125,25 @@ class TestUtils(unittest.TestCase):
             self.assertEqual(get_pickle_metadata(pickle),
                              (__name__, ExampleClass.__name__))
 
+    def test_get_record_class(self):
+        from pickle import dumps
+
+        from ZODB.utils import get_record_class
+        name = (__name__, ExampleClass.__name__)
+        for protocol in range(1, 5):
+            for class_description in (ExampleClass,
+                                      (ExampleClass, (1,)),
+                                      (name, None)):
+                pickle = dumps(class_description, protocol=protocol)
+                self.assertEqual(get_record_class(pickle + b'rest'), name)
+        self.assertIs(get_record_class(pickle), get_record_class(pickle))
+
+        # Class descriptions that need unpickling aren't decoded:
+        self.assertIsNone(get_record_class(dumps((name, None), protocol=0)))
+        for data in (b'', b'\x80\x03', b'\x80\x03cfoo', b'\x80\x03X\xff\xff',
+                     b'\x80\x03\x8c', b'\x80\x03K\x01.'):
+            self.assertIsNone(get_record_class(data), data)
+
     def test_p64_bad_object(self):
         with self.assertRaises(ValueError) as exc:
             p64(2 ** 65)
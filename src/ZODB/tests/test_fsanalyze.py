@@ -0,0 +1,118 @@
+##############################################################################
+#
+# Copyright (c) 2026 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+import json
+import unittest
+
+import transaction
+from persistent.mapping import PersistentMapping
+
+import ZODB
+from ZODB.Connection import TransactionMetaData
+from ZODB.FileStorage import FileStorage
+from ZODB.FileStorage import fsanalyze
+from ZODB.tests.MinPO import MinPO
+from ZODB.tests.util import TestCase
+from ZODB.tests.util import run_module_as_script
+
+
+class FsAnalyzeTests(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        db = ZODB.DB('Data.fs')
+        conn = db.open()
+        root = conn.root()
+        for i in range(20):
+            root[i] = MinPO(i)
+            transaction.commit()
+        for i in range(10):
+            root[i].value = -i
+            transaction.commit()
+        root['gone'] = MinPO('gone')
+        transaction.commit()
+        self.gone = root['gone']._p_oid
+        db.close()
+
+    def test_analyze(self):
+        result = fsanalyze.analyze('Data.fs')
+        self.assertEqual(result['transactions'], 32)
+        self.assertEqual(result['records'], 22 + 31)
+        stats = result['collectors']
+        self.assertEqual(sorted(stats), sorted(fsanalyze.collectors))
+
+        mapping = 'persistent.mapping.PersistentMapping'
+        minpo = 'ZODB.tests.MinPO.MinPO'
+        self.assertEqual(stats['classes'][mapping]['records'], 22)
+        self.assertEqual(stats['classes'][minpo]['records'], 31)
+
+        space = stats['space']
+        self.assertEqual(space[mapping]['objects'], 1)
+        self.assertEqual(space[mapping]['old_revisions'], 21)
+        self.assertEqual(space[minpo]['objects'], 21)
+        self.assertEqual(space[minpo]['old_revisions'], 10)
+
+        revisions = stats['revisions']
+        self.assertEqual(revisions['objects'], 22)
+        self.assertEqual(revisions['revisions'], [[1, 11], [2, 10], [22, 1]])
+        self.assertEqual(sum(n for _, n in revisions['lifetimes']), 31)
+
+        sizes = stats['sizes']
+        self.assertEqual(
+            sum(n for _, n in sizes['records']['bins']), result['records'])
+        self.assertEqual(
+            sum(n for _, n in sizes['transaction_records']['bins']), 32)
+
+        self.assertEqual(stats['dangling'], [])
+
+    def test_dangling(self):
+        db = ZODB.DB('Data.fs')
+        conn = db.open()
+        root = conn.root()
+        root['ref'] = PersistentMapping(dict(gone=root['gone']))
+        del root['gone']
+        transaction.commit()
+        db.close()
+
+        result = fsanalyze.analyze('Data.fs', ['dangling'])
+        self.assertEqual(list(result['collectors']), ['dangling'])
+        self.assertEqual(result['collectors']['dangling'], [])
+
+        # Now remove the object behind the database's back:
+        fs = FileStorage('Data.fs')
+        t = TransactionMetaData()
+        fs.tpc_begin(t)
+        fs.deleteObject(self.gone, fs.load(self.gone)[1], t)
+        fs.tpc_vote(t)
+        fs.tpc_finish(t)
+        fs.close()
+
+        result = fsanalyze.analyze('Data.fs', ['dangling'])
+        [[oid, missing]] = result['collectors']['dangling']
+        self.assertEqual(missing, ZODB.utils.oid_repr(self.gone))
+
+    def test_jobs(self):
+        self.assertEqual(fsanalyze.analyze('Data.fs', jobs=3),
+                         fsanalyze.analyze('Data.fs'))
+
+    def test_script(self):
+        run_module_as_script('ZODB.FileStorage.fsanalyze',
+                             ['-c', 'classes', '-o', 'out.json', 'Data.fs'])
+        with open('out.json') as f:
+            result = json.load(f)
+        self.assertEqual(result['transactions'], 32)
+        self.assertEqual(list(result['collectors']), ['classes'])
+
+
+def test_suite():
+    return unittest.defaultTestLoader.loadTestsFromTestCase(FsAnalyzeTests)
@@ -0,0 +1,156 @@
+##############################################################################
+#
+# Copyright (c) 2026 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+import time
+import unittest
+
+import transaction
+
+import ZODB
+from ZODB.metrics import Histogram
+from ZODB.metrics import Metrics
+from ZODB.metrics import PrometheusExporter
+from ZODB.metrics import RingBuffer
+from ZODB.POSException import ConflictError
+from ZODB.tests.MinPO import MinPO
+from ZODB.tests.util import TestCase
+
+
+class RingBufferTests(unittest.TestCase):
+
+    def test_buckets(self):
+        ring = RingBuffer(10, 10, 2)
+        now = time.time()
+        ring.add((1, 2), now - 20)  # too old
+        ring.add((1, 2), now - 5)
+        ring.add((3, 4), now)
+        ring.add((5, 6), now)
+        self.assertEqual([sums for _, sums in ring.buckets()],
+                         [[1, 2], [8, 10]])
+        self.assertEqual(ring.totals(), [9, 12])
+        self.assertEqual(ring.totals(now - 1), [8, 10])
+
+        # Buckets are reused:
+        for i in range(30):
+            ring.add((1, 0), now + i)
+        self.assertEqual(len(ring._stamps), 10)
+
+
+class HistogramTests(unittest.TestCase):
+
+    def test_observe(self):
+        h = Histogram((1, 2))
+        for v in (.5, 1, 1.5, 3):
+            h.observe(v)
+        self.assertEqual(h.count, 4)
+        self.assertEqual(h.sum, 6)
+        self.assertEqual(h.cumulative(),
+                         [(1, 2), (2, 3), (float('inf'), 4)])
+
+
+class MetricsTests(TestCase):
+
+    def test_database_metrics(self):
+        metrics = Metrics()
+        db = ZODB.DB('data.fs')
+        db.setMetrics(metrics)
+        self.assertIs(db.getMetrics(), metrics)
+        self.assertIs(db.storage._metrics, metrics)
+
+        conn = db.open()
+        root = conn.root()
+        root['x'] = x = MinPO(1)
+        transaction.commit()
+        conn.close()
+        db.cacheMinimize()  # root and x stay cached, as ghosts
+
+        conn = db.open()
+        self.assertIs(conn.root(), root)
+        self.assertIs(root['x'], x)
+        self.assertEqual(x.value, 1)
+        conn.close()
+
+        self.assertEqual(metrics.total('stores'), 2)
+        self.assertGreater(metrics.total('bytes_written'), 0)
+        self.assertGreater(metrics.total('filestorage_bytes_written'),
+                           metrics.total('bytes_written'))
+        self.assertEqual(metrics.total('loads'), 2)
+        # The root is found in the cache of the reused connection
+        # twice, as is x when the root's state is loaded.
+        self.assertEqual(metrics.total('cache_misses'), 0)
+        self.assertEqual(metrics.total('cache_hits'), 3)
+        self.assertEqual(metrics.total('connections_closed'), 2)
+        self.assertEqual(metrics.recent('connections_closed', 60), 2)
+        for name in ('commit_seconds', 'vote_seconds', 'finish_seconds',
+                     'store_seconds', 'filestorage_sync_seconds'):
+            self.assertEqual(metrics.histograms[name].count,
+                             2 if name == 'store_seconds' else 1, name)
+        self.assertEqual(metrics.histograms['load_seconds'].count, 2)
+
+        # A new connection misses the root and x.
+        conn1 = db.open()
+        conn2 = db.open()
+        self.assertIsNot(conn2, conn1)
+        self.assertEqual(conn2.root()['x'].value, 1)
+        self.assertEqual(metrics.total('cache_misses'), 2)
+        conn1.close()
+        conn2.close()
+
+        db.setMetrics(None)
+        self.assertIsNone(db.storage._metrics)
+        db.close()
+
+    def test_conflicts(self):
+        metrics = Metrics()
+        db = ZODB.DB(None)
+        db.setMetrics(metrics)
+        tm1 = transaction.TransactionManager()
+        tm2 = transaction.TransactionManager()
+        root1 = db.open(tm1).root()
+        root2 = db.open(tm2).root()
+        root1['x'] = 1
+        root2['x'] = 2
+        tm1.commit()
+        self.assertRaises(ConflictError, tm2.commit)
+        tm2.abort()
+        self.assertEqual(metrics.total('conflicts'), 1)
+        db.close()
+
+    def test_prometheus(self):
+        metrics = Metrics()
+        metrics.increment('loads', 3)
+        metrics.observe('load_seconds', .002)
+        text = PrometheusExporter(labels=dict(db='main')).export(metrics)
+        self.assertEqual(text.splitlines()[:3], [
+            '# HELP zodb_loads_total Objects loaded by connections',
+            '# TYPE zodb_loads_total counter',
+            'zodb_loads_total{db="main"} 3',
+        ])
+        self.assertIn('zodb_load_seconds_bucket{db="main",le="0.001"} 0',
+                      text)
+        self.assertIn('zodb_load_seconds_bucket{db="main",le="0.0025"} 1',
+                      text)
+        self.assertIn('zodb_load_seconds_bucket{db="main",le="+Inf"} 1',
+                      text)
+        self.assertIn('zodb_load_seconds_count{db="main"} 1', text)
+        self.assertEqual(metrics.export(PrometheusExporter()),
+                         PrometheusExporter().export(metrics))
+
+
+def test_suite():
+    loader = unittest.defaultTestLoader
+    return unittest.TestSuite((
+        loader.loadTestsFromTestCase(RingBufferTests),
+        loader.loadTestsFromTestCase(HistogramTests),
+        loader.loadTestsFromTestCase(MetricsTests),
+    ))
@@ -14,7 +14,13 @@
 
 import unittest
 
+import transaction
+
+import ZODB
 from ZODB import mvccadapter
+from ZODB.tests.MinPO import MinPO
+from ZODB.utils import p64
+from ZODB.utils import u64
 
 
 class TestBase(unittest.TestCase):
@@ -58,3 +64,63 @@ class TestHistoricalStorageAdapter(unittest.TestCase):
         adapter.release()
 
         self.assertTrue(base.released)
+
+
+class TestHistoricalRecordCache(unittest.TestCase):
+
+    def test_validity_ranges(self):
+        cache = mvccadapter.HistoricalRecordCache(100)
+        cache.store(b'1', (b'a', p64(2), p64(5)), p64(9))
+        self.assertIsNone(cache.load(b'1', p64(2)))
+        self.assertEqual(cache.load(b'1', p64(3)), (b'a', p64(2)))
+        self.assertEqual(cache.load(b'1', p64(5)), (b'a', p64(2)))
+        self.assertIsNone(cache.load(b'1', p64(6)))
+
+        # Current records are valid up to the last transaction when loaded
+        cache.store(b'1', (b'b', p64(5), None), p64(9))
+        self.assertEqual(cache.load(b'1', p64(6)), (b'b', p64(5)))
+        self.assertEqual(cache.load(b'1', p64(10)), (b'b', p64(5)))
+        self.assertIsNone(cache.load(b'1', p64(11)))
+        self.assertEqual((cache.hits, cache.misses), (4, 3))
+
+    def test_size(self):
+        cache = mvccadapter.HistoricalRecordCache(10)
+        cache.store(b'1', (b'aaaa', p64(1), p64(2)), p64(9))
+        cache.store(b'2', (b'bbbb', p64(1), p64(2)), p64(9))
+        cache.load(b'1', p64(2))
+        cache.store(b'3', (b'cccc', p64(1), p64(2)), p64(9))
+        self.assertEqual(cache.size, 8)
+        self.assertIsNone(cache.load(b'2', p64(2)))
+        self.assertIsNotNone(cache.load(b'1', p64(2)))
+        cache.store(b'4', (b'x' * 11, p64(1), p64(2)), p64(9))
+        self.assertIsNone(cache.load(b'4', p64(2)))
+        cache.clear()
+        self.assertEqual(cache.size, 0)
+        self.assertIsNone(cache.load(b'1', p64(2)))
+
+    def test_shared_by_historical_connections(self):
+        db = ZODB.DB(None, historical_record_cache_size_bytes=1 << 20)
+        with db.transaction() as conn:
+            conn.root()['x'] = MinPO(1)
+        first = db.lastTransaction()
+        with db.transaction() as conn:
+            conn.root()['y'] = MinPO(2)
+        cache = db._mvcc_storage.historical_cache
+
+        c1 = db.open(at=first)
+        self.assertEqual(c1.root()['x'].value, 1)
+        misses = cache.misses
+        c2 = db.open(transaction.TransactionManager(), at=first)
+        self.assertEqual(c2.root()['x'].value, 1)
+        self.assertEqual(cache.misses, misses)
+
+        # The root changed after first, but x didn't:
+        c3 = db.open(transaction.TransactionManager())
+        c4 = db.open(transaction.TransactionManager(),
+                     before=p64(u64(db.lastTransaction()) + 1))
+        self.assertEqual(sorted(c4.root()), ['x', 'y'])
+        self.assertEqual(c4.root()['x'].value, 1)
+        self.assertEqual(cache.misses, misses + 1)  # the root
+        for c in c1, c2, c3, c4:
+            c.close()
+        db.close()
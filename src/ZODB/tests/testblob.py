@@ -12,15 +12,18 @@
 #
 ##############################################################################
 import doctest
+import errno
 import io
 import os
 import random
 import re
+import socket
 import struct
 import sys
 import time
 import unittest
 from io import BytesIO
+from unittest import mock
 
 import transaction
 import ZConfig
@@ -28,6 +31,8 @@ import zope.testing.renormalizing
 
 import ZODB.blob
 import ZODB.interfaces
+import ZODB.MappingStorage
+import ZODB.POSException
 import ZODB.tests.IteratorStorage
 import ZODB.tests.StorageTestBase
 import ZODB.tests.util
@@ -36,6 +41,7 @@ from ZODB._compat import Unpickler
 from ZODB._compat import _protocol
 from ZODB.blob import Blob
 from ZODB.blob import BushyLayout
+from ZODB.blob import ChunkedBlob
 from ZODB.DB import DB
 from ZODB.FileStorage import FileStorage
 from ZODB.tests.testConfig import ConfigTestBase
@@ -155,6 +161,338 @@ class BushyLayoutTests(ZODB.tests.util.TestCase):
             non_ascii_oid)
 
 
+class HashedLayoutTests(ZODB.tests.util.TestCase):
+
+    def test_storage(self):
+        import ZODB.MappingStorage
+        db = DB(ZODB.blob.BlobStorage(
+            'blobs', ZODB.MappingStorage.MappingStorage(), layout='hashed'))
+        with db.transaction() as conn:
+            conn.root.a = Blob(b'a')
+            conn.root.b = Blob(b'b')
+        with db.transaction() as conn:
+            with conn.root.a.open('w') as f:
+                f.write(b'A')
+            del conn.root.b
+        fshelper = db.storage.fshelper
+        self.assertEqual(len(list(fshelper.listOIDs())), 2)
+        db.pack()
+        [(oid, path)] = fshelper.listOIDs()
+        self.assertEqual(path, fshelper.getPathForOID(oid))
+        self.assertEqual(len(os.listdir(path)), 1)
+        with db.transaction() as conn:
+            self.assertEqual(conn.root.a._p_oid, oid)
+            with conn.root.a.open() as f:
+                self.assertEqual(f.read(), b'A')
+        db.close()
+
+
+class CloneFileTests(ZODB.tests.util.TestCase):
+
+    data = b'x' * 100000 + b'y'
+
+    def setUp(self):
+        super().setUp()
+        with open('source', 'wb') as f:
+            f.write(self.data)
+
+    def check(self):
+        ZODB.blob.clone_file('source', 'target')
+        with open('target', 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_clone_file(self):
+        self.check()
+
+    def test_fallbacks(self):
+        unsupported = OSError(errno.EOPNOTSUPP, 'Operation not supported')
+        with mock.patch('ZODB.blob.FICLONE', None):
+            self.check()
+            with mock.patch('os.copy_file_range', create=True,
+                            side_effect=unsupported) as copy_file_range:
+                self.check()
+                self.assertTrue(copy_file_range.called)
+
+        # A partial copy is overwritten by the Python copy:
+        def short_copy(fd1, fd2, count):
+            os.write(fd2, b'z')
+            raise OSError(errno.EXDEV, 'Invalid cross-device link')
+
+        with mock.patch('ZODB.blob.fcntl') as fcntl:
+            fcntl.ioctl.side_effect = unsupported
+            with mock.patch('os.copy_file_range', create=True,
+                            side_effect=short_copy):
+                self.check()
+            if ZODB.blob.FICLONE is not None:
+                self.assertTrue(fcntl.ioctl.called)
+
+    def test_errors_propagate(self):
+        with mock.patch('ZODB.blob.fcntl') as fcntl:
+            fcntl.ioctl.side_effect = OSError(errno.ENOSPC, 'No space')
+            with mock.patch('ZODB.blob.FICLONE', 0x40049409):
+                self.assertRaises(OSError, ZODB.blob.clone_file,
+                                  'source', 'target')
+
+    def test_open_append_clones(self):
+        db = DB(ZODB.blob.BlobStorage(
+            'blobs', ZODB.MappingStorage.MappingStorage()))
+        with db.transaction() as conn:
+            conn.root.blob = Blob(self.data)
+        with db.transaction() as conn:
+            with mock.patch('ZODB.blob.clone_file',
+                            wraps=ZODB.blob.clone_file) as clone_file:
+                with conn.root.blob.open('a') as f:
+                    f.write(b'z')
+                with conn.root.blob.open('r+') as f:
+                    self.assertEqual(f.read(3), b'xxx')
+            self.assertEqual(clone_file.call_count, 1)
+        with db.transaction() as conn:
+            with conn.root.blob.open() as f:
+                self.assertEqual(f.read(), self.data + b'z')
+        db.close()
+
+
+class ContentAddressedLayoutTests(ZODB.tests.util.TestCase):
+
+    def content_files(self, blob_dir):
+        return sorted(
+            os.path.join(path, name)
+            for path, _, names in os.walk(
+                os.path.join(blob_dir, ZODB.blob.CONTENT_DIR))
+            for name in names)
+
+    def check_storage(self, db, blob_dir):
+        with db.transaction() as conn:
+            conn.root.a = Blob(b'same data')
+            conn.root.b = Blob(b'same data')
+            conn.root.c = Blob(b'other data')
+        files = self.content_files(blob_dir)
+        self.assertEqual(len(files), 2)
+        conn = db.open()
+        a, b = conn.root.a, conn.root.b
+        self.assertTrue(os.path.samefile(a.committed(), b.committed()))
+        self.assertEqual(os.stat(a.committed()).st_nlink, 3)
+        self.assertFalse(os.path.samefile(a.committed(),
+                                          conn.root.c.committed()))
+        conn.close()
+
+        # Data are kept as long as a blob file links to them:
+        with db.transaction() as conn:
+            with conn.root.a.open('w') as f:
+                f.write(b'new data')
+            del conn.root.c
+        db.pack()
+        files = self.content_files(blob_dir)
+        self.assertEqual(len(files), 2)
+        with db.transaction() as conn:
+            for name, data in (('a', b'new data'), ('b', b'same data')):
+                with conn.root()[name].open() as f:
+                    self.assertEqual(f.read(), data)
+            self.assertEqual(os.stat(conn.root.b.committed()).st_nlink, 2)
+
+        with db.transaction() as conn:
+            del conn.root.a
+            del conn.root.b
+        db.pack()
+        self.assertEqual(self.content_files(blob_dir), [])
+        db.close()
+
+    def test_blob_storage(self):
+        import ZODB.MappingStorage
+        storage = ZODB.blob.BlobStorage(
+            'blobs', ZODB.MappingStorage.MappingStorage(), layout='content')
+        self.check_storage(DB(storage), 'blobs')
+
+    def test_file_storage(self):
+        FileStorage('data.fs', blob_dir='blobs').close()
+        with open(os.path.join('blobs', ZODB.blob.LAYOUT_MARKER), 'w') as f:
+            f.write('content')
+        storage = FileStorage('data.fs', blob_dir='blobs',
+                              pack_keep_old=False)
+        self.assertEqual(storage.fshelper.layout_name, 'content')
+        self.check_storage(DB(storage), 'blobs')
+
+    def test_share_without_links(self):
+        fshelper = ZODB.blob.FilesystemHelper('blobs', 'content')
+        fshelper.create()
+        with open('blob', 'wb') as f:
+            f.write(b'data')
+        with mock.patch('os.link', side_effect=OSError(errno.EPERM, 'no')):
+            fshelper.shareBlobFile('blob')
+        self.assertEqual(self.content_files('blobs'), [])
+        with open('blob', 'rb') as f:
+            self.assertEqual(f.read(), b'data')
+
+
+class CommittedBlobTests(ZODB.tests.util.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        import ZODB.MappingStorage
+        self.db = DB(ZODB.blob.BlobStorage(
+            'blobs', ZODB.MappingStorage.MappingStorage()))
+        with self.db.transaction() as conn:
+            conn.root.blob = Blob(b'0123456789')
+
+    def tearDown(self):
+        self.db.close()
+        super().tearDown()
+
+    def test_open_committed(self):
+        with self.db.transaction() as conn:
+            blob = conn.root.blob
+            with blob.openCommitted() as committed:
+                self.assertEqual(committed.name, blob.committed())
+                self.assertEqual(committed.size, 10)
+                self.assertEqual(os.read(committed.fd, 3), b'012')
+                data = committed.mmap()
+                self.assertEqual(data[5:], b'56789')
+
+                a, b = socket.socketpair()
+                with a, b:
+                    self.assertEqual(committed.sendfile(a, 2, 3), 3)
+                    self.assertEqual(b.recv(10), b'234')
+                r, w = os.pipe()
+                try:
+                    self.assertEqual(committed.sendfile(w, 7), 3)
+                    self.assertEqual(os.read(r, 10), b'789')
+                finally:
+                    os.close(r)
+                    os.close(w)
+                self.assertEqual(committed.sendfile(w, 10), 0)
+            self.assertTrue(committed.closed)
+            # The map outlives the committed blob:
+            self.assertEqual(data[:2], b'01')
+            data.close()
+
+            with blob.open('a') as f:
+                f.write(b'x')
+            self.assertRaises(ZODB.interfaces.BlobError, blob.openCommitted)
+
+    def test_empty(self):
+        with self.db.transaction() as conn:
+            conn.root.empty = Blob()
+        with self.db.transaction() as conn:
+            with conn.root.empty.openCommitted() as committed:
+                self.assertEqual(committed.size, 0)
+                self.assertEqual(committed.mmap(), b'')
+
+    @unittest.skipIf(sys.platform == 'win32', "Open files can't be removed")
+    def test_survives_pack(self):
+        storage = self.db.storage
+        with self.db.transaction() as conn:
+            conn.root.blob._p_activate()
+            oid = conn.root.blob._p_oid
+            serial = conn.root.blob._p_serial
+            with conn.root.blob.open('w') as f:
+                f.write(b'new')
+        committed = storage.openCommittedBlob(oid, serial)
+        self.db.pack()
+        self.assertFalse(os.path.exists(committed.name))
+        self.assertRaises(ZODB.POSException.POSKeyError,
+                          storage.openCommittedBlob, oid, serial)
+        with committed:
+            with committed.mmap() as data:
+                self.assertEqual(data[:], b'0123456789')
+
+
+class ChunkedBlobTests(ZODB.tests.util.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.db = DB(FileStorage('data.fs', blob_dir='blobs'))
+
+    def tearDown(self):
+        self.db.close()
+        super().tearDown()
+
+    def serials(self, blob):
+        for chunk in blob._chunks:
+            chunk._p_activate()
+        return [chunk._p_serial for chunk in blob._chunks]
+
+    def test_read_write(self):
+        blob = ChunkedBlob(b'0123456789', chunk_size=4)
+        self.assertEqual(blob.size(), 10)
+        self.assertEqual(len(blob._chunks), 3)
+        with blob.open() as f:
+            self.assertEqual(f.read(3), b'012')
+            self.assertEqual(f.read(3), b'345')
+            f.seek(-2, io.SEEK_END)
+            self.assertEqual(f.read(), b'89')
+            self.assertEqual(f.read(), b'')
+            self.assertRaises(io.UnsupportedOperation, f.write, b'x')
+        with blob.open('r+') as f:
+            f.seek(3)
+            f.write(b'abc')
+            self.assertEqual(f.read(2), b'67')
+            f.seek(12)
+            f.write(b'z')
+        with blob.open() as f:
+            self.assertEqual(f.read(), b'012abc6789\0\0z')
+        with blob.open('r+') as f:
+            f.truncate(5)
+        with blob.open() as f:
+            self.assertEqual(f.read(), b'012ab')
+        self.assertEqual(len(blob._chunks), 2)
+        with blob.open('w') as f:
+            f.write(b'new')
+        with blob.open() as f:
+            self.assertEqual(f.read(), b'new')
+
+        with blob.open('a') as f:
+            self.assertRaises(ZODB.interfaces.BlobError, blob.open)
+            self.assertRaises(io.UnsupportedOperation, f.read)
+        with blob.open() as f:
+            self.assertRaises(ZODB.interfaces.BlobError, blob.open, 'w')
+        self.assertFalse(blob.opened())
+        self.assertRaises(ValueError, blob.open, 'x')
+
+    def test_unchanged_chunks_are_shared(self):
+        with self.db.transaction() as conn:
+            conn.root.blob = ChunkedBlob(b'x' * 10, chunk_size=4)
+        with self.db.transaction() as conn:
+            blob = conn.root.blob
+            serials = self.serials(blob)
+            with blob.open('a') as f:
+                f.write(b'yyy')
+        with self.db.transaction() as conn:
+            blob = conn.root.blob
+            new_serials = self.serials(blob)
+            self.assertEqual(new_serials[:2], serials[:2])
+            self.assertNotEqual(new_serials[2], serials[2])
+            self.assertEqual(len(new_serials), 4)
+            with blob.open('c') as f:
+                self.assertEqual(f.read(), b'x' * 10 + b'yyy')
+
+            with blob.open('r+') as f:
+                f.seek(5)
+                f.write(b'z')
+                self.assertRaises(ZODB.interfaces.BlobError, blob.open, 'c')
+            transaction.savepoint()
+            with blob.open() as f:
+                self.assertEqual(f.read(), b'xxxxxzxxxxyyy')
+        with self.db.transaction() as conn:
+            blob = conn.root.blob
+            self.assertEqual(self.serials(blob)[0], new_serials[0])
+            self.assertEqual(self.serials(blob)[2:], new_serials[2:])
+            with blob.open() as f:
+                self.assertEqual(f.read(), b'xxxxxzxxxxyyy')
+
+    def test_export_import(self):
+        with self.db.transaction() as conn:
+            conn.root.blob = ChunkedBlob(b'0123456789', chunk_size=4)
+        with self.db.transaction() as conn:
+            with open('export', 'wb') as f:
+                conn.exportFile(conn.root.blob._p_oid, f)
+            with open('export', 'rb') as f:
+                conn.root.copy = conn.importFile(f)
+        with self.db.transaction() as conn:
+            self.assertNotEqual(conn.root.copy._p_oid, conn.root.blob._p_oid)
+            with conn.root.copy.open() as f:
+                self.assertEqual(f.read(), b'0123456789')
+
+
 class BlobTestBase(ZODB.tests.StorageTestBase.StorageTestBase):
 
     def setUp(self):
@@ -328,6 +666,46 @@ class RecoveryBlobStorage(BlobTestBase,
         self.compare(self._storage, self._dst)
         db.close()
 
+    def testPipelinedBlobRecovery(self):
+        db = DB(self._storage)
+        for i in range(10):
+            with db.transaction() as conn:
+                conn.root()[i % 3] = ZODB.blob.Blob(b'data %d' % i)
+                conn.root.x = i
+        ZODB.blob.copyTransactionsFromTo(
+            self._storage, self._dst, workers=2, prefetch=2)
+        self.compare(self._storage, self._dst)
+        self.assertEqual(os.listdir(self._dst.temporaryDirectory()), [])
+        db.close()
+
+    def testPipelinedBlobRecoveryFailure(self):
+        db = DB(self._storage)
+        for i in range(10):
+            with db.transaction() as conn:
+                conn.root()[i] = ZODB.blob.Blob(b'data %d' % i)
+
+        restoreBlob = self._dst.restoreBlob
+        restored = []
+
+        def failingRestoreBlob(*args):
+            if len(restored) == 5:
+                raise ValueError('failed')
+            restored.append(args[0])
+            return restoreBlob(*args)
+
+        self._dst.restoreBlob = failingRestoreBlob
+        try:
+            with self.assertRaises(ValueError):
+                ZODB.blob.copyTransactionsFromTo(
+                    self._storage, self._dst, workers=2, prefetch=2)
+        finally:
+            del self._dst.restoreBlob
+        self.assertEqual(os.listdir(self._dst.temporaryDirectory()), [])
+        # The failed transaction was aborted
+        self.assertIsNone(self._dst._transaction)
+        self.assertFalse(self._dst._commit_lock.locked())
+        db.close()
+
 
 def gc_blob_removes_uncommitted_data():
     """
@@ -809,6 +1187,11 @@ def test_suite():
     suite.addTest(loadTestsFromTestCase(ZODBBlobConfigTest))
     suite.addTest(loadTestsFromTestCase(BlobCloneTests))
     suite.addTest(loadTestsFromTestCase(BushyLayoutTests))
+    suite.addTest(loadTestsFromTestCase(HashedLayoutTests))
+    suite.addTest(loadTestsFromTestCase(CloneFileTests))
+    suite.addTest(loadTestsFromTestCase(ContentAddressedLayoutTests))
+    suite.addTest(loadTestsFromTestCase(CommittedBlobTests))
+    suite.addTest(loadTestsFromTestCase(ChunkedBlobTests))
     suite.addTest(doctest.DocFileSuite(
         "blob_basic.txt",
         "blob_consume.txt",
@@ -834,7 +1217,8 @@ def test_suite():
         zope.testing.renormalizing.RENormalizing([
             (re.compile(r'\%(sep)s\%(sep)s' % dict(sep=os.path.sep)), '/'),
             (re.compile(r'\%(sep)s' % dict(sep=os.path.sep)), '/'),
-            (re.compile(r'\S+/((old|bushy|lawn)/\S+/foo[23456]?)'), r'\1'),
+            (re.compile(r'\S+/((old|bushy|lawn|hashed)/\S+/foo[23456]?)'),
+             r'\1'),
         ]),
     ))
     suite.addTest(storage_reusable_suite(
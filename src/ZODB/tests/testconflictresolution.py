@@ -137,6 +137,68 @@ mechanism.
     """
 
 
+def resolution_caches_records_and_counts_attempts():
+    """
+    The old and committed records used for resolution are cached, so
+    hot objects don't have to be loaded again and again:
+
+    >>> db = ZODB.DB('t.fs') # FileStorage!
+    >>> storage = db.storage
+    >>> conn = db.open()
+    >>> conn.root.x = ResolveableWhenStateDoesNotChange()
+    >>> conn.root.x.v = 1
+    >>> transaction.commit()
+    >>> serial1 = conn.root.x._p_serial
+    >>> conn.root.x.v = 2
+    >>> transaction.commit()
+    >>> serial2 = conn.root.x._p_serial
+    >>> oid = conn.root.x._p_oid
+
+    >>> loads = []
+    >>> def loadSerial(oid, serial):
+    ...     loads.append(serial)
+    ...     return storage.__class__.loadSerial(storage, oid, serial)
+    >>> storage.loadSerial = loadSerial
+
+    >>> newpickle = storage.loadSerial(oid, serial1)
+    >>> loads = []
+    >>> p = storage.tryToResolveConflict(oid, serial2, serial1, newpickle)
+    >>> loads == [serial1, serial2]
+    True
+    >>> p = storage.tryToResolveConflict(oid, serial2, serial1, newpickle)
+    >>> loads == [serial1, serial2]
+    True
+
+    >>> newpickle = storage.loadSerial(oid, serial2)
+    >>> p = storage.tryToResolveConflict(oid, serial2, serial1, newpickle)
+    ... # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+    ...
+    ZODB.POSException.ConflictError: database conflict error (oid 0x01, ...
+
+    >>> del storage.loadSerial
+
+    The cache is bounded:
+
+    >>> cache = storage._crs_record_cache
+    >>> len(cache)
+    2
+    >>> cache.size = 1
+    >>> cache.put(oid, b'\\0' * 8, b'')
+    >>> len(cache), cache.get(oid, serial1), cache.get(oid, b'\\0' * 8)
+    (1, None, b'')
+
+    We also keep track of how many resolutions were tried, how many
+    succeeded and how long they took:
+
+    >>> stats = ZODB.ConflictResolution.conflict_resolution_stats(storage)
+    >>> stats.attempts, stats.resolved, stats.seconds > 0
+    (3, 2, True)
+
+    >>> db.close()
+    """
+
+
 class Resolveable(persistent.Persistent):
 
     def _p_resolveConflict(self, old, committed, new):
@@ -190,6 +190,26 @@ class Test(unittest.TestCase):
         self.assertEqual(index.minKey(b), c)
         self.assertRaises(ValueError, index.minKey, d)
 
+    def testBuckets(self):
+        index = self.index
+        copy = fsIndex()
+        copy.update_buckets(index.buckets())
+        self.assertEqual(list(copy.items()), list(index.items()))
+
+        index[p64(1 << 20)] = 1
+        del index[p64(0)]
+        prefixes = [p64(1 << 20)[:6], z64[:6]]
+        changed = index.buckets(prefixes)
+        self.assertEqual(len(changed), 2)
+        copy.update_buckets(changed)
+        self.assertEqual(list(copy.items()), list(index.items()))
+
+        for i in range(1, 66):
+            del index[p64(i * 1000)]
+        copy.update_buckets(index.buckets([z64[:6]]))
+        self.assertEqual(list(copy.items()), list(index.items()))
+        self.assertEqual(len(copy._data), len(index._data))
+
 
 def fsIndex_save_and_load():
     """
@@ -143,6 +143,20 @@ in the output for oid 1.  Note that there's also new output for oid 0, even
 though the root object didn't change:  we got new output for oid 0 because
 it's a traced oid and the new transaction made a new reference *to* it.
 
+The file can also be read by several processes, each reading a range
+of transactions.  The report is the same:
+
+>>> import contextlib, io
+>>> def report(jobs):
+...     t = Tracer(path)
+...     t.register_oids(0, 1, 2)
+...     t.run(jobs)
+...     with contextlib.redirect_stdout(io.StringIO()) as out:
+...         t.report()
+...     return out.getvalue()
+>>> report(3) == report(1)
+True
+
 Since the Trace constructor takes only one argument, the only sane thing
 you can do to make it fail is to give it a path to a file that doesn't
 exist:
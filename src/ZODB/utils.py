@@ -40,6 +40,7 @@ __all__ = ['z64',
            'tid_repr',
            'readable_tid_repr',
            'get_pickle_metadata',
+           'get_record_class',
            'locked',
            ]
 
@@ -177,9 +178,107 @@ def readable_tid_repr(tid):
 # for what serialize.py calls formats 5 and 6.
 
 
+# Opcodes of the class descriptions decoded by get_record_class
+_MARK = 0x28             # (
+_GLOBAL = 0x63           # c
+_BINUNICODE = 0x58       # X
+_SHORT_BINUNICODE = 0x8c
+_SHORT_BINSTRING = 0x55  # U
+_TUPLE = 0x74            # t
+_TUPLE2 = 0x86
+_STACK_GLOBAL = 0x93
+_BINPUT = 0x71           # q
+_LONG_BINPUT = 0x72      # r
+_MEMOIZE = 0x94
+
+_record_classes = {}  # class description bytes -> (module, name)
+_record_classes_max = 10000
+
+
+def get_record_class(data):
+    """Return the module and class names of a database record's object.
+
+    Only the opcodes of the class description, at the start of the
+    record's first pickle, are decoded, no object is unpickled.  The
+    result is cached by the bytes of the description, so records of
+    the same class share it.
+
+    None is returned for class descriptions that don't name a class,
+    e.g. persistent classes referenced by oid, and pickles using
+    opcodes that ZODB doesn't write for class descriptions.
+    """
+    pos = 0
+    if data[:1] == b'\x80':  # PROTO
+        pos = 11 if data[2:3] == b'\x95' else 2  # FRAME
+    start = end = pos
+    strings = 0
+    size = len(data)
+    while pos < size:
+        op = data[pos]
+        pos += 1
+        if op == _GLOBAL:
+            end = data.find(b'\n', data.find(b'\n', pos) + 1)
+            break
+        elif op == _SHORT_BINUNICODE or op == _SHORT_BINSTRING:
+            pos += 1 + (data[pos] if pos < size else size)
+            strings += 1
+        elif op == _BINUNICODE:
+            pos += 4 + int.from_bytes(data[pos:pos + 4], 'little')
+            strings += 1
+        elif op == _STACK_GLOBAL or op == _TUPLE2 or op == _TUPLE:
+            if strings == 2:
+                end = pos
+            break
+        elif op == _BINPUT:
+            pos += 1
+        elif op == _LONG_BINPUT:
+            pos += 4
+        elif op != _MEMOIZE and op != _MARK or strings > 2:
+            break
+    if end <= start or pos > size:
+        return None
+
+    key = data[start:end]
+    result = _record_classes.get(key)
+    if result is None:
+        if len(_record_classes) >= _record_classes_max:
+            _record_classes.clear()
+        result = _record_classes[key] = _decode_record_class(key)
+    return result
+
+
+def _decode_record_class(key):
+    names = []
+    pos = 0
+    while len(names) < 2:
+        op = key[pos]
+        pos += 1
+        if op == _GLOBAL:
+            module, name = key[pos:].split(b'\n')
+            names = [module, name]
+        elif op == _SHORT_BINUNICODE or op == _SHORT_BINSTRING:
+            n = key[pos]
+            names.append(key[pos + 1:pos + 1 + n])
+            pos += 1 + n
+        elif op == _BINUNICODE:
+            n = int.from_bytes(key[pos:pos + 4], 'little')
+            names.append(key[pos + 4:pos + 4 + n])
+            pos += 4 + n
+        elif op == _BINPUT:
+            pos += 1
+        elif op == _LONG_BINPUT:
+            pos += 4
+    module, name = names
+    return module.decode(), name.decode()
+
+
 def get_pickle_metadata(data):
     # Returns a 2-tuple of strings.
 
+    result = get_record_class(data)
+    if result is not None:
+        return result
+
     # ZODB's data records contain two pickles.  The first is the class
     # of the object, the second is the object.  We're only trying to
     # pick apart the first here, to extract the module and class names.